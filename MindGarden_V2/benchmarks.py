@@ -0,0 +1,250 @@
+"""Benchmarks for the scheduler, queues, data generation and model inference.
+
+    python benchmarks.py run --out results.json
+    python benchmarks.py run --sizes 1000 100000 --only queue sm2_store
+    python benchmarks.py compare baseline.json results.json --threshold 0.1
+
+Every benchmark is timed over a sweep of sizes (number of cards or queue
+elements). Peak memory and live blocks are measured with tracemalloc in a
+separate, untimed run, since tracing slows everything down. Live blocks are
+the memory blocks still allocated when the run ends minus those before it,
+per operation; blocks allocated and freed within the run don't show up, so
+this is retained memory, not an allocation count. tracemalloc sees Python
+and NumPy allocations but not torch's own allocator, so the inference
+benchmark reports time only. Benchmarks that build one Python object per
+card stop at their own size limit unless --full is given. Everything runs
+offline on CPU.
+"""
+import argparse
+from datetime import date
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from card_store import CardStore
+from features import NUM_FEATURES
+from models import Card, CardStats, Deck, LinkedListQueue, RingQueue
+import train_setup
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+BENCHMARKS = {}
+
+
+def benchmark(name, limit=None):
+    """Registers fn(n) -> (run, ops). run() is the measured part, ops its operation count."""
+    def register(fn):
+        BENCHMARKS[name] = (fn, limit)
+        return fn
+    return register
+
+
+@benchmark("queue", limit=1_000_000)
+def bench_queue(n):
+    def run():
+        q = LinkedListQueue()
+        for i in range(n):
+            q.queue(i)
+        while not q.is_empty():
+            q.dequeue()
+    return run, 2 * n
+
+
+@benchmark("ring_queue", limit=1_000_000)
+def bench_ring_queue(n):
+    def run():
+        q = RingQueue()
+        for i in range(n):
+            q.queue(i)
+        while not q.is_empty():
+            q.dequeue()
+    return run, 2 * n
+
+
+@benchmark("ring_queue_bulk")
+def bench_ring_queue_bulk(n):
+    items = list(range(n))
+
+    def run():
+        q = RingQueue()
+        q.extend(items)
+        q.drain()
+    return run, 2 * n
+
+
+@benchmark("create_review_queue", limit=1_000_000)
+def bench_create_review_queue(n):
+    deck = Deck("bench")
+    today = date.today()
+    for i in range(n):
+        deck.get_study_deck().add_card(today.toordinal() - i % 30, Card())
+    for _ in range(deck.get_deck_stats().get_max_new()):
+        deck.add_card(Card())
+    return deck.create_review_queue, n
+
+
+@benchmark("sm2_python", limit=1_000_000)
+def bench_sm2_python(n):
+    rng = random.Random(57)
+    stats = [CardStats(Card()) for _ in range(n)]
+    difficulties = [rng.randint(1, 5) for _ in range(n)]
+
+    def run():
+        for card_stats, difficulty in zip(stats, difficulties):
+            card_stats.sm2(difficulty)
+    return run, n
+
+
+@benchmark("sm2_store")
+def bench_sm2_store(n):
+    store = CardStore(n)
+    ids = store.add_cards(n)
+    difficulties = np.random.default_rng(57).integers(1, 6, size=n)
+    return lambda: store.sm2(ids, difficulties), n
+
+
+@benchmark("generate_synthetic_data", limit=100_000)
+def bench_generate_synthetic_data(n):
+    return lambda: train_setup.generate_synthetic_data(n), n
+
+
+@benchmark("generate_synthetic_arrays", limit=1_000_000)
+def bench_generate_synthetic_arrays(n):
+    rng = np.random.default_rng(57)
+    return lambda: train_setup.generate_synthetic_arrays(n, rng=rng), n
+
+
+@benchmark("inference")
+def bench_inference(n):
+    import torch
+    from model_registry import get_registry
+
+    model = get_registry().get()
+    x = torch.rand(n, NUM_FEATURES)
+
+    def run():
+        with torch.inference_mode():
+            model(x)
+    return run, n
+
+
+def measure(fn, n, repeats=3):
+    # Timed runs: best of repeats, each with fresh setup
+    seconds = float("inf")
+    for _ in range(repeats):
+        run, ops = fn(n)
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        seconds = min(seconds, time.perf_counter() - start)
+        del run
+
+    # Traced run for memory
+    run, ops = fn(n)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    live_blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+
+    return {
+        "seconds": seconds,
+        "ns_per_op": seconds / ops * 1e9,
+        "ops_per_s": ops / seconds,
+        "peak_bytes": peak,
+        "live_blocks_per_op": live_blocks / ops,
+    }
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, only=None, full=False, repeats=3, log=print):
+    results = []
+    for name, (fn, limit) in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        for n in sizes:
+            if limit is not None and n > limit and not full:
+                log(f"{name:<26} {n:>10,}  skipped (limit {limit:,}, use --full)")
+                continue
+            result = dict(name=name, size=n, **measure(fn, n, repeats))
+            results.append(result)
+            log(f"{name:<26} {n:>10,}  {result['seconds']:>9.4f}s  {result['ns_per_op']:>10.1f} ns/op  "
+                f"peak {result['peak_bytes'] / 2**20:>9.2f} MiB  {result['live_blocks_per_op']:>6.2f} live blocks/op")
+    return results
+
+
+def compare(baseline, current, threshold=0.1):
+    """Pairs results by (name, size) and flags time or peak memory growth over threshold."""
+    old = {(r["name"], r["size"]): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        key = (result["name"], result["size"])
+        if key not in old:
+            continue
+        time_change = result["ns_per_op"] / old[key]["ns_per_op"] - 1
+        memory_change = (result["peak_bytes"] + 1) / (old[key]["peak_bytes"] + 1) - 1
+        rows.append({
+            "name": key[0],
+            "size": key[1],
+            "time_change": time_change,
+            "memory_change": memory_change,
+            "regression": time_change > threshold or memory_change > threshold,
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MindGarden benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    run_parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS))
+    run_parser.add_argument("--full", action="store_true", help="ignore per-benchmark size limits")
+    run_parser.add_argument("--repeats", type=int, default=3)
+    run_parser.add_argument("--out", default="bench_results.json")
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run_benchmarks(args.sizes, args.only, args.full, args.repeats)
+        with open(args.out, "w") as f:
+            json.dump({
+                "meta": {
+                    "python": sys.version,
+                    "platform": platform.platform(),
+                    "created": time.time(),
+                },
+                "results": results,
+            }, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.out}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold)
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"{row['name']:<26} {row['size']:>10,}  time {row['time_change']:>+7.1%}  "
+              f"memory {row['memory_change']:>+7.1%}  {flag}")
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
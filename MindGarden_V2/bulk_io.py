@@ -0,0 +1,238 @@
+"""Streaming import and export of decks as CSV, TSV or JSON lines.
+
+    python bulk_io.py import cards.csv --db mindgarden.db --deck Spanish --user 1
+    python bulk_io.py export mindgarden.db 3 spanish.jsonl
+
+Every row holds a front, a back and optionally a type ("basic" or "basic and
+reversed", the values Card.set_type takes) or a reversed flag. CSV and TSV
+files need a header row naming those columns. Input is read chunk_size rows at
+a time; each chunk is turned into cards and added to the deck with a single
+Deck.add_cards call and, with a Storage, committed with one executemany.
+"""
+import argparse
+import csv
+from itertools import islice
+import json
+from pathlib import Path
+import sys
+import time
+
+from models import Card, Deck
+
+FORMATS = ("csv", "tsv", "jsonl")
+TRUE_VALUES = ("1", "true", "yes", "y")
+
+
+def detect_format(path):
+    suffix = Path(path).suffix.lower().lstrip(".")
+    if suffix in ("jsonl", "ndjson"):
+        return "jsonl"
+    if suffix in ("tsv", "tab"):
+        return "tsv"
+    if suffix == "csv":
+        return "csv"
+    raise ValueError(f"Cannot tell the format of {path}; pass one of {FORMATS}")
+
+
+def _is_reversed(card_type, flag):
+    return (str(card_type).lower() == "basic and reversed"
+            or flag is True or str(flag).lower() in TRUE_VALUES)
+
+
+def _text(row, field, line_number):
+    value = row.get(field, "")
+    # Numbers are fine as card text ("42"); anything else is a mistake in the file
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if not isinstance(value, str):
+        raise ValueError(f"Line {line_number}: {field} must be text, got {type(value).__name__}")
+    return value
+
+
+def read_rows(f, fmt):
+    """Yields (front, back, reversed) for every row of an open text file."""
+    if fmt == "jsonl":
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {line_number}: {e}") from None
+            if not isinstance(row, dict):
+                raise ValueError(f"Line {line_number}: expected an object, got {type(row).__name__}")
+            yield (_text(row, "front", line_number), _text(row, "back", line_number),
+                   _is_reversed(row.get("type"), row.get("reversed")))
+        return
+
+    reader = csv.reader(f, dialect="excel-tab" if fmt == "tsv" else "excel")
+    header = next(reader, None)
+    if header is None or not {"front", "back"} <= set(header):
+        raise ValueError(f"Expected a header with front and back columns, got {header}")
+
+    # Column positions are looked up once; rows stay plain lists
+    front, back = header.index("front"), header.index("back")
+    card_type = header.index("type") if "type" in header else None
+    flag = header.index("reversed") if "reversed" in header else None
+    width = max(i for i in (front, back, card_type, flag) if i is not None) + 1
+    if card_type is None and flag is None:
+        for row in _checked(reader, width):
+            yield row[front], row[back], False
+        return
+    for row in _checked(reader, width):
+        yield (row[front], row[back],
+               _is_reversed(row[card_type] if card_type is not None else None,
+                            row[flag] if flag is not None else None))
+
+
+def _checked(reader, width):
+    """Rows of a csv reader with at least width columns; blank lines are skipped."""
+    for row in reader:
+        if len(row) < width:
+            if not row:
+                continue
+            raise ValueError(f"Line {reader.line_num}: expected at least {width} columns, got {len(row)}")
+        yield row
+
+
+def make_cards(rows):
+    """Builds cards (and their reversed cards) from (front, back, reversed) rows."""
+    date_added = time.time()
+    cards = []
+    for front, back, is_reversed in rows:
+        card = Card("basic", front, back, date_added)
+        if is_reversed:
+            card._reversed_card = Card("reversed", back, front, date_added)
+        cards.append(card)
+    return cards
+
+
+def _report(rows, start):
+    elapsed = time.perf_counter() - start
+    return {"rows": rows, "seconds": elapsed, "rows_per_s": rows / elapsed if elapsed else 0.0}
+
+
+def import_deck(path, deck, fmt=None, chunk_size=10_000, storage=None, user_id=None, progress=None):
+    """Appends every row of path to deck as new cards.
+
+    With a storage the deck is saved first if it has never been, then each
+    chunk is committed in its own transaction. progress, if given, is called
+    after every chunk with a dict of rows, seconds and rows_per_s so far.
+    Returns the same dict for the whole import plus the number of cards added.
+    """
+    fmt = fmt or detect_format(path)
+    if storage is not None and deck.get_id() is None:
+        storage.save_deck(deck, user_id)
+
+    start = time.perf_counter()
+    rows = 0
+    cards = 0
+    with open(path, newline="", encoding="utf-8") as f:
+        source = read_rows(f, fmt)
+        while True:
+            chunk = list(islice(source, chunk_size))
+            if not chunk:
+                break
+            added = deck.add_cards(make_cards(chunk))
+            if storage is not None:
+                storage.save_new_cards(deck, added)
+            rows += len(chunk)
+            cards += len(added)
+            if progress is not None:
+                progress(_report(rows, start))
+
+    return dict(_report(rows, start), cards=cards)
+
+
+def _deck_texts(deck):
+    for card in deck.iter_cards():
+        if card.get_type() == "reversed":
+            continue
+        yield card.get_type(), card.get_front(), card.get_back(), card.get_reversed_card() is not None
+
+
+def _write_rows(f, fmt, texts, chunk_size, start, progress):
+    writer = None
+    if fmt != "jsonl":
+        writer = csv.writer(f, dialect="excel-tab" if fmt == "tsv" else "excel")
+        writer.writerow(("front", "back", "type"))
+
+    rows = 0
+    while True:
+        chunk = list(islice(texts, chunk_size))
+        if not chunk:
+            break
+        out = [(front, back, "basic and reversed" if has_reversed else card_type)
+               for card_type, front, back, has_reversed in chunk]
+        if writer is not None:
+            writer.writerows(out)
+        else:
+            f.writelines(json.dumps({"front": front, "back": back, "type": card_type}, ensure_ascii=False) + "\n"
+                         for front, back, card_type in out)
+        rows += len(chunk)
+        if progress is not None:
+            progress(_report(rows, start))
+    return rows
+
+
+def export_deck(deck, path, fmt=None, chunk_size=10_000, progress=None):
+    """Writes deck's cards to path, one row per card, reversed cards folded into their originals.
+
+    deck is either a Deck or a (storage, deck_id) pair, which streams the cards
+    straight from the database without loading the deck.
+    """
+    fmt = fmt or detect_format(path)
+    if isinstance(deck, Deck):
+        texts = _deck_texts(deck)
+    else:
+        storage, deck_id = deck
+        texts = storage.iter_card_texts(deck_id, chunk_size)
+
+    start = time.perf_counter()
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        rows = _write_rows(f, fmt, texts, chunk_size, start, progress)
+    return _report(rows, start)
+
+
+def _print_progress(report):
+    print(f"\r{report['rows']:>12,} rows  {report['rows_per_s']:>10,.0f} rows/s", end="", file=sys.stderr)
+
+
+def main(argv=None):
+    from storage import Storage
+
+    parser = argparse.ArgumentParser(description="Import or export MindGarden decks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--db", required=True)
+    import_parser.add_argument("--deck", required=True, help="name of the new deck")
+    import_parser.add_argument("--user", type=int, default=None)
+    import_parser.add_argument("--format", choices=FORMATS)
+    import_parser.add_argument("--chunk-size", type=int, default=10_000)
+
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("db")
+    export_parser.add_argument("deck_id", type=int)
+    export_parser.add_argument("path")
+    export_parser.add_argument("--format", choices=FORMATS)
+    export_parser.add_argument("--chunk-size", type=int, default=10_000)
+
+    args = parser.parse_args(argv)
+    with Storage(args.db) as storage:
+        if args.command == "import":
+            deck = Deck(args.deck)
+            report = import_deck(args.path, deck, args.format, args.chunk_size, storage, args.user,
+                                 _print_progress)
+            print(f"\nImported {report['cards']:,} cards into deck {deck.get_id()} "
+                  f"at {report['rows_per_s']:,.0f} rows/s")
+        else:
+            report = export_deck((storage, args.deck_id), args.path, args.format, args.chunk_size,
+                                 _print_progress)
+            print(f"\nExported {report['rows']:,} cards at {report['rows_per_s']:,.0f} rows/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
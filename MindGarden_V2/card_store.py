@@ -0,0 +1,278 @@
+from datetime import date, datetime
+import time
+
+import numpy as np
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+NO_DUE = 0
+
+
+def day_ordinals(timestamps):
+    """Local calendar day (as date.toordinal()) of each unix timestamp."""
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if timestamps.size == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # One UTC offset covers the whole batch unless it straddles a DST change
+    lo = time.localtime(float(timestamps.min())).tm_gmtoff
+    hi = time.localtime(float(timestamps.max())).tm_gmtoff
+    if lo == hi:
+        offsets = lo
+    else:
+        offsets = np.array([time.localtime(t).tm_gmtoff for t in timestamps.ravel()]).reshape(timestamps.shape)
+
+    days = np.floor_divide(timestamps + offsets, 86400).astype(np.int64)
+    return days + EPOCH_ORDINAL
+
+
+def occurrence_rounds(card_ids):
+    """Splits a batch into rounds so every card id appears at most once per round.
+
+    The n-th review of a card in the batch lands in round n, which keeps
+    repeated reviews of the same card in their original order.
+    """
+    card_ids = np.asarray(card_ids)
+    n = len(card_ids)
+    order = np.argsort(card_ids, kind="stable")
+    sorted_ids = card_ids[order]
+
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = sorted_ids[1:] != sorted_ids[:-1]
+    group_start = np.maximum.accumulate(np.where(starts, np.arange(n), 0))
+    rank = np.arange(n) - group_start
+
+    if n == 0 or rank.max() == 0:
+        return [np.arange(n)]
+
+    by_rank = order[np.argsort(rank, kind="stable")]
+    return np.split(by_rank, np.cumsum(np.bincount(rank))[:-1])
+
+
+class CardStore:
+    """Struct-of-arrays storage for card stats, indexed by card id.
+
+    Holds the same fields as CardStats, one NumPy column each, so bulk jobs can
+    grade and reschedule many cards per call instead of one Python call per card.
+    """
+
+    COLUMNS = {
+        "date_added": np.float64,
+        "last_review_time": np.float64,
+        "interval": np.int64,
+        "next_due": np.int64,
+        "review_count": np.int64,
+        "difficulty_sum": np.int64,
+        "ease": np.float64,
+        "response_time_sum": np.float64,
+        "last_response_time": np.float64,
+        "very_easy_count": np.int64,
+        "success_count": np.int64,
+        "char_count": np.int64,
+        "reversed_id": np.int64,
+    }
+
+    def __init__(self, capacity=1024):
+        self._size = 0
+        self._capacity = max(int(capacity), 1)
+        for name, dtype in self.COLUMNS.items():
+            setattr(self, "_" + name, np.zeros(self._capacity, dtype=dtype))
+
+        # Text columns stay as Python objects
+        self._type = []
+        self._front = []
+        self._back = []
+        self._deck = []
+
+    def _grow(self, needed):
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        for name in self.COLUMNS:
+            old = getattr(self, "_" + name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, "_" + name, new)
+        self._capacity = capacity
+
+    def add_cards(self, count, card_type="basic"):
+        """Allocates count new cards and returns their ids."""
+        start = self._size
+        end = start + count
+        if end > self._capacity:
+            self._grow(end)
+
+        self._date_added[start:end] = time.time()
+        self._last_review_time[start:end] = 0
+        self._interval[start:end] = 1
+        self._next_due[start:end] = NO_DUE
+        self._review_count[start:end] = 0
+        self._difficulty_sum[start:end] = 0
+        self._ease[start:end] = 1.69
+        self._response_time_sum[start:end] = 0
+        self._last_response_time[start:end] = 0
+        self._very_easy_count[start:end] = 0
+        self._success_count[start:end] = 0
+        self._char_count[start:end] = 0
+        self._reversed_id[start:end] = -1
+
+        self._type.extend([card_type] * count)
+        self._front.extend([""] * count)
+        self._back.extend([""] * count)
+        self._deck.extend([None] * count)
+
+        self._size = end
+        return np.arange(start, end)
+
+    def create_card(self, card_type="basic"):
+        return Card(self, int(self.add_cards(1, card_type)[0]))
+
+    def card(self, card_id):
+        if not 0 <= card_id < self._size:
+            raise IndexError(f"No card with id {card_id}")
+        return Card(self, card_id)
+
+    def column(self, name):
+        """Read-only view of a stats column for the cards allocated so far."""
+        view = getattr(self, "_" + name)[:self._size]
+        view.flags.writeable = False
+        return view
+
+    def sm2(self, card_ids, difficulties):
+        """Same math as CardStats.sm2, applied to a batch of cards at once.
+
+        Cards repeated in the batch are processed in order, one review per round.
+        """
+        card_ids = np.asarray(card_ids, dtype=np.int64)
+        difficulties = np.asarray(difficulties, dtype=np.int64)
+        for idx in occurrence_rounds(card_ids):
+            self._sm2_unique(card_ids[idx], difficulties[idx])
+
+    def _sm2_unique(self, ids, difficulty):
+        review_count = self._review_count[ids]
+        interval = self._interval[ids]
+        ease = self._ease[ids]
+
+        scaled = np.rint(interval * ease).astype(np.int64)
+        new_interval = np.where(review_count == 0, 1, np.where(review_count == 1, 3, scaled))
+        self._interval[ids] = np.where(difficulty <= 3, new_interval, interval)
+
+        # Update ease factor
+        ease = ease + (0.1 - (difficulty - 1) * (0.08 + (difficulty - 1) * 0.02))
+        self._ease[ids] = np.maximum(0.3, ease)
+
+    def update_stats(self, card_ids, start_times, end_times, difficulties):
+        """Batch version of CardStats.update_stats."""
+        card_ids = np.asarray(card_ids, dtype=np.int64)
+        start_times = np.broadcast_to(np.asarray(start_times, dtype=np.float64), card_ids.shape)
+        end_times = np.broadcast_to(np.asarray(end_times, dtype=np.float64), card_ids.shape)
+        difficulties = np.broadcast_to(np.asarray(difficulties, dtype=np.int64), card_ids.shape)
+
+        for idx in occurrence_rounds(card_ids):
+            ids = card_ids[idx]
+            difficulty = difficulties[idx]
+            start = start_times[idx]
+
+            self._last_review_time[ids] = start
+            self._sm2_unique(ids, difficulty)
+            self._review_count[ids] += 1
+            self._difficulty_sum[ids] += difficulty
+            self._response_time_sum[ids] += end_times[idx] - start
+            self._last_response_time[ids] = end_times[idx] - start
+            self._very_easy_count[ids] += difficulty == 1
+            self._success_count[ids] += difficulty <= 3
+            self._next_due[ids] = day_ordinals(start) + self._interval[ids]
+
+    def __len__(self):
+        return self._size
+
+
+class Card:
+    """Thin facade over one CardStore row with the same API as models.Card."""
+
+    __slots__ = ("_store", "_id")
+
+    def __init__(self, store, card_id):
+        self._store = store
+        self._id = card_id
+
+    def get_id(self):
+        return self._id
+
+    def update_stats(self, start_time, end_time, difficulty):
+        self._store.update_stats([self._id], start_time, end_time, difficulty)
+
+    def set_type(self, mytype):
+        if mytype.lower() == "basic and reversed" and self._store._reversed_id[self._id] < 0:
+            reversed_card = self._store.create_card("reversed")
+            self._store._reversed_id[self._id] = reversed_card._id
+            reversed_card.set_front(self.get_back())
+            reversed_card.set_back(self.get_front())
+
+    def set_front(self, front):
+        store = self._store
+        store._front[self._id] = front
+        store._char_count[self._id] = len(str(front)) + len(str(store._back[self._id]))
+
+        if self.get_reversed_card():
+            self.get_reversed_card().set_back(front)
+
+    def set_back(self, back):
+        store = self._store
+        store._back[self._id] = back
+        store._char_count[self._id] = len(str(store._front[self._id])) + len(str(back))
+
+        if self.get_reversed_card():
+            self.get_reversed_card().set_front(back)
+
+    def set_deck(self, deck):
+        self._store._deck[self._id] = deck
+
+    def get_stats(self):
+        store = self._store
+        i = self._id
+        review_count = int(store._review_count[i])
+        reviewed = review_count > 0
+        last_review = float(store._last_review_time[i])
+
+        stats = {
+            "Date Added": datetime.fromtimestamp(store._date_added[i]).strftime("%Y-%m-%d"),
+            "Last Review Date": datetime.fromtimestamp(last_review).strftime("%Y-%m-%d"),
+            "Hours Since Last Review": round(((time.time() - last_review) / 1440), 4),
+            "Interval": int(store._interval[i]),
+            "Next Due": self.get_next_due(),
+            "Review Count": review_count,
+            "Average Difficulty": (int(store._difficulty_sum[i]) / review_count) if reviewed else None,
+            "Ease": float(store._ease[i]),
+            "Average Response Time": str(round(float(store._response_time_sum[i]) / review_count, 1) if reviewed else None) + " seconds",
+            "Success Rate (%)": ((int(store._very_easy_count[i]) / review_count) * 100) if reviewed else None,
+            "Character Count": int(store._char_count[i])
+        }
+        return stats
+
+    def get_next_due(self):
+        due = int(self._store._next_due[self._id])
+        if due == NO_DUE:
+            return None
+        return date.fromordinal(due).strftime("%Y-%m-%d")
+
+    def get_reversed_card(self):
+        reversed_id = int(self._store._reversed_id[self._id])
+        return Card(self._store, reversed_id) if reversed_id >= 0 else None
+
+    def get_front(self):
+        return self._store._front[self._id]
+
+    def get_back(self):
+        return self._store._back[self._id]
+
+    def __eq__(self, other):
+        return isinstance(other, Card) and other._store is self._store and other._id == self._id
+
+    def __hash__(self):
+        return hash((id(self._store), self._id))
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __str__(self):
+        return f"( Front: {self.get_front()} | Back: {self.get_back()} )"
@@ -0,0 +1,173 @@
+"""Periodic, atomic training checkpoints written from a background thread.
+
+    checkpointer = Checkpointer("runs/model_02", keep=3, every_steps=500)
+    with checkpointer:
+        train_loop(model, train_data, test_data, checkpointer=checkpointer, resume=True)
+    checkpointer.export_best("Flashcard_models/SmartCards_model_02.pth")
+
+A checkpoint holds the model, optimizer and RNG states plus the loop's
+position (epoch, batch and step) and history, so train_loop(resume=True)
+picks up at the exact step it was saved at. The training thread only clones
+the state to CPU; serializing and writing happen on the writer thread. Every
+file is written to a temporary name and moved into place with os.replace, so
+a crash mid-write never leaves a truncated checkpoint behind.
+"""
+import json
+import os
+from pathlib import Path
+import queue
+import random
+import shutil
+import threading
+
+import numpy as np
+import torch
+
+CHECKPOINT_PREFIX = "checkpoint-"
+BEST_NAME = "best.pt"
+BEST_INFO_NAME = "best.json"
+
+
+def _cpu_copy(obj):
+    """obj with every tensor detached and copied to the CPU, so training can keep mutating the originals."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {key: _cpu_copy(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_cpu_copy(value) for value in obj)
+    return obj
+
+
+def rng_state():
+    return {"torch": torch.get_rng_state(), "numpy": np.random.get_state(), "python": random.getstate()}
+
+
+def set_rng_state(state):
+    torch.set_rng_state(state["torch"])
+    np.random.set_state(state["numpy"])
+    random.setstate(state["python"])
+
+
+def _atomic_save(obj, path):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        torch.save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Checkpointer:
+    """Saves training state to directory, keeping the newest keep checkpoints and the best one.
+
+    every_steps, if set, also checkpoints mid-epoch every that many optimizer
+    steps; train_loop always checkpoints at the end of each epoch, and the
+    validation RMSE of the epochs it evaluates decides the best checkpoint.
+    Errors on the writer thread are raised from the next save() or close().
+    """
+
+    def __init__(self, directory, keep=3, every_steps=None, max_pending=2):
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._keep = keep
+        self._every_steps = every_steps
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = None
+        self._best = None
+        info = self._directory / BEST_INFO_NAME
+        if info.exists():
+            self._best = json.loads(info.read_text())
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="checkpointer", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        """Waits for pending writes and stops the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def is_due(self, step):
+        return self._every_steps is not None and step % self._every_steps == 0
+
+    def save(self, state, val_rmse=None):
+        """Queues state for writing; state["step"] names the file.
+
+        Blocks only if max_pending writes are already queued.
+        """
+        self._raise_error()
+        self.start()
+        self._queue.put((_cpu_copy(state), val_rmse))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._write(*item)
+            except BaseException as e:
+                self._error = e
+
+    def _write(self, state, val_rmse):
+        path = self._directory / f"{CHECKPOINT_PREFIX}{state['step']:010d}.pt"
+        _atomic_save(state, path)
+
+        if val_rmse is not None and (self._best is None or val_rmse < self._best["val_rmse"]):
+            tmp = self._directory / f"{BEST_NAME}.tmp"
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, self._directory / BEST_NAME)
+            self._best = {"step": state["step"], "epoch": state["epoch"], "val_rmse": val_rmse}
+            info_tmp = self._directory / f"{BEST_INFO_NAME}.tmp"
+            info_tmp.write_text(json.dumps(self._best))
+            os.replace(info_tmp, self._directory / BEST_INFO_NAME)
+
+        for old in self.get_checkpoints()[:-self._keep]:
+            old.unlink(missing_ok=True)
+
+    def get_checkpoints(self):
+        """Checkpoint paths, oldest step first."""
+        return sorted(self._directory.glob(f"{CHECKPOINT_PREFIX}*.pt"))
+
+    def get_best(self):
+        """{"step", "epoch", "val_rmse"} of the best checkpoint so far, or None."""
+        return self._best
+
+    def load_latest(self, map_location="cpu"):
+        """State of the newest checkpoint, or None if there is none."""
+        checkpoints = self.get_checkpoints()
+        if not checkpoints:
+            return None
+        # Checkpoints carry NumPy and Python RNG states, so they aren't weights-only
+        return torch.load(checkpoints[-1], map_location=map_location, weights_only=False)
+
+    def load_best(self, map_location="cpu"):
+        path = self._directory / BEST_NAME
+        if not path.exists():
+            return None
+        return torch.load(path, map_location=map_location, weights_only=False)
+
+    def export_best(self, path):
+        """Writes the best model's state_dict alone, in the format ModelRegistry loads."""
+        best = self.load_best()
+        if best is None:
+            raise KeyError(f"No best checkpoint in {self._directory}")
+        _atomic_save(best["model"], path)
@@ -0,0 +1,169 @@
+import time
+
+import numpy as np
+
+# Input columns of FlashcardModel, in order
+FEATURE_NAMES = (
+    "time_since_last_review",
+    "interval",
+    "review_count",
+    "average_quality",
+    "ease",
+    "last_response_time",
+    "success_rate",
+    "char_count",
+)
+NUM_FEATURES = len(FEATURE_NAMES)
+
+
+def feature_values(time_since_last_review, interval, review_count, difficulty_sum, ease,
+                   last_response_time, success_count, char_count):
+    """The model's features in FEATURE_NAMES order, from a card's running totals.
+
+    This is the one definition used for training data and for serving. It
+    works on scalars or on equal-length arrays; cards with no reviews get 0
+    for average quality and success rate.
+    """
+    reviews = review_count + (review_count == 0)
+    return (
+        time_since_last_review,
+        interval,
+        review_count,
+        (5 * review_count - difficulty_sum) / reviews,
+        ease,
+        last_response_time,
+        success_count / reviews,
+        char_count,
+    )
+
+
+def _stats_values(stats, now):
+    reviewed = stats._review_count > 0
+    return feature_values(
+        (now - stats._last_review_time) / 86400 if reviewed else 0.0,
+        stats._interval,
+        stats._review_count,
+        stats._difficulty_sum,
+        stats._ease,
+        stats._last_response_time,
+        stats._success_count,
+        stats._char_count,
+    )
+
+
+def card_features(card, now=None):
+    """Feature vector of one models.Card, computed from its CardStats."""
+    now = time.time() if now is None else now
+    return list(_stats_values(card._stats, now))
+
+
+def feature_matrix(cards, now=None):
+    """(len(cards), NUM_FEATURES) float32 matrix for a sequence of cards."""
+    now = time.time() if now is None else now
+    matrix = np.array([card_features(card, now) for card in cards], dtype=np.float32)
+    return matrix.reshape(-1, NUM_FEATURES)
+
+
+class FeatureStore:
+    """Feature rows for many cards in one contiguous float32 array.
+
+    Each card gets a fixed row when added. update(card) rewrites that row in
+    place after a review, so the matrix is always current and tensor() can
+    hand the model a torch.from_numpy view of it without copying or building
+    per-card tensors. time_since_last_review depends on the clock, so it is
+    recomputed from stored review timestamps, vectorized, for the rows being
+    read.
+    """
+
+    def __init__(self, capacity=1024):
+        self._matrix = np.zeros((max(int(capacity), 1), NUM_FEATURES), dtype=np.float32)
+        self._last_review = np.zeros(len(self._matrix), dtype=np.float64)
+        self._rows = {}
+        self._cards = []
+
+    def _grow(self, needed):
+        capacity = len(self._matrix)
+        while capacity < needed:
+            capacity *= 2
+        matrix = np.zeros((capacity, NUM_FEATURES), dtype=np.float32)
+        matrix[:len(self._cards)] = self._matrix[:len(self._cards)]
+        last_review = np.zeros(capacity, dtype=np.float64)
+        last_review[:len(self._cards)] = self._last_review[:len(self._cards)]
+        self._matrix, self._last_review = matrix, last_review
+
+    def add(self, card):
+        """Gives card a row (if it has none yet) and returns it."""
+        row = self._rows.get(card)
+        if row is not None:
+            return row
+        row = len(self._cards)
+        if row >= len(self._matrix):
+            self._grow(row + 1)
+        self._rows[card] = row
+        self._cards.append(card)
+        self._write(row, card)
+        return row
+
+    def add_cards(self, cards):
+        return np.fromiter((self.add(card) for card in cards), dtype=np.int64)
+
+    def _write(self, row, card):
+        stats = card._stats
+        self._last_review[row] = stats._last_review_time if stats._review_count > 0 else np.nan
+        self._matrix[row] = _stats_values(stats, stats._last_review_time)
+
+    def update(self, card):
+        """Refreshes card's row from its stats, e.g. right after a review."""
+        row = self._rows.get(card)
+        if row is None:
+            return self.add(card)
+        self._write(row, card)
+        return row
+
+    def get_row(self, card):
+        return self._rows[card]
+
+    def rows(self, cards):
+        return np.fromiter((self._rows[card] for card in cards), dtype=np.int64)
+
+    def get_card(self, row):
+        return self._cards[row]
+
+    def __len__(self):
+        return len(self._cards)
+
+    def __contains__(self, card):
+        return card in self._rows
+
+    def _refresh(self, rows, now):
+        since = (now - self._last_review[rows]) / 86400
+        # Never-reviewed cards keep 0
+        self._matrix[rows, 0] = np.nan_to_num(since, nan=0.0)
+
+    def matrix(self, now=None):
+        """(len(self), NUM_FEATURES) view of the feature rows, current as of now."""
+        rows = slice(0, len(self._cards))
+        self._refresh(rows, time.time() if now is None else now)
+        return self._matrix[rows]
+
+    def tensor(self, rows=None, now=None):
+        """Feature rows as a float32 torch tensor, current as of now.
+
+        With rows=None or a slice the tensor is a view of this store's memory;
+        an index array gathers those rows into one new tensor. Only the rows
+        returned are refreshed.
+        """
+        import torch
+
+        now = time.time() if now is None else now
+        size = len(self._cards)
+        if rows is None or isinstance(rows, slice):
+            rows = slice(*(rows or slice(None)).indices(size))
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+        self._refresh(rows, now)
+
+        matrix = torch.from_numpy(self._matrix[:size])
+        if isinstance(rows, slice):
+            return matrix[rows]
+        return matrix.index_select(0, torch.from_numpy(rows))
@@ -0,0 +1,229 @@
+from datetime import date
+
+import numpy as np
+
+from models import to_day_ordinal
+
+NEW_EASE = 1.69
+DEFAULT_GRADE = 2
+# Grades the scheduler takes; 4 and 5 are lapses
+MIN_GRADE, MAX_GRADE = 1, 5
+
+
+def schedule_arrays(due, interval, ease, review_count, grade=None):
+    """Bundles per-card scheduling state into the arrays forecast() works on.
+
+    due holds day ordinals. grade is each card's assumed grade when no grade
+    distribution is given to forecast(); it defaults to DEFAULT_GRADE and
+    must be between 1 and 5.
+    """
+    due = np.asarray(due, dtype=np.int64)
+    if grade is None:
+        grade = np.full(len(due), DEFAULT_GRADE, dtype=np.int64)
+    grade = np.asarray(grade, dtype=np.int64)
+    if len(grade) and (grade.min() < MIN_GRADE or grade.max() > MAX_GRADE):
+        raise ValueError(f"Grades must be between {MIN_GRADE} and {MAX_GRADE}")
+    return {
+        "due": due,
+        "interval": np.asarray(interval, dtype=np.int64),
+        "ease": np.asarray(ease, dtype=np.float64),
+        "review_count": np.asarray(review_count, dtype=np.int64),
+        "grade": grade,
+    }
+
+
+def _history_grade(difficulty_sum, review_count):
+    # Each card is assumed to keep its average grade; 4 and 5 only requeue,
+    # so the grade that finally reschedules a card is at most 3
+    difficulty_sum = np.asarray(difficulty_sum, dtype=np.float64)
+    review_count = np.asarray(review_count, dtype=np.int64)
+    average = np.divide(difficulty_sum, review_count, out=np.full(len(review_count), float(DEFAULT_GRADE)),
+                        where=review_count > 0)
+    return np.clip(np.rint(average), 1, 3).astype(np.int64)
+
+
+def deck_schedule(deck):
+    """Scheduling arrays for the cards waiting in a models.Deck's study deck."""
+    items = list(deck.get_study_deck().items())
+    stats = [card._stats for card, _ in items]
+    n = len(items)
+    review_count = np.fromiter((s._review_count for s in stats), dtype=np.int64, count=n)
+    return schedule_arrays(
+        np.fromiter((day for _, day in items), dtype=np.int64, count=n),
+        np.fromiter((s._interval for s in stats), dtype=np.int64, count=n),
+        np.fromiter((s._ease for s in stats), dtype=np.float64, count=n),
+        review_count,
+        _history_grade(np.fromiter((s._difficulty_sum for s in stats), dtype=np.float64, count=n), review_count),
+    )
+
+
+def store_schedule(store, card_ids=None):
+    """Scheduling arrays for scheduled cards of a CardStore (all of them by default)."""
+    due = store.column("next_due")
+    if card_ids is None:
+        card_ids = np.flatnonzero(due)
+    card_ids = np.asarray(card_ids, dtype=np.int64)
+    review_count = store.column("review_count")[card_ids]
+    return schedule_arrays(
+        due[card_ids],
+        store.column("interval")[card_ids],
+        store.column("ease")[card_ids],
+        review_count,
+        _history_grade(store.column("difficulty_sum")[card_ids], review_count),
+    )
+
+
+def storage_schedule(storage, deck_id, horizon):
+    """Scheduling arrays read from Storage for cards due on or before horizon."""
+    rows = storage.load_schedule(deck_id, horizon)
+    if not rows:
+        return schedule_arrays([], [], [], [])
+    _, due, interval, ease, review_count = zip(*rows)
+    return schedule_arrays(due, interval, ease, review_count)
+
+
+def _add_new_cards(schedule, start, new_cards, max_new):
+    if new_cards <= 0 or max_new <= 0:
+        return schedule
+    due = start + np.arange(new_cards, dtype=np.int64) // max_new
+    return {
+        "due": np.concatenate([schedule["due"], due]),
+        "interval": np.concatenate([schedule["interval"], np.ones(new_cards, dtype=np.int64)]),
+        "ease": np.concatenate([schedule["ease"], np.full(new_cards, NEW_EASE)]),
+        "review_count": np.concatenate([schedule["review_count"], np.zeros(new_cards, dtype=np.int64)]),
+        "grade": np.concatenate([schedule["grade"], np.full(new_cards, DEFAULT_GRADE, dtype=np.int64)]),
+    }
+
+
+def _add_periodic(periodic, due, period, start, days):
+    for p in np.unique(period):
+        offsets = np.bincount(due[period == p] - start, minlength=days)
+        periodic[p] = periodic.get(p, 0) + offsets
+
+
+def _repeat_every(offsets, period, days):
+    # offsets[j] cards first due on day j, then every period days after
+    padded = np.zeros(-(-days // period) * period, dtype=np.int64)
+    padded[:days] = offsets
+    return np.cumsum(padded.reshape(-1, period), axis=0).ravel()[:days]
+
+
+def forecast(schedule, days=30, start=None, grade_probs=None, new_cards=0, max_new=3, seed=57):
+    """Projected number of reviews on each of the next days days.
+
+    Every card is stepped through its future reviews with the CardStats.sm2
+    math, all cards at once: each pass takes the next review of every card
+    still inside the horizon, counts it on its day and reschedules it. Cards
+    already overdue are counted on the first day. new_cards not yet studied
+    are introduced max_new a day, like create_review_queue does.
+
+    grade_probs, if given, is the probability of grades 1-5 and grades are
+    drawn at random (seeded). Otherwise each card gets its own assumed grade
+    from schedule["grade"]. A 4 or 5 keeps the card's schedule, as in
+    Deck.grade_card, and the card is reviewed again the next day, so every
+    card moves forward on every pass.
+
+    Returns an int64 array of length days; index 0 is start (default today).
+    """
+    start = to_day_ordinal(start if start is not None else date.today())
+    end = start + days
+    schedule = _add_new_cards(schedule, start, new_cards, max_new)
+
+    due = np.maximum(schedule["due"], start)
+    inside = due < end
+    due = due[inside]
+    interval = schedule["interval"][inside]
+    ease = schedule["ease"][inside]
+    review_count = schedule["review_count"][inside]
+    grade = schedule["grade"][inside]
+
+    if grade_probs is not None:
+        grade_probs = np.asarray(grade_probs, dtype=np.float64)
+        if grade_probs.shape != (MAX_GRADE,) or (grade_probs < 0).any() or grade_probs.sum() <= 0:
+            raise ValueError(f"grade_probs must be {MAX_GRADE} non-negative probabilities, not all zero")
+        # Grades are drawn through a lookup table, probabilities rounded to 1/65536
+        cumulative = np.cumsum(grade_probs)
+        grade_table = np.searchsorted(cumulative / cumulative[-1], (np.arange(65536) + 0.5) / 65536) + 1
+        rng = np.random.default_rng(seed)
+
+    counts = np.zeros(days, dtype=np.int64)
+    periodic = {}
+    while len(due):
+        counts += np.bincount(due - start, minlength=days)
+
+        if grade_probs is not None:
+            grade = grade_table[rng.integers(0, 65536, size=len(due), dtype=np.uint16)]
+        graded = grade <= 3
+
+        scaled = np.rint(interval * ease).astype(np.int64)
+        new_interval = np.where(graded, np.where(review_count == 0, 1, np.where(review_count == 1, 3, scaled)),
+                                interval)
+        new_ease = np.where(graded, np.maximum(0.3, ease + (0.1 - (grade - 1) * (0.08 + (grade - 1) * 0.02))),
+                            ease)
+        if grade_probs is None:
+            # With a fixed grade, a card whose interval and ease stop changing
+            # repeats every step days from here on
+            settled = ((review_count >= 2) | ~graded) & (new_interval == interval) & (np.abs(new_ease - ease) < 1e-9)
+        interval = new_interval
+        ease = new_ease
+        review_count = review_count + graded
+        # A zero interval would be due again the same day; the deck files it for the next.
+        # A lapse is retried until it passes, counted here as one review a day.
+        step = np.where(graded, np.maximum(interval, 1), 1)
+        due = due + step
+
+        inside = due < end
+        if grade_probs is None and settled.any():
+            _add_periodic(periodic, due[settled & inside], step[settled & inside], start, days)
+            inside &= ~settled
+        if not inside.all():
+            due, interval, ease, review_count = due[inside], interval[inside], ease[inside], review_count[inside]
+            if grade_probs is None:
+                grade = grade[inside]
+
+    for period, offsets in periodic.items():
+        counts += _repeat_every(offsets, period, days)
+    return counts
+
+
+def forecast_deck(deck, days=30, start=None, grade_probs=None, include_new=True, seed=57):
+    new_cards = len(deck.get_new_cards_deck().get_deck()) if include_new else 0
+    return forecast(deck_schedule(deck), days, start, grade_probs, new_cards,
+                    deck.get_deck_stats().get_max_new(), seed)
+
+
+def forecast_user(user, days=30, start=None, grade_probs=None, include_new=True, seed=57):
+    """Per-deck forecasts keyed by deck name, plus their sum under "total"."""
+    result = {}
+    total = np.zeros(days, dtype=np.int64)
+    for deck in user.iter_decks():
+        counts = forecast_deck(deck, days, start, grade_probs, include_new, seed)
+        result[deck.get_name()] = counts
+        total += counts
+    result["total"] = total
+    return result
+
+
+if __name__ == "__main__":
+    import time
+
+    from card_store import CardStore
+
+    n = 1_000_000
+    today = date.today().toordinal()
+    rng = np.random.default_rng(57)
+    store = CardStore(n)
+    ids = store.add_cards(n)
+    for _ in range(3):
+        store.update_stats(ids, time.time() - rng.integers(0, 30 * 86400, size=n), time.time(),
+                           rng.integers(1, 4, size=n))
+
+    schedule = store_schedule(store)
+    for days in (30, 365):
+        for probs in (None, (0.3, 0.4, 0.2, 0.1, 0.0)):
+            begin = time.perf_counter()
+            counts = forecast(schedule, days, today, probs)
+            elapsed = time.perf_counter() - begin
+            label = "history" if probs is None else "sampled"
+            print(f"{n:,} cards  {days:>3} days  {label:<8} {elapsed:.3f}s  "
+                  f"{counts.sum():,} reviews, peak {counts.max():,}/day")
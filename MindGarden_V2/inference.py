@@ -0,0 +1,229 @@
+from concurrent.futures import Future
+import copy
+import queue
+import threading
+import time
+import warnings
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from features import NUM_FEATURES, feature_matrix
+from model_registry import get_registry
+from torch_model import FlashcardModel
+
+VARIANTS = ("eager", "torchscript", "quantized")
+
+
+def prepare_model(model, variant="eager"):
+    """Returns an inference-only version of model for the given variant.
+
+    An eager model already in eval mode with gradients off, like the
+    registry's shared models, is used as is so its weights stay shared;
+    any other model is copied first. "torchscript" scripts and freezes the
+    model, "quantized" swaps every nn.Linear for a dynamic int8 one.
+    """
+    if variant == "eager" and not model.training and not any(p.requires_grad for p in model.parameters()):
+        return model
+    model = copy.deepcopy(model).eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+
+    # The jit and ao.quantization APIs warn about deprecation but are still
+    # the CPU path for this model
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", (DeprecationWarning, FutureWarning, UserWarning))
+        if variant == "eager":
+            return model
+        if variant == "torchscript":
+            return torch.jit.freeze(torch.jit.script(model))
+        if variant == "quantized":
+            return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    raise ValueError(f"Unknown variant {variant!r}, expected one of {VARIANTS}")
+
+
+class InferenceEngine:
+    """Serves FlashcardModel interval predictions in micro-batches.
+
+    Requests from any thread are queued and a single worker thread groups them
+    into batches of at most max_batch_size, waiting no longer than max_wait_ms
+    after the first request of a batch, then runs one inference_mode forward
+    pass per batch.
+
+    Without a model the engine serves the registry's active version and
+    picks up a ModelRegistry.activate() swap on its next forward pass.
+
+    Once stopped, submit() raises RuntimeError until start() is called again,
+    and requests still queued when the worker exits fail with RuntimeError.
+    """
+
+    def __init__(self, model=None, variant="eager", max_batch_size=256, max_wait_ms=2.0):
+        self._registry = get_registry() if model is None else None
+        # (version, prepared model), replaced as one object so readers on any thread see a matching pair
+        self._prepared = (None, prepare_model(model, variant) if model is not None else None)
+        self._variant = variant
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000
+        self._pending = queue.Queue()
+        self._worker = None
+        self._running = False
+        # Guards _stopped, so no request is queued after stop() drains the queue
+        self._lock = threading.Lock()
+        self._stopped = False
+
+    def start(self):
+        with self._lock:
+            self._stopped = False
+        if self._worker is None:
+            self._running = True
+            self._worker = threading.Thread(target=self._serve, name="inference-batcher", daemon=True)
+            self._worker.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+        if self._worker is not None:
+            self._running = False
+            self._pending.put(None)
+            self._worker.join()
+            self._worker = None
+        # Requests queued on an engine that was never started
+        self._fail_pending()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _get_model(self):
+        if self._registry is None:
+            return self._prepared[1]
+        version = self._registry.get_active_version()
+        prepared_version, model = self._prepared
+        if model is None or version != prepared_version:
+            model = prepare_model(self._registry.get(version), self._variant)
+            self._prepared = (version, model)
+        return model
+
+    def get_version(self):
+        """Registry version served by the last forward pass, or None for a model passed in."""
+        return self._prepared[0]
+
+    def submit(self, features):
+        """Queues one feature vector. Returns a Future with the predicted interval."""
+        future = Future()
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("InferenceEngine is stopped")
+            self._pending.put((np.asarray(features, dtype=np.float32), future))
+        return future
+
+    def predict(self, features):
+        return self.submit(features).result()
+
+    def predict_batch(self, matrix):
+        """Runs matrix of shape (n, NUM_FEATURES) through the model directly."""
+        x = torch.from_numpy(np.ascontiguousarray(matrix, dtype=np.float32)).reshape(-1, NUM_FEATURES)
+        with torch.inference_mode():
+            return self._get_model()(x).reshape(-1).numpy()
+
+    def predict_deck(self, deck, now=None):
+        """Scores every card in deck in one forward pass. Returns {card: interval}."""
+        cards = list(deck.iter_cards())
+        if not cards:
+            return {}
+
+        feature_store = deck.get_feature_store()
+        if feature_store is None:
+            predictions = self.predict_batch(feature_matrix(cards, now))
+        else:
+            with torch.inference_mode():
+                x = feature_store.tensor(feature_store.rows(cards), now)
+                predictions = self._get_model()(x).reshape(-1).numpy()
+        return dict(zip(cards, predictions.tolist()))
+
+    def _serve(self):
+        try:
+            while self._running:
+                item = self._pending.get()
+                if item is None:
+                    continue
+                batch = [item]
+                deadline = time.perf_counter() + self._max_wait
+
+                while len(batch) < self._max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._pending.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        break
+                    batch.append(item)
+
+                self._run_batch(batch)
+        finally:
+            self._fail_pending()
+
+    def _fail_pending(self):
+        while True:
+            try:
+                item = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                item[1].set_exception(RuntimeError("InferenceEngine stopped before serving the request"))
+
+    def _run_batch(self, batch):
+        try:
+            predictions = self.predict_batch(np.stack([features for features, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), prediction in zip(batch, predictions.tolist()):
+            future.set_result(prediction)
+
+
+def benchmark(model=None, variants=VARIANTS, max_batch=65536, repeats=50):
+    """p50/p99 latency and throughput of one forward pass per batch size.
+
+    Batch sizes double from 1 up to max_batch. Returns a list of result dicts.
+    """
+    model = model if model is not None else FlashcardModel()
+    results = []
+    for variant in variants:
+        engine = InferenceEngine(model, variant)
+        batch_size = 1
+        while batch_size <= max_batch:
+            x = np.random.rand(batch_size, NUM_FEATURES).astype(np.float32)
+            engine.predict_batch(x)
+
+            runs = max(5, min(repeats, int(2e6 // batch_size)))
+            latencies = np.empty(runs)
+            for i in range(runs):
+                start = time.perf_counter()
+                engine.predict_batch(x)
+                latencies[i] = time.perf_counter() - start
+
+            results.append({
+                "variant": variant,
+                "batch_size": batch_size,
+                "p50_ms": float(np.percentile(latencies, 50) * 1000),
+                "p99_ms": float(np.percentile(latencies, 99) * 1000),
+                "rows_per_s": float(batch_size / np.median(latencies)),
+            })
+            batch_size *= 2
+    return results
+
+
+if __name__ == "__main__":
+    torch.set_num_threads(1)
+    print(f"{'variant':<12} {'batch':>6} {'p50 ms':>9} {'p99 ms':>9} {'rows/s':>12}")
+    for row in benchmark(get_registry().get()):
+        print(f"{row['variant']:<12} {row['batch_size']:>6} {row['p50_ms']:>9.3f} {row['p99_ms']:>9.3f} {row['rows_per_s']:>12,.0f}")
@@ -0,0 +1,272 @@
+"""Counters, histograms and timers for the scheduling and model paths.
+
+Instrumented code checks metrics.enabled before doing anything, so with
+metrics off (the default) a hook costs one attribute lookup. Turn them on
+with metrics.enable() or by setting MINDGARDEN_METRICS=1, then export with
+metrics.write_json(path) or metrics.write_prometheus(path).
+
+SamplingProfiler records the stacks of a running thread at a fixed interval
+and writes them in the folded format read by flamegraph.pl and speedscope:
+
+    with SamplingProfiler("study.folded"):
+        deck.study()
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# Upper bounds in seconds, 10us to 60s
+DEFAULT_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+
+class Counter:
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def get(self):
+        return self._value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with Prometheus semantics (value <= bound)."""
+
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self._bounds = tuple(sorted(buckets))
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def get(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = []
+        running = 0
+        for bound, n in zip(self._bounds + (float("inf"),), counts):
+            running += n
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "sum": total, "count": count}
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """Process-wide registry of named counters and histograms."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def _get(self, cls, name, help, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, cls(name, help, **kwargs))
+        if not isinstance(metric, cls):
+            raise TypeError(f"{name} is already registered as a {type(metric).__name__}")
+        return metric
+
+    def counter(self, name, help=""):
+        return self._get(Counter, name, help)
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def inc(self, name, amount=1):
+        if self.enabled:
+            self.counter(name).inc(amount)
+
+    def observe(self, name, value):
+        if self.enabled:
+            self.histogram(name).observe(value)
+
+    def timer(self, name):
+        """Context manager recording its duration into the histogram name, if enabled."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self.histogram(name))
+
+    def timed(self, name):
+        """Decorator version of timer()."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Timer(self.histogram(name)):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def snapshot(self):
+        """Current values as plain data: counters as ints, histograms as dicts."""
+        snapshot = {"created": time.time(), "counters": {}, "histograms": {}}
+        for name, metric in sorted(self._metrics.items()):
+            if isinstance(metric, Counter):
+                snapshot["counters"][name] = metric.get()
+            else:
+                data = metric.get()
+                data["buckets"] = [["+Inf" if bound == float("inf") else bound, n] for bound, n in data["buckets"]]
+                snapshot["histograms"][name] = data
+        return snapshot
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def prometheus_text(self):
+        """Metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            if metric.help:
+                lines.append(f"# HELP {name} {metric.help}")
+            if isinstance(metric, Counter):
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {metric.get()}")
+                continue
+
+            data = metric.get()
+            lines.append(f"# TYPE {name} histogram")
+            for bound, n in data["buckets"]:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{le="{le}"}} {n}')
+            lines.append(f"{name}_sum {data['sum']!r}")
+            lines.append(f"{name}_count {data['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Writes prometheus_text() atomically, e.g. for node_exporter's textfile collector."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+
+metrics = Metrics(enabled=os.environ.get("MINDGARDEN_METRICS", "") not in ("", "0"))
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every interval seconds from a background thread.
+
+    Stacks are counted in memory and written to path in folded format
+    ("outer;inner;leaf count" per line) when the profiler stops. Only the
+    sampler thread does work, so the profiled code runs unmodified.
+    """
+
+    def __init__(self, path, interval=0.005, thread_id=None):
+        self._path = path
+        self._interval = interval
+        self._thread_id = thread_id
+        self._stacks = {}
+        self._samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread_id is None:
+            self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.write(self._path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self._stacks[key] = self._stacks.get(key, 0) + 1
+            self._samples += 1
+
+    def get_sample_count(self):
+        return self._samples
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in sorted(self._stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profile(path=None, interval=0.005):
+    """Samples the calling thread into path if given, otherwise does nothing."""
+    if path is None:
+        yield None
+        return
+    with SamplingProfiler(path, interval) as profiler:
+        yield profiler
@@ -0,0 +1,140 @@
+from pathlib import Path
+import threading
+import time
+
+import torch
+
+from instrumentation import metrics
+from torch_model import MODEL_DIR, FlashcardModel
+
+CHECKPOINT_PREFIX = "SmartCards_model_"
+
+
+class ModelRegistry:
+    """Loads each versioned checkpoint once and hands out shared models.
+
+    Checkpoints are read with torch.load(mmap=True) and loaded with
+    assign=True, so the model's weights stay backed by the file mapping: every
+    process that loads the same version shares the same physical pages, and a
+    model loaded before a fork is shared copy-on-write with the workers.
+    Shared models are in eval mode with gradients off and must be treated as
+    read-only; use new_model() for a private trainable copy.
+
+    activate() loads and warms up a version before swapping it in under the
+    lock, so get() always returns either the old or the new model, never a
+    half-loaded one.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, model_factory=FlashcardModel):
+        self._model_dir = Path(model_dir)
+        self._model_factory = model_factory
+        self._lock = threading.RLock()
+        self._paths = {}
+        self._models = {}
+        self._active = None
+        self._stats = {"loads": 0, "load_time_s": 0.0, "hits": 0, "misses": 0, "swaps": 0}
+        self.discover()
+
+    def discover(self):
+        """Registers every SmartCards_model_<version>.pth in the model directory."""
+        for path in sorted(self._model_dir.glob(f"{CHECKPOINT_PREFIX}*.pth")):
+            self._paths.setdefault(path.stem[len(CHECKPOINT_PREFIX):], path)
+
+    def register(self, version, path):
+        self._paths[version] = Path(path)
+
+    def get_versions(self):
+        return sorted(self._paths)
+
+    def _load(self, version):
+        if version not in self._paths:
+            raise KeyError(f"Unknown model version {version!r}")
+
+        start = time.perf_counter()
+        state_dict = torch.load(self._paths[version], mmap=True, weights_only=True, map_location="cpu")
+        model = self._model_factory()
+        model.load_state_dict(state_dict, assign=True)
+        model.eval()
+        for param in model.parameters():
+            param.requires_grad_(False)
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._stats["loads"] += 1
+            self._stats["load_time_s"] += elapsed
+        metrics.observe("model_load_seconds", elapsed)
+        return model
+
+    def get(self, version=None):
+        """Shared read-only model for version, or the active version."""
+        with self._lock:
+            version = self._active if version is None else version
+            if version is None:
+                raise LookupError("No active model version; call activate() first")
+
+            model = self._models.get(version)
+            if model is not None:
+                self._stats["hits"] += 1
+                return model
+
+            self._stats["misses"] += 1
+            model = self._load(version)
+            self._models[version] = model
+            return model
+
+    def new_model(self, version=None):
+        """Fresh trainable model initialised from the cached weights."""
+        model = self._model_factory()
+        model.load_state_dict(self.get(version).state_dict())
+        return model
+
+    def warm_up(self, version=None, batch_size=256):
+        model = self.get(version)
+        with torch.inference_mode():
+            model(torch.zeros(batch_size, model.layers[0].in_features))
+        return model
+
+    def activate(self, version, warm_up=True):
+        """Makes version the active model without blocking readers while it loads."""
+        if version not in self._models:
+            model = self._load(version)
+            with self._lock:
+                self._models.setdefault(version, model)
+        if warm_up:
+            self.warm_up(version)
+
+        with self._lock:
+            previous = self._active
+            self._active = version
+            if previous is not None and previous != version:
+                self._stats["swaps"] += 1
+        return previous
+
+    def unload(self, version):
+        with self._lock:
+            if version == self._active:
+                raise ValueError("Cannot unload the active model version")
+            self._models.pop(version, None)
+
+    def get_active_version(self):
+        return self._active
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, resident=sorted(self._models), active=self._active)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Process-wide registry, created on first use with version "01" active."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            registry = ModelRegistry()
+            if "01" in registry.get_versions():
+                registry.activate("01", warm_up=False)
+            _registry = registry
+    return _registry
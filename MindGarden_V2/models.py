@@ -1,9 +1,32 @@
-from datetime import datetime, timedelta
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
 import sqlite3
 import time
 
+from instrumentation import metrics, profile
+from rollups import StatsRollup
+
 GLOBAL_EASE = 1
 
+
+def to_day_ordinal(day):
+    """Converts a "%Y-%m-%d" string, date/datetime or ordinal to a day ordinal."""
+    if isinstance(day, str):
+        return date.fromisoformat(day).toordinal()
+    if isinstance(day, datetime):
+        return day.date().toordinal()
+    if isinstance(day, date):
+        return day.toordinal()
+    return int(day)
+
+
+def order_by_ids(cards, ids):
+    """cards in the order of ids; cards not in ids follow in their own order."""
+    position = {card_id: i for i, card_id in enumerate(ids.tolist())}
+    end = len(position)
+    return sorted(cards, key=lambda card: position.get(card.get_id(), end))
+
 class LinkedListQueue:
     def __init__(self):
         self._head = None
@@ -42,6 +65,13 @@ class LinkedListQueue:
     def __len__(self):
         return self._length
 
+    def __iter__(self):
+        # Oldest first, i.e. the order dequeue() would return them
+        cur = self._tail
+        while cur != None:
+            yield cur._data
+            cur = cur._prev
+
     def __repr__(self):
         return self.__str__()
 
@@ -58,6 +88,100 @@ class LinkedListQueue:
                 cur = cur._next
             return mystring
 
+class RingQueue:
+    """FIFO queue backed by a growable ring buffer, with the LinkedListQueue API.
+
+    Elements live in one Python list instead of one Node per element, and
+    the buffer doubles when full. extend() and drain() move many elements per
+    call, and iterating does not consume the queue.
+    """
+    __slots__ = ("_buffer", "_head", "_length")
+
+    def __init__(self, items=None, capacity=8):
+        self._buffer = [None] * max(capacity, 1)
+        self._head = 0
+        self._length = 0
+        if items is not None:
+            self.extend(items)
+
+    def _grow(self, needed):
+        capacity = len(self._buffer)
+        while capacity < needed:
+            capacity *= 2
+        items = list(self)
+        self._buffer = items + [None] * (capacity - len(items))
+        self._head = 0
+
+    def queue(self, data):
+        if self._length == len(self._buffer):
+            self._grow(self._length + 1)
+        self._buffer[(self._head + self._length) % len(self._buffer)] = data
+        self._length += 1
+
+    def extend(self, items):
+        items = list(items)
+        if self._length + len(items) > len(self._buffer):
+            self._grow(self._length + len(items))
+
+        capacity = len(self._buffer)
+        start = (self._head + self._length) % capacity
+        first = min(len(items), capacity - start)
+        self._buffer[start:start + first] = items[:first]
+        self._buffer[:len(items) - first] = items[first:]
+        self._length += len(items)
+
+    def dequeue(self):
+        if not self._length:
+            return None
+        data = self._buffer[self._head]
+        self._buffer[self._head] = None
+        self._head = (self._head + 1) % len(self._buffer)
+        self._length -= 1
+        return data
+
+    def peek(self):
+        """The element dequeue() would return next, left in place, or None."""
+        return self._buffer[self._head] if self._length else None
+
+    def drain(self, n=None):
+        """Dequeues up to n elements (all if n is None) and returns them oldest first."""
+        n = self._length if n is None else min(n, self._length)
+        capacity = len(self._buffer)
+        end = self._head + n
+        if end <= capacity:
+            items = self._buffer[self._head:end]
+            self._buffer[self._head:end] = [None] * n
+        else:
+            items = self._buffer[self._head:] + self._buffer[:end - capacity]
+            self._buffer[self._head:] = [None] * (capacity - self._head)
+            self._buffer[:end - capacity] = [None] * (end - capacity)
+        self._head = end % capacity
+        self._length -= n
+        return items
+
+    def is_empty(self):
+        return self._length == 0
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        # Oldest first, i.e. the order dequeue() would return them
+        capacity = len(self._buffer)
+        end = self._head + self._length
+        if end <= capacity:
+            return iter(self._buffer[self._head:end])
+        return iter(self._buffer[self._head:] + self._buffer[:end - capacity])
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __str__(self):
+        if not self._length:
+            return "Empty LL!"
+        # Newest first, like LinkedListQueue
+        return " -> ".join(str(data) for data in reversed(list(self)))
+
 class Node:
     def __init__(self, data):
         self._data = data
@@ -75,29 +199,172 @@ class Node:
 
 class User:
     def __init__(self):
+        self._id = None
         self._name = ""
         self._join_date = datetime.now()
+        # Deck name -> DeckHandle; _loaded holds the loaded ones, least recently used first
         self._deck_collection = {}
-        self._stats = UserStats()
+        self._loaded = OrderedDict()
+        # Deck name -> pin count; pinned decks are never evicted
+        self._pinned = {}
+        self._stats = UserStats(self)
+        self._storage = None
+        self._max_decks = None
+        self._max_cards = None
     
     def add_deck(self, deck):
         if not deck.get_name() in self._deck_collection:
-            self._deck_collection[deck.get_name()] = deck
-            self._stats.add_deck_stats(deck)
+            self.add_deck_handle(DeckHandle(deck.get_name(), deck=deck, storage=self._storage))
         else:
             print("A deck with that name already exists! Try another name.")
 
+    def add_deck_handle(self, handle):
+        """Adds a deck that may not be loaded yet, e.g. from Storage.load_user(lazy=True)."""
+        self._deck_collection[handle.get_name()] = handle
+        self._stats.add_deck_stats(handle)
+        if handle.is_loaded():
+            self._touch(handle.get_name())
+
+    def get_deck(self, name):
+        """The named Deck, loading it if needed. May evict the least recently used decks."""
+        deck = self._deck_collection[name].load()
+        self._touch(name)
+        return deck
+
+    def get_deck_handle(self, name):
+        return self._deck_collection[name]
+
+    def get_deck_names(self):
+        return list(self._deck_collection)
+
+    def iter_decks(self):
+        """Yields every deck, loading each in turn.
+
+        A deck is pinned until the next one is asked for, so a deck budget can
+        evict decks already passed but never the one in hand.
+        """
+        for name in list(self._deck_collection):
+            deck = self.pin_deck(name)
+            try:
+                yield deck
+            finally:
+                self.unpin_deck(name)
+
+    def iter_deck_handles(self):
+        """Yields every DeckHandle without loading any deck."""
+        return iter(list(self._deck_collection.values()))
+
+    def pin_deck(self, name):
+        """Loads the named deck and keeps it loaded until unpin_deck. Pins nest.
+
+        Pinned decks still count towards the budget, which may be exceeded
+        while they are in use.
+        """
+        self._pinned[name] = self._pinned.get(name, 0) + 1
+        return self.get_deck(name)
+
+    def unpin_deck(self, name):
+        if self._pinned[name] == 1:
+            del self._pinned[name]
+            self._evict()
+        else:
+            self._pinned[name] -= 1
+
+    def iter_loaded_decks(self):
+        return iter([self._deck_collection[name].load() for name in self._loaded])
+
+    def set_storage(self, storage):
+        """Storage that evicted decks are flushed to and reloaded from."""
+        self._storage = storage
+        for handle in self._deck_collection.values():
+            handle.set_storage(storage)
+
+    def set_deck_budget(self, max_decks=None, max_cards=None):
+        """Caps how many decks, or how many cards across decks, stay loaded.
+
+        Going over either evicts least recently used decks, saving those with
+        unsaved changes first. Only decks that can be reloaded from storage
+        are evicted. None means no limit.
+        """
+        self._max_decks = max_decks
+        self._max_cards = max_cards
+        self._evict()
+
+    def _touch(self, name):
+        self._loaded[name] = None
+        self._loaded.move_to_end(name)
+        self._evict(keep=name)
+
+    def _over_budget(self):
+        if self._max_decks is not None and len(self._loaded) > self._max_decks:
+            return True
+        if self._max_cards is not None:
+            cards = sum(self._deck_collection[name].get_card_count() for name in self._loaded)
+            return cards > self._max_cards
+        return False
+
+    def _evict(self, keep=None):
+        for name in list(self._loaded):
+            if not self._over_budget():
+                break
+            if name != keep and name not in self._pinned and self._deck_collection[name].unload(self._id):
+                del self._loaded[name]
+
+    def flush(self):
+        """Saves every loaded deck with unsaved changes."""
+        for name in self._loaded:
+            self._deck_collection[name].flush(self._id)
+
+    def get_stats(self):
+        return self._stats.get_stats()
+
+    def get_user_stats(self):
+        return self._stats
+
+    def set_name(self, name):
+        self._name = name
+
+    def get_name(self):
+        return self._name
+
+    def set_id(self, user_id):
+        self._id = user_id
+
+    def get_id(self):
+        return self._id
+
 class UserStats:
     def __init__(self, user):
+        self._user = user
         self._deck_stats = {}
+        self._rollup = StatsRollup()
     
     def add_deck_stats(self, deck):
-        self._deck_stats[deck.get_name()] = deck.stats()
+        deck_stats = deck.get_deck_stats()
+        self._deck_stats[deck.get_name()] = deck_stats
+        # Reviews recorded on the deck roll up into the user's totals
+        deck_stats.set_parent(self._rollup)
+
+    def get_stats(self):
+        return self._rollup.get_totals()
+
+    def get_rollup(self):
+        return self._rollup
+
+    def get_daily(self, days=30, now=None):
+        return self._rollup.get_daily(days, now)
+
+    def get_hourly(self, hours=24, now=None):
+        return self._rollup.get_hourly(hours, now)
 
 
 class CardStats:
-    def __init__(self, card):
-        self._date_added = time.time()
+    __slots__ = ("_date_added", "_last_review_time", "_interval", "_next_due", "_review_count",
+                 "_difficulty_sum", "_ease", "_response_time_sum", "_last_response_time",
+                 "_very_easy_count", "_success_count", "_char_count", "_date_strings")
+
+    def __init__(self, card, date_added=None):
+        self._date_added = time.time() if date_added is None else date_added
         self._last_review_time = 0
         self._interval = 1 
         self._next_due = None
@@ -105,18 +372,28 @@ class CardStats:
         self._difficulty_sum = 0
         self._ease = 1.69
         self._response_time_sum = 0
+        self._last_response_time = 0
         self._very_easy_count = 0
-        self._char_count = len(card.get_front()) + len(card.get_back())
+        self._success_count = 0
+        self._char_count = len(card._front) + len(card._back)
+        # Formatted dates for get_stats, rebuilt only when the time changes
+        self._date_strings = None
 
     def update_stats(self, start_time, end_time, difficulty):
+        if metrics.enabled:
+            metrics.inc("card_reviews_total")
+            metrics.observe("review_response_seconds", end_time - start_time)
         self.set_last_review_time(start_time)
 
         self.sm2(difficulty)
         self._review_count += 1
         self._difficulty_sum += difficulty
         self._response_time_sum += (end_time - start_time)
+        self._last_response_time = end_time - start_time
         if difficulty == 1:
             self._very_easy_count += 1
+        if difficulty <= 3:
+            self._success_count += 1
 
         self.set_next_due(start_time)
     
@@ -136,6 +413,15 @@ class CardStats:
     
     def set_last_review_time(self, date):
         self._last_review_time = date
+
+    def _format_date(self, key, timestamp):
+        if self._date_strings is None:
+            self._date_strings = {}
+        cached = self._date_strings.get(key)
+        if cached is None or cached[0] != timestamp:
+            cached = (timestamp, datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d"))
+            self._date_strings[key] = cached
+        return cached[1]
     
     def set_next_due(self, start_time):
         cur_date = datetime.fromtimestamp(start_time)
@@ -160,8 +446,8 @@ class CardStats:
 
     def get_stats(self):
         stats = {
-            "Date Added": datetime.fromtimestamp(self._date_added).strftime("%Y-%m-%d"),
-            "Last Review Date": datetime.fromtimestamp(self._last_review_time).strftime("%Y-%m-%d"),
+            "Date Added": self._format_date("added", self._date_added),
+            "Last Review Date": self._format_date("last_review", self._last_review_time),
             "Hours Since Last Review": self.get_time_since_last_review(),
             "Interval": self._interval,
             "Next Due": self._next_due,
@@ -176,35 +462,57 @@ class CardStats:
         
 
 class Card():
-    def __init__(self, card_type="basic"):
+    __slots__ = ("_id", "_type", "_reversed_card", "_front", "_back", "_deck", "_stats")
+
+    def __init__(self, card_type="basic", front="", back="", date_added=None):
+        self._id = None
         self._type = card_type
         self._reversed_card = None
-        self._front = ""
-        self._back = ""
+        # Text given up front counts towards the stats' character count
+        self._front = front
+        self._back = back
         self._deck = None
-        self._stats = CardStats(self)
+        self._stats = CardStats(self, date_added)
 
     def update_stats(self, start_time, end_time, difficulty):
         self._stats.update_stats(start_time, end_time, difficulty)
 
     def set_type(self, mytype):
         if mytype.lower() == "basic and reversed":
-            self._reversed_card = Card('reversed')
+            self._reversed_card = Card('reversed', self._back, self._front)
 
     def set_front(self, front):
         self._front = front
+        self._reindex()
 
         if self._reversed_card:
             self._reversed_card.set_back(front)
     
     def set_back(self, back):
         self._back = back
+        self._reindex()
 
         if self._reversed_card:
             self._reversed_card.set_front(back)
+
+    def _reindex(self):
+        if self._deck is not None and self._deck.get_search_index() is not None:
+            self._deck.get_search_index().update(self)
     
     def set_deck(self, deck):
         self._deck = deck
+
+    def get_deck(self):
+        return self._deck
+
+    def set_id(self, card_id):
+        self._id = card_id
+
+    def get_id(self):
+        return self._id
+
+    def get_type(self):
+        return self._type
     
     def get_stats(self):
         return self._stats.get_stats()
@@ -237,9 +545,10 @@ class DeckStats:
         self._avg_difficulty = 0
         self._max_new = 3
         self._deck_ease = 1
+        self._rollup = StatsRollup()
     
-    def incr_card_count(self):
-        self._card_count += 1
+    def incr_card_count(self, count=1):
+        self._card_count += count
 
     def get_max_new(self):
         return self._max_new
@@ -249,6 +558,24 @@ class DeckStats:
         self._time_studied += round((elapsed_time / 1440), 3)
         self._difficulty_sum += difficulty_sum
         self._avg_difficulty = round((self._difficulty_sum / self._total_reviews), 1)
+
+    def record_review(self, start_time, end_time, difficulty):
+        self._rollup.record_review(start_time, end_time, difficulty)
+
+    def set_parent(self, rollup):
+        self._rollup.set_parent(rollup)
+
+    def get_review_totals(self):
+        return self._rollup.get_totals()
+
+    def get_rollup(self):
+        return self._rollup
+
+    def get_daily(self, days=30, now=None):
+        return self._rollup.get_daily(days, now)
+
+    def get_hourly(self, hours=24, now=None):
+        return self._rollup.get_hourly(hours, now)
     
     def get_stats(self):
         stats = {
@@ -264,37 +591,93 @@ class DeckStats:
 
 class Deck():
     def __init__(self, name):
+        self._id = None
         self._name = name
         self._study_deck = StudyDeck()
         self._new_cards_deck = NewCardsDeck()
         self._stats = DeckStats()
+        self._storage = None
+        self._review_log = None
+        self._feature_store = None
+        self._search_index = None
+        # Set by any change storage hasn't seen yet, cleared when it saves the deck
+        self._dirty = False
 
     def add_card(self, card):
+        """Queues card as new. Returns its near-duplicates as (card, similarity) pairs if the deck has a search index."""
+        self._dirty = True
         self._stats.incr_card_count()
         self._new_cards_deck.queue_card(card)
+        card.set_deck(self)
         if card.get_reversed_card():
             self._new_cards_deck.queue_card(card.get_reversed_card())
+            card.get_reversed_card().set_deck(self)
             self._stats.incr_card_count()
 
-    def study(self):
+        if self._feature_store is not None:
+            self._feature_store.add(card)
+            if card.get_reversed_card():
+                self._feature_store.add(card.get_reversed_card())
+
+        if self._search_index is not None:
+            return self._search_index.add(card)
+        return []
+
+    def add_cards(self, cards):
+        """add_card for a whole batch: one queue extend and one stats update.
+
+        Returns the cards added, each followed by its reversed card if it has one.
+        """
+        batch = []
+        for card in cards:
+            card.set_deck(self)
+            batch.append(card)
+            if card._reversed_card:
+                card._reversed_card.set_deck(self)
+                batch.append(card._reversed_card)
+
+        self._dirty = True
+        self._new_cards_deck.queue_cards(batch)
+        self._stats.incr_card_count(len(batch))
+        if self._feature_store is not None:
+            self._feature_store.add_cards(batch)
+        if self._search_index is not None:
+            # Near-duplicates found here are listed by the index's get_duplicates()
+            self._search_index.add_cards(batch)
+        return batch
+
+    def study(self, profile_path=None):
+        """Runs an interactive session. profile_path, if given, gets sampled stacks of it."""
+        with profile(profile_path), metrics.timer("deck_study_seconds"):
+            self._study()
+
+    def _study(self):
         review_queue = self.create_review_queue()
         session_start = time.time()
 
         review_count = 0
         difficulty_sum = 0
+        reviewed_cards = []
 
         while not review_queue.is_empty():
             cur_card = review_queue.dequeue()
             if not self.display_card(cur_card):
                 break  # User chose to end the session
 
-            difficulty = self.review_card(cur_card)
+            difficulty = self.review_card(cur_card, review_queue)
             difficulty_sum += difficulty
             review_count += 1
+            if difficulty < 4:
+                reviewed_cards.append(cur_card)
 
         session_end = time.time()
         elapsed_time = session_end - session_start
         self.update_stats(elapsed_time, difficulty_sum, review_count)
+
+        # Persist the whole session in one transaction
+        if self._storage is not None:
+            with metrics.timer("session_save_seconds"):
+                self._storage.save_session(self, reviewed_cards)
         print("You are done reviewing this deck for today!")
     
     def display_card(self, card):
@@ -316,98 +699,342 @@ class Deck():
             return False  # Break out of study loop
         return True  # Continue studying
 
-    def review_card(self, card):
+    def review_card(self, card, review_queue):
         """Processes a single card review, updates stats based on difficulty."""
         start_time = time.time()
         difficulty = int(input("How hard was that card? (1-5): "))
         end_time = time.time()
 
-        if difficulty >= 4:
-            self.review_queue.queue(card)  # Queue for re-review
-        else:
-            card.update_stats(start_time, end_time, difficulty)
-            self._study_deck.add_card(card.get_next_due(), card)
+        if self.grade_card(card, difficulty, start_time, end_time):
+            review_queue.queue(card)  # Queue for re-review
 
         return difficulty
 
+    def grade_card(self, card, difficulty, start_time, end_time):
+        """Applies a grade without any I/O. Returns True if the card needs another look."""
+        self._dirty = True
+        self._stats.record_review(start_time, end_time, difficulty)
+        # Lapses are logged too: audits and retraining need every review
+        if self._review_log is not None and card.get_id() is not None:
+            self._review_log.append(card.get_id(), start_time, end_time, difficulty)
+        if difficulty >= 4:
+            if metrics.enabled:
+                metrics.inc("card_requeues_total")
+            return True
 
-    def create_review_queue(self):
-        date = datetime.now().isoformat().split("T")[0]
+        card.update_stats(start_time, end_time, difficulty)
+        self._study_deck.add_card(card.get_next_due(), card)
+        if self._feature_store is not None:
+            self._feature_store.update(card)
+        return False
 
-        max_new = self._stats.get_max_new()
-        
-        if date in self._study_deck:
-            study_queue = self._study_deck.get_deck()[date]
-        else:
-            study_queue = LinkedListQueue()
 
-        ratio = max(len(study_queue) // (min(max_new, len(self._new_cards_deck.get_deck()))), 1)
+    @metrics.timed("create_review_queue_seconds")
+    def create_review_queue(self):
+        """Today's new cards, each followed by its share of due cards, then the rest of the due cards.
+
+        If rollover.py stored a queue for this deck and today, cards follow its
+        order. Cards it doesn't list, e.g. ones scheduled after it ran, come
+        after those it does; cards it lists that are no longer due are left out.
+        """
+        today = date.today()
 
+        max_new = self._stats.get_max_new()
 
-        cur_review_queue = LinkedListQueue()
+        # Overdue cards from earlier days are picked up along with today's
+        due_cards = [card for _, card in self._study_deck.pop_due(today)]
+        new_cards = []
         for _ in range(max_new):
-            if self._new_cards_deck.get_deck().is_empty():
+            card = self._new_cards_deck.get_deck().dequeue()
+            if card is None:
                 break
-            else:
-                cur_review_queue.queue(self._new_cards_deck.get_deck().dequeue())
-                i = 0
-                while i < ratio and not study_queue.is_empty():
-                    cur_review_queue.queue(study_queue.dequeue())
-                    i += 1
+            new_cards.append(card)
+
+        stored = self.load_daily_queue(today)
+        if stored is not None:
+            due_cards = order_by_ids(due_cards, stored[0])
+            new_cards = order_by_ids(new_cards, stored[1])
+
+        study_queue = RingQueue(due_cards)
+        ratio = max(len(study_queue) // max(len(new_cards), 1), 1)
+
+        cur_review_queue = RingQueue()
+        for card in new_cards:
+            cur_review_queue.queue(card)
+            cur_review_queue.extend(study_queue.drain(ratio))
 
-        while not study_queue.is_empty():
-            cur_review_queue.queue(study_queue.dequeue())
+        cur_review_queue.extend(study_queue.drain())
 
+        if metrics.enabled:
+            metrics.inc("review_queue_cards_total", len(cur_review_queue))
         return cur_review_queue
 
     def update_stats(self, elapsed_time, difficulty_sum, review_count):
+        self._dirty = True
         self._stats.update_stats(elapsed_time, difficulty_sum, review_count)
 
     def get_stats(self):
         return self._stats.get_stats()
 
+    def is_dirty(self):
+        return self._dirty
+
+    def set_dirty(self, dirty):
+        self._dirty = dirty
+
+    def get_deck_stats(self):
+        return self._stats
+
     def get_name(self):
         return self._name
 
+    def set_id(self, deck_id):
+        self._id = deck_id
+
+    def get_id(self):
+        return self._id
+
+    def set_storage(self, storage):
+        self._storage = storage
+
+    def get_storage(self):
+        return self._storage
+
+    def load_daily_queue(self, day):
+        """(due_ids, new_ids) stored for day by rollover.py, or None if there is no such queue."""
+        if self._storage is None or self._id is None:
+            return None
+        return self._storage.load_daily_queue(self._id, day)
+
+    def set_review_log(self, review_log):
+        self._review_log = review_log
+
+    def set_feature_store(self, feature_store):
+        """Keeps feature_store's rows for this deck's cards current on every review."""
+        self._feature_store = feature_store
+        if feature_store is not None:
+            feature_store.add_cards(self.iter_cards())
+
+    def get_feature_store(self):
+        return self._feature_store
+
+    def set_search_index(self, search_index):
+        """Indexes this deck's cards in search_index and keeps it current as cards are added or edited."""
+        self._search_index = search_index
+        for card in self.iter_cards():
+            card.set_deck(self)
+        if search_index is not None:
+            search_index.add_cards(self.iter_cards())
+
+    def get_search_index(self):
+        return self._search_index
+
     def get_study_deck(self):
         return self._study_deck
 
     def get_new_cards_deck(self):
         return self._new_cards_deck
 
+    def iter_cards(self):
+        """Every card in the deck: new cards in queue order, then scheduled ones."""
+        yield from self._new_cards_deck.get_deck()
+        for card, _ in self._study_deck.items():
+            yield card
+
     def __repr__(self):
         return self.__str__()
 
     def __str__(self):
         return str(self._study_deck) + "| " + str(self._new_cards_deck)
 
+class DeckHandle:
+    """A deck in a user's collection, loaded from storage on first use.
+
+    The DeckStats stay in memory whether or not the cards do, so deck-level
+    stats and rollups never need a load. Without a storage the deck can't be
+    reloaded and is never unloaded.
+    """
+
+    def __init__(self, name, deck=None, deck_id=None, stats=None, storage=None):
+        self._name = name
+        self._deck = deck
+        self._id = deck.get_id() if deck is not None else deck_id
+        self._stats = deck.get_deck_stats() if deck is not None else stats
+        self._storage = storage if storage is not None or deck is None else deck.get_storage()
+
+    def load(self):
+        if self._deck is None:
+            deck = self._storage.load_deck(self._id)
+            # Keep the resident stats, which carry the rollups and the user link
+            deck._stats = self._stats
+            self._deck = deck
+        return self._deck
+
+    def flush(self, user_id=None):
+        deck = self._deck
+        if deck is not None and self._storage is not None and (deck.is_dirty() or deck.get_id() is None):
+            self._storage.save_deck(deck, user_id)
+            self._id = deck.get_id()
+
+    def unload(self, user_id=None):
+        """Flushes unsaved changes and drops the cards. Returns False if the deck can't be reloaded."""
+        if self._deck is None:
+            return True
+        if self._storage is None:
+            return False
+        self.flush(user_id)
+        # The deck may have been saved through some other path, e.g. Storage.save_user
+        self._id = self._deck.get_id()
+        self._deck = None
+        return True
+
+    def is_loaded(self):
+        return self._deck is not None
+
+    def set_storage(self, storage):
+        self._storage = storage
+        if self._deck is not None and storage is not None:
+            self._deck.set_storage(storage)
+
+    def get_name(self):
+        return self._name
+
+    def get_id(self):
+        return self._deck.get_id() if self._deck is not None else self._id
+
+    def get_deck_stats(self):
+        return self._stats
+
+    def get_stats(self):
+        return self._stats.get_stats()
+
+    def get_card_count(self):
+        return self._stats._card_count
+
 class StudyDeck():
+    """Due index of reviewed cards keyed by integer day ordinals.
+
+    Cards are bucketed per due day and the distinct days are kept sorted, so
+    inserting, rescheduling or removing a card is a dict operation plus a
+    bisect over the days, and due queries only touch the days they return.
+    """
     def __init__(self):
         self._deck = {}
+        self._days = []
+        self._card_day = {}
 
     def add_card(self, due_date, card):
-        if due_date not in self._deck:
-            self._deck[due_date] = LinkedListQueue()
-        self._deck[due_date].queue(card)
+        """Schedules card on due_date, moving it if it was already scheduled."""
+        day = to_day_ordinal(due_date)
+        if card in self._card_day:
+            self.remove_card(card)
+
+        if day not in self._deck:
+            self._deck[day] = {}
+            insort(self._days, day)
+        self._deck[day][card] = None
+        self._card_day[card] = day
+
+    def remove_card(self, card):
+        day = self._card_day.pop(card, None)
+        if day is None:
+            return False
+        bucket = self._deck.get(day)
+        if bucket is not None:
+            bucket.pop(card, None)
+            if not bucket:
+                self._drop_day(day)
+        return True
+
+    def _drop_day(self, day):
+        del self._deck[day]
+        i = bisect_left(self._days, day)
+        if i < len(self._days) and self._days[i] == day:
+            del self._days[i]
+
+    def get_due_day(self, card):
+        return self._card_day.get(card)
+
+    def iter_by_day(self):
+        """(day ordinal, card) for every scheduled card, oldest day first."""
+        for day in self._days:
+            for card in self._deck[day]:
+                yield day, card
+
+    def items(self):
+        """(card, day ordinal) pairs for every scheduled card."""
+        return self._card_day.items()
+
+    def due_up_to(self, due_date):
+        """Cards due on or before due_date, oldest first. Leaves the index untouched."""
+        day = to_day_ordinal(due_date)
+        end = bisect_right(self._days, day)
+        return [card for d in self._days[:end] for card in self._deck[d]]
+
+    def due_between(self, start_date, end_date):
+        """Cards due between start_date and end_date inclusive, oldest first."""
+        start = bisect_left(self._days, to_day_ordinal(start_date))
+        end = bisect_right(self._days, to_day_ordinal(end_date))
+        return [card for d in self._days[start:end] for card in self._deck[d]]
+
+    def count_due(self, due_date):
+        day = to_day_ordinal(due_date)
+        end = bisect_right(self._days, day)
+        return sum(len(self._deck[d]) for d in self._days[:end])
+
+    def pop_due(self, due_date):
+        """Yields (day, card) for every card due on or before due_date and removes it.
+
+        Whole day buckets are detached as they are reached, so the cost is in
+        the number of due cards. Cards left unread when the generator is closed
+        early are put back in the index.
+        """
+        day = to_day_ordinal(due_date)
+        # Only days present now are visited, so cards rescheduled while
+        # iterating are not yielded twice
+        for d in self._days[:bisect_right(self._days, day)]:
+            if d not in self._deck:
+                continue
+            bucket = self._deck[d]
+            self._drop_day(d)
+            cards = iter(bucket)
+            try:
+                for card in cards:
+                    # Skip cards rescheduled elsewhere after the bucket was detached
+                    if self._card_day.get(card) != d:
+                        continue
+                    del self._card_day[card]
+                    yield d, card
+            finally:
+                for card in cards:
+                    if self._card_day.get(card) == d:
+                        del self._card_day[card]
+                        self.add_card(d, card)
 
     def get_deck(self):
         return self._deck
 
+    def __len__(self):
+        return len(self._card_day)
+
     def __contains__(self, other):
-        return other in self._deck
+        return to_day_ordinal(other) in self._deck
     
     def __repr__(self):
         return self.__str__()
     
     def __str__(self):
-        return str(self._deck)
+        return str({date.fromordinal(d).isoformat(): list(self._deck[d]) for d in self._days})
 
 class NewCardsDeck():
     def __init__(self):
-        self._deck = LinkedListQueue()
+        self._deck = RingQueue()
 
     def queue_card(self, card):
         self._deck.queue(card)
+
+    def queue_cards(self, cards):
+        self._deck.extend(cards)
     
     def get_deck(self):
         return self._deck
@@ -451,8 +1078,8 @@ def main():
     print(deck.get_stats())
     
     
-
-main()
+if __name__ == "__main__":
+    main()
 
 
     
\ No newline at end of file
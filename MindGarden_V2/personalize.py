@@ -0,0 +1,150 @@
+from collections import OrderedDict
+import copy
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from features import NUM_FEATURES
+from torch_model import load_model_01
+
+
+class HeadCache:
+    """LRU cache of per-user output heads that spills evicted heads to disk.
+
+    A head is the weights and bias of the final Linear layer flattened into
+    one float32 vector. Users never seen before start from default.
+    """
+
+    def __init__(self, default, capacity=10_000, spill_dir="user_heads"):
+        self._default = default.detach().clone()
+        self._capacity = capacity
+        self._spill_dir = Path(spill_dir)
+        self._spill_dir.mkdir(parents=True, exist_ok=True)
+        self._heads = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def _path(self, user_id):
+        # Percent-encoded, so an id can't name a file outside spill_dir
+        return self._spill_dir / f"{quote(str(user_id), safe='')}.npy"
+
+    def get(self, user_id):
+        head = self._heads.get(user_id)
+        if head is not None:
+            self._heads.move_to_end(user_id)
+            self._hits += 1
+            return head
+
+        self._misses += 1
+        path = self._path(user_id)
+        if path.exists():
+            head = torch.from_numpy(np.load(path))
+        else:
+            head = self._default.clone()
+        self.put(user_id, head)
+        return head
+
+    def put(self, user_id, head):
+        self._heads[user_id] = head
+        self._heads.move_to_end(user_id)
+        while len(self._heads) > self._capacity:
+            self._spill(*self._heads.popitem(last=False))
+
+    def _spill(self, user_id, head):
+        np.save(self._path(user_id), head.numpy())
+
+    def flush(self):
+        """Writes every resident head to disk without evicting it."""
+        for user_id, head in self._heads.items():
+            self._spill(user_id, head)
+
+    def get_stats(self):
+        return {"resident": len(self._heads), "hits": self._hits, "misses": self._misses}
+
+    def __len__(self):
+        return len(self._heads)
+
+
+class PersonalizationEngine:
+    """Per-user fine-tuning on top of one shared, frozen FlashcardModel.
+
+    Each user only owns the model's final 32->1 Linear layer (33 floats). The
+    shared body's hidden activations are computed once per batch, then the
+    heads of a whole group of users are stacked into a (users, 33) tensor and
+    every row is scored against its own user's head by gather. The loss is the
+    sum of per-user means, so each user's gradient (and Adam's element-wise
+    update) only depends on that user's rows: one optimizer step trains every
+    user in the group independently, the same result as vmapping the single
+    user update over the group.
+    """
+
+    def __init__(self, base_model=None, cache_size=10_000, spill_dir="user_heads"):
+        base_model = base_model if base_model is not None else load_model_01()
+        # A frozen copy, so the caller's model stays trainable
+        self._body = copy.deepcopy(base_model.layers[:-1]).eval()
+        for param in self._body.parameters():
+            param.requires_grad_(False)
+
+        head = base_model.layers[-1]
+        self._hidden_size = head.in_features
+        default = torch.cat([head.weight.detach().reshape(-1), head.bias.detach()])
+        self._cache = HeadCache(default, cache_size, spill_dir)
+
+    def get_cache(self):
+        return self._cache
+
+    def _hidden(self, features):
+        with torch.no_grad():
+            return self._body(torch.as_tensor(features, dtype=torch.float32))
+
+    def predict(self, user_id, features):
+        head = self._cache.get(user_id)
+        hidden = self._hidden(features).reshape(-1, self._hidden_size)
+        return hidden @ head[:-1] + head[-1]
+
+    def fine_tune(self, user_data, epochs=5, lr=0.01, group_size=1024):
+        """Fine-tunes every user in user_data, group_size users per vectorized pass.
+
+        user_data maps user id to a (features, labels) pair of shapes
+        (n, NUM_FEATURES) and (n,). Returns {user_id: training MSE after the
+        last step}.
+        """
+        user_ids = list(user_data)
+        losses = {}
+        for start in range(0, len(user_ids), group_size):
+            group = user_ids[start:start + group_size]
+            losses.update(self._fine_tune_group(group, [user_data[u] for u in group], epochs, lr))
+        return losses
+
+    def _fine_tune_group(self, user_ids, data, epochs, lr):
+        features = torch.cat([torch.as_tensor(f, dtype=torch.float32).reshape(-1, NUM_FEATURES) for f, _ in data])
+        labels = torch.cat([torch.as_tensor(l, dtype=torch.float32).reshape(-1) for _, l in data])
+        counts = torch.tensor([len(l) for _, l in data], dtype=torch.float32)
+        owner = torch.repeat_interleave(torch.arange(len(data)), counts.long())
+
+        hidden = self._hidden(features)
+        heads = nn.Parameter(torch.stack([self._cache.get(u) for u in user_ids]))
+        optimizer = torch.optim.Adam([heads], lr=lr)
+
+        def per_user_mse():
+            row_heads = heads[owner]
+            predictions = (hidden * row_heads[:, :-1]).sum(dim=1) + row_heads[:, -1]
+            squared_error = (predictions - labels) ** 2
+            return torch.zeros(len(data)).index_add_(0, owner, squared_error) / counts.clamp(min=1)
+
+        for _ in range(epochs):
+            optimizer.zero_grad(set_to_none=True)
+            per_user_mse().sum().backward()
+            optimizer.step()
+
+        # One more forward pass, so the loss is that of the heads being stored
+        with torch.no_grad():
+            per_user = per_user_mse()
+
+        trained = heads.detach()
+        for i, user_id in enumerate(user_ids):
+            self._cache.put(user_id, trained[i].clone())
+        return dict(zip(user_ids, per_user.tolist()))
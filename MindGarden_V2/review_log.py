@@ -0,0 +1,212 @@
+from datetime import date
+from pathlib import Path
+import os
+import struct
+
+import numpy as np
+
+from card_store import CardStore, NO_DUE
+
+MAGIC = b"MGRL"
+VERSION = 1
+
+# Segment header: magic, version, record size, base timestamp (ms)
+HEADER = struct.Struct("<4sHHq")
+
+# One review: card id, start as ms after the segment base, response time in
+# ms and the difficulty, padded to 16 bytes
+RECORD = struct.Struct("<IIIB3x")
+RECORD_DTYPE = np.dtype([
+    ("card_id", "<u4"),
+    ("start_delta", "<u4"),
+    ("duration", "<u4"),
+    ("difficulty", "u1"),
+    ("pad", "V3"),
+])
+
+MAX_DELTA = 2 ** 32 - 1
+MAX_DURATION = 2 ** 32 - 1
+
+
+class ReviewLog:
+    """Append-only log of every review, split into fixed-width segment files.
+
+    Records are packed into an in-memory buffer and written out every
+    flush_every reviews (and on flush/close), so appending costs one
+    struct.pack_into per review. A segment is closed when it reaches
+    segment_records records or when a start time no longer fits in the
+    32-bit millisecond delta from the segment base (about 49 days).
+    """
+
+    def __init__(self, directory, segment_records=1 << 20, flush_every=256):
+        self._dir = Path(directory)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._segment_records = segment_records
+        self._flush_every = flush_every
+
+        self._buffer = bytearray(RECORD.size * flush_every)
+        self._buffered = 0
+        self._file = None
+        self._base_ms = None
+        self._count = 0
+        self._index = 0
+
+        segments = list_segments(self._dir)
+        if segments:
+            self._reopen(segments[-1])
+
+    def _reopen(self, path):
+        self._index = int(path.stem)
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            # Crashed before the header hit the disk
+            path.unlink()
+            return
+
+        _, _, _, base_ms = HEADER.unpack(header)
+        count = (path.stat().st_size - HEADER.size) // RECORD.size
+        if count >= self._segment_records:
+            return
+
+        # Drop a torn trailing record left by a crash
+        os.truncate(path, HEADER.size + count * RECORD.size)
+        self._file = open(path, "ab")
+        self._base_ms = base_ms
+        self._count = count
+
+    def _open_segment(self, base_ms):
+        self._close_segment()
+        self._index += 1
+        path = self._dir / f"{self._index:08d}.seg"
+        self._file = open(path, "ab")
+        self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, base_ms))
+        self._base_ms = base_ms
+        self._count = 0
+
+    def _close_segment(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def append(self, card_id, start_time, end_time, difficulty):
+        start_ms = int(start_time * 1000)
+        if (self._file is None or self._count >= self._segment_records
+                or not 0 <= start_ms - self._base_ms <= MAX_DELTA):
+            self.flush()
+            self._open_segment(start_ms)
+
+        duration = min(max(int((end_time - start_time) * 1000), 0), MAX_DURATION)
+        RECORD.pack_into(self._buffer, self._buffered * RECORD.size,
+                         card_id, start_ms - self._base_ms, duration, difficulty)
+        self._buffered += 1
+        self._count += 1
+        if self._buffered == self._flush_every:
+            self.flush()
+
+    def flush(self):
+        if self._buffered:
+            self._file.write(memoryview(self._buffer)[:self._buffered * RECORD.size])
+            self._buffered = 0
+        if self._file is not None:
+            self._file.flush()
+
+    def sync(self):
+        """Flushes and fsyncs the open segment."""
+        self.flush()
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._close_segment()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def list_segments(directory):
+    return sorted(Path(directory).glob("*.seg"))
+
+
+def map_segment(path):
+    """Memory-maps one segment. Returns (base_ms, record array)."""
+    with open(path, "rb") as f:
+        magic, version, record_size, base_ms = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path} is not a version {VERSION} review log segment")
+
+    count = (path.stat().st_size - HEADER.size) // RECORD.size
+    if count == 0:
+        return base_ms, np.empty(0, dtype=RECORD_DTYPE)
+    return base_ms, np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER.size, shape=(count,))
+
+
+def read_reviews(directory):
+    """Decodes every segment into (card_ids, start_times, end_times, difficulties)."""
+    card_ids, starts, durations, difficulties = [], [], [], []
+    for path in list_segments(directory):
+        base_ms, records = map_segment(path)
+        card_ids.append(records["card_id"].astype(np.int64))
+        starts.append(records["start_delta"].astype(np.int64) + base_ms)
+        durations.append(records["duration"].astype(np.int64))
+        difficulties.append(records["difficulty"].astype(np.int64))
+
+    if not card_ids:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty.astype(np.float64), empty.astype(np.float64), empty
+
+    start_ms = np.concatenate(starts)
+    end_ms = start_ms + np.concatenate(durations)
+    return np.concatenate(card_ids), start_ms / 1000, end_ms / 1000, np.concatenate(difficulties)
+
+
+def replay(directory, store=None):
+    """Rebuilds card stats from the log into a CardStore.
+
+    Cards are addressed by their id, so the store grows to the largest id in
+    the log. All reviews are applied with one CardStore.update_stats call; its
+    rounds keep each card's reviews in time order. Lapses (4 or 5) are logged
+    but skipped here, as Deck.grade_card only requeues them.
+    """
+    card_ids, start_times, end_times, difficulties = read_reviews(directory)
+    passed = difficulties <= 3
+    card_ids, start_times, end_times, difficulties = (
+        card_ids[passed], start_times[passed], end_times[passed], difficulties[passed])
+    if store is None:
+        store = CardStore()
+    if len(card_ids) and card_ids.max() >= len(store):
+        store.add_cards(int(card_ids.max()) + 1 - len(store))
+
+    order = np.argsort(start_times, kind="stable")
+    store.update_stats(card_ids[order], start_times[order], end_times[order], difficulties[order])
+    return store
+
+
+def replay_into(directory, cards):
+    """Rebuilds the CardStats of models.Card objects from the log.
+
+    cards maps card id to Card. Cards without any logged review are left as is.
+    """
+    store = replay(directory)
+    reviewed = store.column("review_count")
+    for card_id, card in cards.items():
+        if card_id >= len(store) or reviewed[card_id] == 0:
+            continue
+        stats = card._stats
+        stats._last_review_time = float(store._last_review_time[card_id])
+        stats._interval = int(store._interval[card_id])
+        stats._review_count = int(store._review_count[card_id])
+        stats._difficulty_sum = int(store._difficulty_sum[card_id])
+        stats._ease = float(store._ease[card_id])
+        stats._response_time_sum = float(store._response_time_sum[card_id])
+        stats._very_easy_count = int(store._very_easy_count[card_id])
+        stats._success_count = int(store._success_count[card_id])
+        stats._last_response_time = float(store._last_response_time[card_id])
+        due = int(store._next_due[card_id])
+        if due != NO_DUE:
+            stats._next_due = date.fromordinal(due).strftime("%Y-%m-%d")
+    return cards
@@ -0,0 +1,112 @@
+"""Nightly job that builds every deck's review queue for a day ahead of time.
+
+    python rollover.py mindgarden.db --day 2024-05-02 --shards 64 --workers 8
+
+Users are split into shards by user_id % shards (decks without a user go
+to shard 0), and shards run in a process pool, each worker with its own SQLite connection. For every deck a
+worker reads only card ids off the cards_deck_schedule index: the cards due
+on or before the day, oldest first, and the first max_new cards of the new
+cards queue. It stores them in daily_queues as little-endian int64 blobs.
+Each shard's queues and its completion record are committed in one
+transaction. Rerunning the job for the same day skips completed shards, so
+after a failure it resumes where it stopped.
+
+Deck.create_review_queue and SessionPlanner order a deck's cards by its
+stored queue when there is one for the day, so every session that day sees
+the same order. They still take the cards from the deck in memory; the
+stored ids don't replace that work.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+import sys
+import time
+
+from models import to_day_ordinal
+from storage import Storage
+
+
+def _rollover_shard(path, day, shards, shard):
+    start = time.perf_counter()
+    with Storage(path) as storage:
+        decks = storage.shard_decks(shards, shard)
+        queues = []
+        due_cards = 0
+        for deck_id, user_id, max_new in decks:
+            due = storage.due_ids(deck_id, day)
+            new = storage.new_ids(deck_id, max_new or 0)
+            queues.append((deck_id, user_id, due, new))
+            due_cards += len(due)
+
+        users = len({user_id for _, user_id, _ in decks if user_id is not None})
+        storage.save_daily_queues(day, queues, (shards, shard, users))
+    return {"shard": shard, "users": users, "decks": len(decks), "due_cards": due_cards,
+            "seconds": time.perf_counter() - start}
+
+
+def run_rollover(path, day=None, shards=64, workers=None, progress=None):
+    """Builds the queues of every user's decks for day (default today).
+
+    Shards already completed for this day and shard count are skipped.
+    progress, if given, is called with each shard's result as it finishes.
+    Returns totals for the shards run, including users_per_s.
+    """
+    day = to_day_ordinal(date.today() if day is None else day)
+    with Storage(path) as storage:
+        done = storage.completed_shards(day, shards)
+    pending = [shard for shard in range(shards) if shard not in done]
+
+    start = time.perf_counter()
+    results = []
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = [pool.submit(_rollover_shard, str(path), day, shards, shard) for shard in pending]
+            for job in as_completed(jobs):
+                result = job.result()
+                results.append(result)
+                if progress is not None:
+                    progress(result)
+    elapsed = time.perf_counter() - start
+
+    users = sum(r["users"] for r in results)
+    return {
+        "day": date.fromordinal(day).isoformat(),
+        "shards_run": len(results),
+        "shards_skipped": len(done),
+        "users": users,
+        "decks": sum(r["decks"] for r in results),
+        "due_cards": sum(r["due_cards"] for r in results),
+        "seconds": elapsed,
+        "users_per_s": users / elapsed if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build every deck's review queue for a day ahead of time")
+    parser.add_argument("db")
+    parser.add_argument("--day", default=None, help="YYYY-MM-DD, default today")
+    parser.add_argument("--shards", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--keep-days", type=int, default=None,
+                        help="drop queues older than this many days before --day")
+    args = parser.parse_args(argv)
+
+    day = date.fromisoformat(args.day) if args.day else date.today()
+
+    def report(result):
+        print(f"shard {result['shard']:>4}: {result['users']:>8,} users {result['due_cards']:>10,} due cards "
+              f"in {result['seconds']:.2f}s", file=sys.stderr)
+
+    totals = run_rollover(args.db, day, args.shards, args.workers, report)
+    if args.keep_days is not None:
+        with Storage(args.db) as storage:
+            storage.prune_daily_queues(day.toordinal() - args.keep_days)
+
+    print(f"{totals['day']}: {totals['users']:,} users, {totals['decks']:,} decks, "
+          f"{totals['due_cards']:,} due cards in {totals['seconds']:.2f}s "
+          f"({totals['users_per_s']:,.0f} users/s); {totals['shards_skipped']} shards already done")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
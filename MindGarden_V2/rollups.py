@@ -0,0 +1,175 @@
+import time
+
+import numpy as np
+
+HOUR = 3600
+DAY = 86400
+
+
+class TimeBuckets:
+    """Review aggregates per local-time period (hour or day) in NumPy arrays.
+
+    Bucket i covers period origin + i. The arrays grow (doubling) in either
+    direction as reviews land outside the covered range.
+    """
+
+    def __init__(self, period=DAY, capacity=32):
+        self._period = period
+        self._origin = None
+        # [start, end) in epoch seconds of the last period looked up
+        self._window = (0.0, 0.0, None)
+        self._reviews = np.zeros(capacity, dtype=np.int32)
+        self._successes = np.zeros(capacity, dtype=np.int32)
+        self._time_studied = np.zeros(capacity, dtype=np.float64)
+        self._difficulty_hist = np.zeros((capacity, 5), dtype=np.int32)
+
+    def period_of(self, timestamp):
+        start, end, period = self._window
+        if start <= timestamp < end:
+            return period
+        offset = time.localtime(timestamp).tm_gmtoff
+        period = int((timestamp + offset) // self._period)
+        start = period * self._period - offset
+        self._window = (start, start + self._period, period)
+        return period
+
+    def _resize(self, shift, capacity):
+        for name in ("_reviews", "_successes", "_time_studied", "_difficulty_hist"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[shift:shift + len(old)] = old
+            setattr(self, name, new)
+
+    def _index(self, period):
+        if self._origin is None:
+            self._origin = period
+        i = period - self._origin
+        capacity = len(self._reviews)
+        if i < 0:
+            # All the new room goes in front, so walking backwards stays amortised O(1)
+            shift = max(capacity, -i)
+            self._resize(shift, capacity + shift)
+            self._origin -= shift
+            i += shift
+        elif i >= capacity:
+            self._resize(0, max(capacity * 2, i + 1))
+        return i
+
+    def record(self, timestamp, elapsed, difficulty):
+        i = self._index(self.period_of(timestamp))
+        self._reviews[i] += 1
+        self._time_studied[i] += elapsed
+        self._difficulty_hist[i, min(max(int(difficulty), 1), 5) - 1] += 1
+        if difficulty <= 3:
+            self._successes[i] += 1
+
+    def get_state(self):
+        """Origin plus the bucket arrays, for snapshots."""
+        return {
+            "origin": self._origin,
+            "reviews": self._reviews,
+            "successes": self._successes,
+            "time_studied": self._time_studied,
+            "difficulty_hist": self._difficulty_hist,
+        }
+
+    def set_state(self, state):
+        self._origin = state["origin"]
+        self._window = (0.0, 0.0, None)
+        # Copied so restored buckets can grow and be written to
+        for name in ("reviews", "successes", "time_studied", "difficulty_hist"):
+            setattr(self, "_" + name, np.array(state[name]))
+
+    def query(self, start, end):
+        """Aggregates for timestamps from start to end, one row per period.
+
+        Returns a dict of arrays plus "periods", the period numbers they cover.
+        """
+        first, last = self.period_of(start), self.period_of(end)
+        periods = np.arange(first, last + 1)
+        result = {
+            "periods": periods,
+            "reviews": np.zeros(len(periods), dtype=np.int32),
+            "successes": np.zeros(len(periods), dtype=np.int32),
+            "time_studied": np.zeros(len(periods), dtype=np.float64),
+            "difficulty_hist": np.zeros((len(periods), 5), dtype=np.int32),
+        }
+        if self._origin is None:
+            return result
+
+        lo = max(first - self._origin, 0)
+        hi = min(last - self._origin + 1, len(self._reviews))
+        if lo < hi:
+            out = slice(lo + self._origin - first, hi + self._origin - first)
+            result["reviews"][out] = self._reviews[lo:hi]
+            result["successes"][out] = self._successes[lo:hi]
+            result["time_studied"][out] = self._time_studied[lo:hi]
+            result["difficulty_hist"][out] = self._difficulty_hist[lo:hi]
+        return result
+
+
+class StatsRollup:
+    """Running totals plus hourly and daily buckets, forwarded to a parent rollup.
+
+    A card review is recorded once on its deck's rollup and propagates to the
+    user's, so each level is O(1) per review and never walks cards.
+    """
+
+    def __init__(self, parent=None):
+        self._parent = parent
+        self._reviews = 0
+        self._successes = 0
+        self._time_studied = 0.0
+        self._difficulty_hist = [0] * 5
+        self._hourly = TimeBuckets(HOUR)
+        self._daily = TimeBuckets(DAY)
+
+    def set_parent(self, parent):
+        self._parent = parent
+
+    def record_review(self, start_time, end_time, difficulty):
+        elapsed = end_time - start_time
+        self._reviews += 1
+        self._time_studied += elapsed
+        self._difficulty_hist[min(max(int(difficulty), 1), 5) - 1] += 1
+        if difficulty <= 3:
+            self._successes += 1
+        self._hourly.record(start_time, elapsed, difficulty)
+        self._daily.record(start_time, elapsed, difficulty)
+
+        if self._parent is not None:
+            self._parent.record_review(start_time, end_time, difficulty)
+
+    def get_state(self):
+        return {
+            "reviews": self._reviews,
+            "successes": self._successes,
+            "time_studied": self._time_studied,
+            "difficulty_hist": list(self._difficulty_hist),
+            "hourly": self._hourly.get_state(),
+            "daily": self._daily.get_state(),
+        }
+
+    def set_state(self, state):
+        self._reviews = state["reviews"]
+        self._successes = state["successes"]
+        self._time_studied = state["time_studied"]
+        self._difficulty_hist = list(state["difficulty_hist"])
+        self._hourly.set_state(state["hourly"])
+        self._daily.set_state(state["daily"])
+
+    def get_totals(self):
+        return {
+            "Reviews": self._reviews,
+            "Time Studied (h)": round(self._time_studied / HOUR, 3),
+            "Success Rate (%)": (self._successes / self._reviews * 100) if self._reviews else None,
+            "Difficulty Histogram": list(self._difficulty_hist),
+        }
+
+    def get_daily(self, days=30, now=None):
+        now = time.time() if now is None else now
+        return self._daily.query(now - (days - 1) * DAY, now)
+
+    def get_hourly(self, hours=24, now=None):
+        now = time.time() if now is None else now
+        return self._hourly.query(now - (hours - 1) * HOUR, now)
@@ -0,0 +1,146 @@
+from datetime import date
+import heapq
+from itertools import groupby
+
+from models import RingQueue, order_by_ids, to_day_ordinal
+
+
+class SessionPlanner:
+    """Plans a study session across all of a user's decks, one card at a time.
+
+    Due cards from every deck are merged lazily with a k-way heap merge, most
+    overdue first (ties go to the deck added first), and new cards are woven
+    in with the same new-vs-review ratio as Deck.create_review_queue. Nothing
+    is pulled from a deck before the session needs it, so starting a session
+    costs O(decks) and ending it early leaves the remaining cards untouched.
+
+    Cards handed out but not yet marked done are put back by close(): review
+    cards on their old due day, new cards at the back of their deck's new
+    cards queue. A requeued card comes back after retry_gap other cards, or
+    once the plan runs out if that is sooner.
+
+    With daily_queues, due cards of a deck that rollover.py stored a queue
+    for are served in its order within each day; reading it uses the deck's
+    storage on the calling thread.
+    """
+
+    def __init__(self, user, day=None, max_cards=None, retry_gap=10, daily_queues=True):
+        self._user = user
+        self._deck_names = user.get_deck_names()
+        # Pinned until close(), so a deck budget can't evict a deck mid-session
+        self._decks = [user.pin_deck(name) for name in self._deck_names]
+        self._day = to_day_ordinal(day if day is not None else date.today())
+        self._max_cards = max_cards
+        self._served = 0
+        self._due_streams = []
+        self._pending = {}
+        self._retry_gap = retry_gap
+        self._daily_queues = daily_queues
+        # (served count it is due at, deck, card), due order since the count only grows
+        self._retry = RingQueue()
+        self._closed = False
+        self._cards = self._plan()
+
+    def _due_stream(self, deck_index, deck):
+        stream = deck.get_study_deck().pop_due(self._day)
+        self._due_streams.append(stream)
+        stored = deck.load_daily_queue(self._day) if self._daily_queues else None
+        if stored is None:
+            for day, card in self._tracked(deck, stream):
+                yield day, deck_index, card
+            return
+
+        # Reordered one day's bucket at a time, so the stream stays lazy across days.
+        # groupby reads one card past each day, which _tracked has already recorded.
+        for day, items in groupby(self._tracked(deck, stream), key=lambda item: item[0]):
+            for card in order_by_ids([card for _, card in items], stored[0]):
+                yield day, deck_index, card
+
+    def _tracked(self, deck, stream):
+        for day, card in stream:
+            # Tracked as soon as it leaves the deck so close() can return it
+            self._pending[card] = (deck, day)
+            yield day, card
+
+    def _new_stream(self):
+        for deck in self._decks:
+            new_cards = deck.get_new_cards_deck().get_deck()
+            for _ in range(deck.get_deck_stats().get_max_new()):
+                card = new_cards.dequeue()
+                if card is None:
+                    break
+                self._pending[card] = (deck, None)
+                yield deck, card
+
+    def _ratio(self):
+        # Counts come from the per-day buckets, not from walking the cards
+        due = sum(deck.get_study_deck().count_due(self._day) for deck in self._decks)
+        new = sum(min(deck.get_deck_stats().get_max_new(), len(deck.get_new_cards_deck().get_deck()))
+                  for deck in self._decks)
+        return max(due // max(new, 1), 1)
+
+    def _plan(self):
+        ratio = self._ratio()
+        due = heapq.merge(*(self._due_stream(i, deck) for i, deck in enumerate(self._decks)),
+                          key=lambda item: item[:2])
+        for deck, card in self._new_stream():
+            yield deck, card
+            for _, (_, deck_index, card) in zip(range(ratio), due):
+                yield self._decks[deck_index], card
+
+        for _, deck_index, card in due:
+            yield self._decks[deck_index], card
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed or (self._max_cards is not None and self._served >= self._max_cards):
+            raise StopIteration
+        retry = self._retry.peek()
+        if retry is not None and retry[0] <= self._served:
+            _, deck, card = self._retry.dequeue()
+        else:
+            try:
+                deck, card = next(self._cards)
+            except StopIteration:
+                if self._retry.is_empty():
+                    raise
+                _, deck, card = self._retry.dequeue()
+        self._served += 1
+        return deck, card
+
+    def next_card(self):
+        """(deck, card) for the next card, or None once the session is over."""
+        return next(self, None)
+
+    def requeue(self, deck, card):
+        """Shows card again later in this session (e.g. it was graded too hard)."""
+        self._retry.queue((self._served + self._retry_gap, deck, card))
+
+    def mark_done(self, card):
+        """Marks card as reviewed so close() won't put it back."""
+        self._pending.pop(card, None)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._cards.close()
+        for stream in self._due_streams:
+            stream.close()
+
+        for card, (deck, day) in self._pending.items():
+            if day is None:
+                deck.get_new_cards_deck().queue_card(card)
+            else:
+                deck.get_study_deck().add_card(day, card)
+        self._pending.clear()
+        for name in self._deck_names:
+            self._user.unpin_deck(name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,315 @@
+"""Monte Carlo comparison of scheduling policies on simulated learners.
+
+    python simulator.py --learners 2000 --cards 200 --days 365
+    python simulator.py --policies models_sm2 learned --workers 4
+
+Each simulated card has a memory stability S (days) and is recalled after t
+days with probability exp(-t / S). Successful reviews grow S, more so when
+recall was hard; lapses shrink it. Policies only see what the app sees: the
+grade and the card's review history. Learners are split into shards that
+run in a process pool, each with its own seed derived from (seed, shard), so
+results do not depend on the number of workers.
+"""
+from abc import ABC, abstractmethod
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import time
+
+import numpy as np
+
+from features import NUM_FEATURES
+from train_setup import sm2_arrays
+
+MAX_INTERVAL = 3650
+
+
+class ForgettingModel:
+    """Exponential forgetting curve with per-card stability.
+
+    initial_stability is the median stability after the first exposure;
+    card_spread is the log-normal spread of that across cards. After a
+    successful review S grows by up to growth times, scaled by how much the
+    card had been forgotten; a lapse multiplies it by lapse_factor.
+    """
+
+    def __init__(self, initial_stability=1.0, card_spread=0.5, growth=3.0, lapse_factor=0.3,
+                 min_stability=0.5):
+        self.initial_stability = initial_stability
+        self.card_spread = card_spread
+        self.growth = growth
+        self.lapse_factor = lapse_factor
+        self.min_stability = min_stability
+
+    def first_stability(self, rng, n):
+        return self.initial_stability * rng.lognormal(0.0, self.card_spread, size=n)
+
+    def recall_probability(self, elapsed, stability):
+        return np.exp(-elapsed / stability)
+
+    def update(self, stability, recall_probability, recalled):
+        grown = stability * (1 + (self.growth - 1) * (1 - recall_probability))
+        lapsed = np.maximum(stability * self.lapse_factor, self.min_stability)
+        return np.where(recalled, grown, lapsed)
+
+
+def grades_for(recall_probability, recalled):
+    """App grades (1 easiest to 5 hardest) a learner would give."""
+    grade = np.where(recall_probability > 0.9, 1, np.where(recall_probability > 0.7, 2, 3))
+    return np.where(recalled, grade, 4)
+
+
+class SchedulingPolicy(ABC):
+    """Interface for policies: per-card state plus the next interval after a review.
+
+    new_state(n) returns the state for n fresh cards as a dict of arrays.
+    next_intervals(state, idx, grades, elapsed) updates the state of cards
+    idx after they were graded, elapsed days after their previous review,
+    and returns their next intervals in days.
+    """
+
+    name = None
+
+    @abstractmethod
+    def new_state(self, num_cards):
+        ...
+
+    @abstractmethod
+    def next_intervals(self, state, idx, grades, elapsed):
+        ...
+
+
+class ModelsSM2(SchedulingPolicy):
+    """CardStats.sm2 as the app runs it.
+
+    A grade of 4 or 5 is requeued in the session by Deck.grade_card and
+    rescheduled once the learner gets it, which is modelled as a grade 3.
+    """
+
+    name = "models_sm2"
+
+    def new_state(self, num_cards):
+        return {
+            "interval": np.ones(num_cards, dtype=np.int64),
+            "ease": np.full(num_cards, 1.69),
+            "review_count": np.zeros(num_cards, dtype=np.int64),
+        }
+
+    def next_intervals(self, state, idx, grades, elapsed):
+        grades = np.minimum(grades, 3)
+        review_count = state["review_count"][idx]
+        interval = state["interval"][idx]
+        ease = state["ease"][idx]
+
+        scaled = np.rint(interval * ease).astype(np.int64)
+        interval = np.where(review_count == 0, 1, np.where(review_count == 1, 3, scaled))
+        state["interval"][idx] = interval
+        state["ease"][idx] = np.maximum(0.3, ease + (0.1 - (grades - 1) * (0.08 + (grades - 1) * 0.02)))
+        state["review_count"][idx] = review_count + 1
+        return interval
+
+
+class TrainSetupSM2(SchedulingPolicy):
+    """train_setup.sm2, the variant the synthetic training data was generated with."""
+
+    name = "train_setup_sm2"
+
+    def new_state(self, num_cards):
+        return {
+            "interval": np.zeros(num_cards),
+            "ease": np.full(num_cards, 1.1),
+            "review_count": np.zeros(num_cards, dtype=np.int64),
+        }
+
+    def next_intervals(self, state, idx, grades, elapsed):
+        interval, ease = sm2_arrays(state["ease"][idx], state["review_count"][idx],
+                                    state["interval"][idx], grades)
+        state["interval"][idx] = interval
+        state["ease"][idx] = ease
+        state["review_count"][idx] += 1
+        return interval.astype(np.int64)
+
+
+class LearnedPolicy(SchedulingPolicy):
+    """FlashcardModel interval predictions from the same features the app feeds it.
+
+    The model is loaded from the registry inside each worker. Ease is tracked
+    with train_setup.sm2, as in the training data.
+    """
+
+    name = "learned"
+
+    def __init__(self, version=None):
+        self._version = version
+        self._model = None
+
+    def __getstate__(self):
+        return {"_version": self._version, "_model": None}
+
+    def _get_model(self):
+        if self._model is None:
+            from model_registry import get_registry
+            self._model = get_registry().get(self._version)
+        return self._model
+
+    def new_state(self, num_cards):
+        state = TrainSetupSM2().new_state(num_cards)
+        state.update({
+            "quality_sum": np.zeros(num_cards),
+            "success_count": np.zeros(num_cards),
+            # Simulated cards have no text; 50 is the middle of the training range
+            "char_count": np.full(num_cards, 50.0),
+        })
+        return state
+
+    def next_intervals(self, state, idx, grades, elapsed):
+        import torch
+
+        _, ease = sm2_arrays(state["ease"][idx], state["review_count"][idx], state["interval"][idx], grades)
+        review_count = state["review_count"][idx] + 1
+        state["ease"][idx] = ease
+        state["review_count"][idx] = review_count
+        state["quality_sum"][idx] += 5 - grades
+        state["success_count"][idx] += grades <= 3
+
+        features = np.empty((len(idx), NUM_FEATURES), dtype=np.float32)
+        features[:, 0] = elapsed
+        features[:, 1] = state["interval"][idx]
+        features[:, 2] = review_count
+        features[:, 3] = state["quality_sum"][idx] / review_count
+        features[:, 4] = ease
+        # Harder grades come with slower answers
+        features[:, 5] = 1.5 + 0.5 * grades
+        features[:, 6] = state["success_count"][idx] / review_count
+        features[:, 7] = state["char_count"][idx]
+
+        with torch.inference_mode():
+            predicted = self._get_model()(torch.from_numpy(features)).numpy().ravel()
+        interval = np.clip(np.rint(np.nan_to_num(predicted)), 1, MAX_INTERVAL)
+        state["interval"][idx] = interval
+        return interval.astype(np.int64)
+
+
+POLICIES = {policy.name: policy for policy in (ModelsSM2, TrainSetupSM2, LearnedPolicy)}
+
+
+def _simulate_shard(policy, learners, cards_per_learner, days, new_per_day, forgetting, seed, shard):
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(shard,)))
+    n = learners * cards_per_learner
+    # Every learner introduces new_per_day of their cards a day, in order
+    first_day = np.tile(np.arange(cards_per_learner) // max(new_per_day, 1), learners)
+
+    state = policy.new_state(n)
+    next_due = first_day.copy()
+    last_review = np.zeros(n, dtype=np.int64)
+    stability = forgetting.first_stability(rng, n)
+    seen = np.zeros(n, dtype=bool)
+
+    reviews = 0
+    lapses = 0
+    graded = 0
+    for day in range(days):
+        idx = np.flatnonzero(next_due == day)
+        if len(idx) == 0:
+            continue
+
+        elapsed = day - last_review[idx]
+        first = ~seen[idx]
+        p = np.where(first, 1.0, forgetting.recall_probability(elapsed, stability[idx]))
+        recalled = first | (rng.random(len(idx)) < p)
+        grades = np.where(first, 3, grades_for(p, recalled))
+
+        stability[idx] = np.where(first, stability[idx], forgetting.update(stability[idx], p, recalled))
+        seen[idx] = True
+        last_review[idx] = day
+
+        intervals = policy.next_intervals(state, idx, grades, elapsed)
+        next_due[idx] = day + np.clip(intervals, 1, MAX_INTERVAL)
+
+        # A lapse is shown again in the same session before it is rescheduled
+        shard_lapses = int((~recalled).sum())
+        reviews += len(idx) + shard_lapses
+        lapses += shard_lapses
+        graded += int((~first).sum())
+
+    # Retention at the end of the horizon, over every card introduced so far
+    introduced = seen
+    retention = forgetting.recall_probability(days - last_review[introduced], stability[introduced])
+    return {
+        "learners": learners,
+        "cards": int(introduced.sum()),
+        "reviews": reviews,
+        "lapses": lapses,
+        "graded": graded,
+        "retention_sum": float(retention.sum()),
+    }
+
+
+def simulate(policy, learners=1000, cards_per_learner=200, days=365, new_per_day=10,
+             forgetting=None, workers=None, shards=16, seed=57):
+    """Runs learners through policy for days days and returns summary metrics.
+
+    retention is the mean recall probability of introduced cards on the day
+    after the horizon; recall_rate is the share of scheduled reviews (not first
+    exposures) that were recalled; review load counts in-session relearns.
+    """
+    if isinstance(policy, str):
+        policy = POLICIES[policy]()
+    forgetting = ForgettingModel() if forgetting is None else forgetting
+    shards = min(shards, learners)
+    sizes = [learners // shards + (i < learners % shards) for i in range(shards)]
+
+    start = time.perf_counter()
+    if workers == 0 or shards == 1:
+        results = [_simulate_shard(policy, size, cards_per_learner, days, new_per_day, forgetting, seed, i)
+                   for i, size in enumerate(sizes)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            jobs = [pool.submit(_simulate_shard, policy, size, cards_per_learner, days, new_per_day,
+                                forgetting, seed, i) for i, size in enumerate(sizes)]
+            results = [job.result() for job in jobs]
+    elapsed = time.perf_counter() - start
+
+    totals = {key: sum(r[key] for r in results) for key in results[0]}
+    return {
+        "policy": policy.name,
+        "learners": learners,
+        "days": days,
+        "reviews": totals["reviews"],
+        "reviews_per_learner_day": totals["reviews"] / learners / days,
+        "recall_rate": 1 - totals["lapses"] / totals["graded"] if totals["graded"] else None,
+        "retention": totals["retention_sum"] / totals["cards"] if totals["cards"] else None,
+        "seconds": elapsed,
+        "reviews_per_s": totals["reviews"] / elapsed,
+    }
+
+
+def _init_worker():
+    # Shards already fill every worker; torch's own threads would oversubscribe
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare scheduling policies on simulated learners")
+    parser.add_argument("--policies", nargs="+", choices=sorted(POLICIES), default=sorted(POLICIES))
+    parser.add_argument("--learners", type=int, default=1000)
+    parser.add_argument("--cards", type=int, default=200)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--new-per-day", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=57)
+    args = parser.parse_args(argv)
+
+    print(f"{'policy':<16} {'retention':>9} {'recall':>7} {'reviews':>12} {'per day':>8} {'reviews/s':>12}")
+    for name in args.policies:
+        result = simulate(name, args.learners, args.cards, args.days, args.new_per_day,
+                          workers=args.workers, seed=args.seed)
+        print(f"{result['policy']:<16} {result['retention']:>9.3f} {result['recall_rate']:>7.3f} "
+              f"{result['reviews']:>12,} {result['reviews_per_learner_day']:>8.2f} {result['reviews_per_s']:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
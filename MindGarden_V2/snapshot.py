@@ -0,0 +1,324 @@
+"""Columnar binary snapshots of a user's full state.
+
+    write_snapshot(user, "user.mgs")
+    snap = Snapshot("user.mgs")        # maps the file, builds nothing
+    snap.count_due("Spanish", date.today())
+    deck = snap.load_deck("Spanish")   # builds that deck's cards only
+
+File layout: an 8-byte magic, the length of a JSON header, the header, then
+64-byte aligned sections. The header holds user and deck metadata and, for
+every section, its dtype, shape and offset. Sections are plain fixed-width
+arrays: one row per card for each stats column, the card text as one UTF-8
+blob with offsets, and the rollup buckets. Each deck owns a contiguous range of
+rows: its new cards in queue order, then its scheduled cards sorted by due
+day, so the due_day column of that range is the deck's due index.
+"""
+from datetime import date, datetime
+import json
+
+import numpy as np
+
+from models import Card, Deck, User, to_day_ordinal
+
+MAGIC = b"MGSNAP01"
+ALIGN = 64
+NO_DUE = 0
+
+# Card stats columns, stored one array each
+STATS_COLUMNS = {
+    "date_added": "<f8",
+    "last_review_time": "<f8",
+    "interval": "<i8",
+    "review_count": "<i8",
+    "difficulty_sum": "<i8",
+    "ease": "<f8",
+    "response_time_sum": "<f8",
+    "last_response_time": "<f8",
+    "very_easy_count": "<i8",
+    "success_count": "<i8",
+    "char_count": "<i8",
+}
+DECK_STATS_FIELDS = ("date_added", "card_count", "total_reviews", "time_studied", "difficulty_sum",
+                     "avg_difficulty", "max_new", "deck_ease")
+
+
+def _rollup_sections(prefix, rollup, sections):
+    state = rollup.get_state()
+    meta = {key: state[key] for key in ("reviews", "successes", "time_studied", "difficulty_hist")}
+    for period in ("hourly", "daily"):
+        buckets = state[period]
+        meta[period + "_origin"] = buckets["origin"]
+        for name in ("reviews", "successes", "time_studied", "difficulty_hist"):
+            sections[f"{prefix}.{period}.{name}"] = buckets[name]
+    return meta
+
+
+def _text(card, side):
+    text = getattr(card, "_" + side)
+    # Storage keeps card text untyped, so numbers come back as numbers; bulk_io imports them as text
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        return str(text)
+    if not isinstance(text, str):
+        raise TypeError(f"Card {card.get_id()} has a {side} of type {type(text).__name__}, not text")
+    return text
+
+
+def write_snapshot(user, path):
+    """Writes user, its decks, cards and stats rollups to path."""
+    cards = []
+    due = []
+    decks = []
+    sections = {}
+    for deck_index, deck in enumerate(user.iter_decks()):
+        start = len(cards)
+        new_cards = list(deck.get_new_cards_deck().get_deck())
+        cards.extend(new_cards)
+        due.extend([NO_DUE] * len(new_cards))
+        for day, card in deck.get_study_deck().iter_by_day():
+            cards.append(card)
+            due.append(day)
+
+        stats = deck.get_deck_stats()
+        decks.append({
+            "name": deck.get_name(),
+            "id": deck.get_id(),
+            "start": start,
+            "new": len(new_cards),
+            "end": len(cards),
+            "stats": {field: getattr(stats, "_" + field) for field in DECK_STATS_FIELDS},
+            "rollup": _rollup_sections(f"deck{deck_index}", stats.get_rollup(), sections),
+        })
+
+    # Reversed cards outside both queues (e.g. mid-session) go after the decks
+    index = {card: i for i, card in enumerate(cards)}
+    for card in cards:
+        linked = card.get_reversed_card()
+        if linked is not None and linked not in index:
+            index[linked] = len(cards)
+            cards.append(linked)
+            due.append(NO_DUE)
+
+    types = sorted({card.get_type() for card in cards})
+    type_codes = {card_type: i for i, card_type in enumerate(types)}
+    card_stats = [card._stats for card in cards]
+
+    sections["card.type"] = np.array([type_codes[card.get_type()] for card in cards], dtype=np.uint8)
+    sections["card.id"] = np.array([-1 if card.get_id() is None else card.get_id() for card in cards],
+                                   dtype="<i8")
+    sections["card.reversed"] = np.array(
+        [-1 if card.get_reversed_card() is None else index[card.get_reversed_card()] for card in cards],
+        dtype="<i8")
+    sections["card.due_day"] = np.array(due, dtype="<i4")
+    sections["card.next_due"] = np.array(
+        [NO_DUE if stats._next_due is None else date.fromisoformat(stats._next_due).toordinal()
+         for stats in card_stats], dtype="<i4")
+    for name, dtype in STATS_COLUMNS.items():
+        sections["card." + name] = np.array([getattr(stats, "_" + name) for stats in card_stats], dtype=dtype)
+
+    for side in ("front", "back"):
+        encoded = [_text(card, side).encode("utf-8") for card in cards]
+        offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        sections[f"text.{side}.offsets"] = offsets
+        sections[f"text.{side}"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    header = {
+        "version": 1,
+        "user": {"id": user.get_id(), "name": user.get_name(), "join_date": user._join_date.timestamp(),
+                 "rollup": _rollup_sections("user", user.get_user_stats().get_rollup(), sections)},
+        "decks": decks,
+        "types": types,
+        "cards": len(cards),
+        "sections": {},
+    }
+
+    # Offsets depend on the header length, which depends on the offsets;
+    # reserving room for the widest offsets settles it in one pass
+    layout = []
+    offset = 0
+    for name, array in sections.items():
+        array = np.ascontiguousarray(array)
+        layout.append((name, array, offset))
+        header["sections"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes) + 16 * len(sections)) // ALIGN) * ALIGN
+    for name, _, section_offset in layout:
+        header["sections"][name]["offset"] = data_start + section_offset
+    header_bytes = json.dumps(header).encode("utf-8")
+    if len(MAGIC) + 8 + len(header_bytes) > data_start:
+        raise ValueError(f"Snapshot header of {len(header_bytes)} bytes overruns its reserved space")
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        for name, array, section_offset in layout:
+            f.seek(data_start + section_offset)
+            f.write(array.tobytes())
+    return len(cards)
+
+
+class Snapshot:
+    """Read access to a snapshot file through a read-only memory map.
+
+    Opening parses only the header; every section is a zero-copy view of
+    the mapping. Cards are built the first time they are asked for and
+    cached, so loading one deck touches only that deck's rows.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._map = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(self._map[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a MindGarden snapshot")
+        header_length = int.from_bytes(bytes(self._map[len(MAGIC):len(MAGIC) + 8]), "little")
+        start = len(MAGIC) + 8
+        self._header = json.loads(bytes(self._map[start:start + header_length]))
+        self._decks = {deck["name"]: deck for deck in self._header["decks"]}
+        self._types = self._header["types"]
+        self._sections = {}
+        self._cards = {}
+
+    def section(self, name):
+        view = self._sections.get(name)
+        if view is None:
+            meta = self._header["sections"][name]
+            dtype = np.dtype(meta["dtype"])
+            count = int(np.prod(meta["shape"], dtype=np.int64))
+            view = self._map[meta["offset"]:meta["offset"] + count * dtype.itemsize].view(dtype)
+            view = self._sections[name] = view.reshape(meta["shape"])
+        return view
+
+    def __len__(self):
+        return self._header["cards"]
+
+    def get_deck_names(self):
+        return list(self._decks)
+
+    def _deck(self, name):
+        deck = self._decks.get(name)
+        if deck is None:
+            raise KeyError(f"No deck named {name!r} in snapshot")
+        return deck
+
+    def get_deck_stats(self, name):
+        """The deck's DeckStats fields as a dict, without touching its cards."""
+        return dict(self._deck(name)["stats"])
+
+    def count_due(self, name, due_date):
+        """Scheduled cards in deck name due on or before due_date."""
+        deck = self._deck(name)
+        due = self.section("card.due_day")[deck["start"] + deck["new"]:deck["end"]]
+        return int(np.searchsorted(due, to_day_ordinal(due_date), side="right"))
+
+    def _texts(self, side, start, end):
+        offsets = self.section(f"text.{side}.offsets")[start:end + 1].tolist()
+        base = offsets[0]
+        blob = bytes(self.section(f"text.{side}")[base:offsets[-1]])
+        return [blob[a - base:b - base].decode("utf-8") for a, b in zip(offsets, offsets[1:])]
+
+    def _build(self, start, end):
+        """Builds the cards of rows start:end that are not built yet."""
+        rows = slice(start, end)
+        types = self.section("card.type")[rows].tolist()
+        ids = self.section("card.id")[rows].tolist()
+        reversed_rows = self.section("card.reversed")[rows].tolist()
+        next_due = self.section("card.next_due")[rows].tolist()
+        columns = [self.section("card." + name)[rows].tolist() for name in STATS_COLUMNS]
+        fronts, backs = self._texts("front", start, end), self._texts("back", start, end)
+        due_strings = {NO_DUE: None}
+
+        built = []
+        for k in range(end - start):
+            if start + k in self._cards:
+                continue
+            (date_added, last_review_time, interval, review_count, difficulty_sum, ease, response_time_sum,
+             last_response_time, very_easy_count, success_count, char_count) = (column[k] for column in columns)
+            card = Card(self._types[types[k]], fronts[k], backs[k], date_added)
+            if ids[k] >= 0:
+                card._id = ids[k]
+            stats = card._stats
+            stats._last_review_time = last_review_time
+            stats._interval = interval
+            stats._review_count = review_count
+            stats._difficulty_sum = difficulty_sum
+            stats._ease = ease
+            stats._response_time_sum = response_time_sum
+            stats._last_response_time = last_response_time
+            stats._very_easy_count = very_easy_count
+            stats._success_count = success_count
+            stats._char_count = char_count
+            day = next_due[k]
+            if day not in due_strings:
+                due_strings[day] = date.fromordinal(day).strftime("%Y-%m-%d")
+            stats._next_due = due_strings[day]
+            self._cards[start + k] = card
+            built.append(k)
+
+        # Links last, so a reversed card later in the range is already built
+        for k in built:
+            if reversed_rows[k] >= 0:
+                self._cards[start + k]._reversed_card = self.card(reversed_rows[k])
+
+    def card(self, i):
+        """Card at row i, built on first access."""
+        card = self._cards.get(i)
+        if card is None:
+            self._build(i, i + 1)
+            card = self._cards[i]
+        return card
+
+    def iter_due(self, name, due_date):
+        """Yields the cards of deck name due on or before due_date, oldest first."""
+        deck = self._deck(name)
+        first = deck["start"] + deck["new"]
+        end = first + self.count_due(name, due_date)
+        self._build(first, end)
+        for i in range(first, end):
+            yield self._cards[i]
+
+    def _restore_rollup(self, rollup, prefix, meta):
+        state = {key: meta[key] for key in ("reviews", "successes", "time_studied", "difficulty_hist")}
+        for period in ("hourly", "daily"):
+            state[period] = {"origin": meta[period + "_origin"]}
+            for name in ("reviews", "successes", "time_studied", "difficulty_hist"):
+                state[period][name] = self.section(f"{prefix}.{period}.{name}")
+        rollup.set_state(state)
+
+    def load_deck(self, name):
+        """A full Deck for name, building only that deck's cards."""
+        meta = self._deck(name)
+        deck = Deck(name)
+        deck.set_id(meta["id"])
+        stats = deck.get_deck_stats()
+        for field, value in meta["stats"].items():
+            setattr(stats, "_" + field, value)
+        deck_index = self._header["decks"].index(meta)
+        self._restore_rollup(stats.get_rollup(), f"deck{deck_index}", meta["rollup"])
+
+        start, new, end = meta["start"], meta["start"] + meta["new"], meta["end"]
+        self._build(start, end)
+        cards = self._cards
+        deck.get_new_cards_deck().queue_cards([cards[i] for i in range(start, new)])
+        study_deck = deck.get_study_deck()
+        for i, day in enumerate(self.section("card.due_day")[new:end].tolist(), new):
+            study_deck.add_card(day, cards[i])
+        return deck
+
+    def to_user(self):
+        """Restores the whole user with every deck loaded."""
+        meta = self._header["user"]
+        user = User()
+        user.set_id(meta["id"])
+        user.set_name(meta["name"])
+        user._join_date = datetime.fromtimestamp(meta["join_date"])
+        for name in self._decks:
+            user.add_deck(self.load_deck(name))
+        self._restore_rollup(user.get_user_stats().get_rollup(), "user", meta["rollup"])
+        return user
+
+
+def load_snapshot(path):
+    """Shorthand for Snapshot(path).to_user()."""
+    return Snapshot(path).to_user()
@@ -0,0 +1,567 @@
+from contextlib import contextmanager
+from datetime import date, datetime
+import re
+import sqlite3
+import time
+
+import numpy as np
+
+from models import Card, Deck, DeckHandle, DeckStats, User, to_day_ordinal
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    join_date REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS decks (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id),
+    name TEXT NOT NULL,
+    date_added TEXT,
+    card_count INTEGER,
+    total_reviews INTEGER,
+    time_studied REAL,
+    difficulty_sum INTEGER,
+    avg_difficulty REAL,
+    max_new INTEGER,
+    deck_ease REAL
+);
+
+CREATE TABLE IF NOT EXISTS cards (
+    id INTEGER PRIMARY KEY,
+    deck_id INTEGER NOT NULL REFERENCES decks(id),
+    type TEXT,
+    front,
+    back,
+    reversed_id INTEGER,
+    new_position INTEGER,
+    date_added REAL,
+    last_review_time REAL,
+    interval INTEGER,
+    next_due INTEGER,
+    review_count INTEGER,
+    difficulty_sum INTEGER,
+    ease REAL,
+    response_time_sum REAL,
+    last_response_time REAL,
+    very_easy_count INTEGER,
+    success_count INTEGER,
+    char_count INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS daily_queues (
+    deck_id INTEGER NOT NULL REFERENCES decks(id),
+    day INTEGER NOT NULL,
+    user_id INTEGER,
+    due BLOB NOT NULL,
+    new BLOB NOT NULL,
+    PRIMARY KEY (deck_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS rollover_shards (
+    day INTEGER NOT NULL,
+    shards INTEGER NOT NULL,
+    shard INTEGER NOT NULL,
+    users INTEGER,
+    completed_at REAL,
+    PRIMARY KEY (day, shards, shard)
+);
+
+-- Covers the due queries: load_schedule and due_ids never touch the table rows
+CREATE INDEX IF NOT EXISTS cards_deck_schedule
+    ON cards(deck_id, next_due, interval, ease, review_count, new_position);
+CREATE INDEX IF NOT EXISTS decks_user ON decks(user_id);
+"""
+
+# Stored in PRAGMA user_version. Databases written before it was set report 0
+# and are treated as version 1.
+SCHEMA_VERSION = 2
+
+# Statements that bring a database from version n - 1 to n. Tables added
+# since version 1 need no entry: SCHEMA creates them if they are missing.
+# An ADD COLUMN is skipped if the column exists, as it does in unversioned
+# databases written after the column was added to SCHEMA.
+MIGRATIONS = {
+    2: (
+        "ALTER TABLE cards ADD COLUMN last_response_time REAL",
+        "ALTER TABLE cards ADD COLUMN success_count INTEGER",
+        "DROP INDEX IF EXISTS cards_deck_next_due",
+    ),
+}
+ADD_COLUMN_RE = re.compile(r"ALTER TABLE (\w+) ADD COLUMN (\w+)")
+
+# Column order shared by the insert and full-update statements
+CARD_COLUMNS = (
+    "deck_id", "type", "front", "back", "new_position", "date_added",
+    "last_review_time", "interval", "next_due", "review_count", "difficulty_sum",
+    "ease", "response_time_sum", "last_response_time", "very_easy_count", "success_count",
+    "char_count"
+)
+
+INSERT_CARD = (
+    f"INSERT INTO cards (id, {', '.join(CARD_COLUMNS)}) "
+    f"VALUES (?, {', '.join('?' * len(CARD_COLUMNS))})"
+)
+UPDATE_CARD = (
+    f"UPDATE cards SET {', '.join(c + ' = ?' for c in CARD_COLUMNS)} WHERE id = ?"
+)
+UPDATE_REVIEWED_CARD = (
+    "UPDATE cards SET new_position = NULL, last_review_time = ?, interval = ?, "
+    "next_due = ?, review_count = ?, difficulty_sum = ?, ease = ?, "
+    "response_time_sum = ?, last_response_time = ?, very_easy_count = ?, "
+    "success_count = ? WHERE id = ?"
+)
+UPDATE_REVERSED = "UPDATE cards SET reversed_id = ? WHERE id = ?"
+
+DECK_COLUMNS = (
+    "user_id", "name", "date_added", "card_count", "total_reviews", "time_studied",
+    "difficulty_sum", "avg_difficulty", "max_new", "deck_ease"
+)
+INSERT_DECK = f"INSERT INTO decks ({', '.join(DECK_COLUMNS)}) VALUES ({', '.join('?' * len(DECK_COLUMNS))})"
+UPDATE_DECK = f"UPDATE decks SET {', '.join(c + ' = ?' for c in DECK_COLUMNS)} WHERE id = ?"
+UPDATE_DECK_STATS = (
+    "UPDATE decks SET card_count = ?, total_reviews = ?, time_studied = ?, "
+    "difficulty_sum = ?, avg_difficulty = ? WHERE id = ?"
+)
+
+SELECT_SCHEDULE = (
+    "SELECT id, next_due, interval, ease, review_count FROM cards "
+    "WHERE deck_id = ? AND next_due <= ? ORDER BY next_due"
+)
+SELECT_DUE_IDS = (
+    "SELECT id FROM cards WHERE deck_id = ? AND next_due <= ? AND new_position IS NULL "
+    "ORDER BY next_due, id"
+)
+SELECT_NEW_IDS = (
+    "SELECT id FROM cards WHERE deck_id = ? AND new_position IS NOT NULL "
+    "ORDER BY new_position LIMIT ?"
+)
+QUEUE_DTYPE = "<i8"
+
+
+class Storage:
+    """SQLite persistence for users, decks, cards and their stats.
+
+    The database runs in WAL mode so readers never block the writer, every
+    write goes through a small set of constant SQL strings that sqlite3 keeps
+    prepared in its statement cache, and a study session is committed as one
+    executemany() inside a single transaction.
+    """
+
+    def __init__(self, path="mindgarden.db", check_same_thread=True):
+        self._conn = sqlite3.connect(path, isolation_level=None, cached_statements=256,
+                                     check_same_thread=check_same_thread)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._migrate()
+        self._conn.executescript(SCHEMA)
+
+    def _migrate(self):
+        """Upgrades a database written by an older version to SCHEMA_VERSION."""
+        with self._transaction() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                return
+            if version == 0 and conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cards'").fetchone():
+                version = 1
+            # A new database gets the current schema straight from SCHEMA
+            if version:
+                for step in range(version + 1, SCHEMA_VERSION + 1):
+                    for statement in MIGRATIONS[step]:
+                        added = ADD_COLUMN_RE.match(statement)
+                        if added and added[2] in _table_columns(conn, added[1]):
+                            continue
+                        conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Saving
+
+    def save_user(self, user):
+        with self._transaction() as conn:
+            row = (user.get_name(), user._join_date.timestamp())
+            if user.get_id() is None:
+                user.set_id(conn.execute("INSERT INTO users (name, join_date) VALUES (?, ?)", row).lastrowid)
+            else:
+                conn.execute("UPDATE users SET name = ?, join_date = ? WHERE id = ?", row + (user.get_id(),))
+
+            # Decks that aren't loaded were saved when they were evicted,
+            # maybe before the user had an id
+            conn.executemany("UPDATE decks SET user_id = ? WHERE id = ?", [
+                (user.get_id(), handle.get_id()) for handle in user.iter_deck_handles()
+                if not handle.is_loaded() and handle.get_id() is not None
+            ])
+            for deck in user.iter_loaded_decks():
+                self._save_deck(conn, deck, user.get_id())
+
+    def save_deck(self, deck, user_id=None):
+        """Writes the deck row and every card in it."""
+        with self._transaction() as conn:
+            self._save_deck(conn, deck, user_id)
+
+    def _save_deck(self, conn, deck, user_id):
+        rows, cards = deck_rows(deck, user_id)
+        apply_deck_ids(deck, cards, self._write_deck_rows(conn, rows))
+        deck.set_dirty(False)
+
+    def write_deck_rows(self, rows):
+        """Writes rows from deck_rows() in one transaction. Returns the ids for apply_deck_ids().
+
+        Touches no model objects, so it can run on a thread that doesn't own the deck.
+        """
+        with self._transaction() as conn:
+            return self._write_deck_rows(conn, rows)
+
+    def _write_deck_rows(self, conn, rows):
+        deck_id, deck_row, card_rows = rows
+        if deck_id is None:
+            deck_id = conn.execute(INSERT_DECK, deck_row).lastrowid
+        else:
+            conn.execute(UPDATE_DECK, deck_row + (deck_id,))
+
+        # Ids are handed out here so new cards go in with one executemany
+        next_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM cards").fetchone()[0]
+        card_ids = []
+        inserts = []
+        updates = []
+        for card_id, row, _, _ in card_rows:
+            if card_id is None:
+                card_id = next_id
+                next_id += 1
+                inserts.append((card_id, deck_id) + row)
+            else:
+                updates.append((deck_id,) + row + (card_id,))
+            card_ids.append(card_id)
+
+        conn.executemany(INSERT_CARD, inserts)
+        conn.executemany(UPDATE_CARD, updates)
+        conn.executemany(UPDATE_REVERSED, [
+            (card_ids[reversed_index] if reversed_index is not None else reversed_id, card_id)
+            for card_id, (_, _, reversed_index, reversed_id) in zip(card_ids, card_rows)
+            if reversed_index is not None or reversed_id is not None
+        ])
+        return deck_id, card_ids
+
+    def save_new_cards(self, deck, cards):
+        """Inserts cards just appended to the deck's new cards queue, e.g. by Deck.add_cards.
+
+        Only those rows and the deck's card count are written, so a large
+        import can be committed chunk by chunk.
+        """
+        if deck.get_id() is None:
+            self.save_deck(deck)
+            return
+
+        with self._transaction() as conn:
+            next_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM cards").fetchone()[0]
+            position = conn.execute("SELECT COALESCE(MAX(new_position), -1) + 1 FROM cards WHERE deck_id = ?",
+                                    (deck.get_id(),)).fetchone()[0]
+            inserts = []
+            for i, card in enumerate(cards):
+                card.set_id(next_id + i)
+                inserts.append((card.get_id(), deck.get_id()) + _card_row(card, position + i))
+
+            conn.executemany(INSERT_CARD, inserts)
+            conn.executemany(UPDATE_REVERSED, [
+                (card.get_reversed_card().get_id(), card.get_id())
+                for card in cards if card.get_reversed_card() is not None
+            ])
+            conn.execute("UPDATE decks SET card_count = ? WHERE id = ?",
+                         (deck.get_deck_stats()._card_count, deck.get_id()))
+
+    def save_session(self, deck, cards):
+        """Commits the outcome of one study session in a single transaction."""
+        if not can_save_session(deck, cards):
+            self.save_deck(deck)
+            return
+
+        # The deck stays dirty: cards added since its last full save are not in these rows
+        self.write_session_rows(session_rows(deck, cards))
+
+    def write_session_rows(self, rows):
+        """Writes rows from session_rows() in one transaction, touching no model objects."""
+        deck_id, review_rows, stats_row = rows
+        with self._transaction() as conn:
+            conn.executemany(UPDATE_REVIEWED_CARD, review_rows)
+            conn.execute(UPDATE_DECK_STATS, stats_row + (deck_id,))
+
+    # Loading
+
+    def load_user(self, user_id, lazy=False, max_decks=None, max_cards=None):
+        """Loads a user and its decks.
+
+        With lazy=True only the deck rows are read; each deck's cards are
+        loaded the first time User.get_deck asks for it. max_decks and
+        max_cards set the user's deck budget (see User.set_deck_budget), so
+        this storage must stay open while the user is in use.
+        """
+        row = self._conn.execute("SELECT name, join_date FROM users WHERE id = ?", (user_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"No user with id {user_id}")
+
+        user = User()
+        user.set_id(user_id)
+        user.set_name(row[0])
+        user._join_date = datetime.fromtimestamp(row[1])
+        user.set_storage(self)
+        user.set_deck_budget(max_decks, max_cards)
+        if not lazy:
+            for (deck_id,) in self._conn.execute("SELECT id FROM decks WHERE user_id = ? ORDER BY id", (user_id,)).fetchall():
+                user.add_deck(self.load_deck(deck_id))
+            return user
+
+        for row in self._conn.execute(
+            f"SELECT id, {', '.join(DECK_COLUMNS[1:])} FROM decks WHERE user_id = ? ORDER BY id", (user_id,)
+        ).fetchall():
+            stats = DeckStats()
+            _set_deck_stats(stats, row[2:])
+            user.add_deck_handle(DeckHandle(row[1], deck_id=row[0], stats=stats, storage=self))
+        return user
+
+    def load_deck(self, deck_id):
+        row = self._conn.execute(f"SELECT {', '.join(DECK_COLUMNS)} FROM decks WHERE id = ?", (deck_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"No deck with id {deck_id}")
+
+        deck = Deck(row[1])
+        deck.set_id(deck_id)
+        _set_deck_stats(deck.get_deck_stats(), row[2:])
+
+        cards = {}
+        reversed_links = []
+        scheduled = []
+        new_cards = []
+        for row in self._conn.execute(
+            f"SELECT id, reversed_id, {', '.join(CARD_COLUMNS[1:])} FROM cards WHERE deck_id = ? ORDER BY id",
+            (deck_id,)
+        ):
+            card = _card_from_row(row)
+            cards[row[0]] = card
+            if row[1] is not None:
+                reversed_links.append((card, row[1]))
+            if row[5] is not None:
+                new_cards.append((row[5], card))
+            elif row[9] is not None:
+                scheduled.append((row[9], card))
+
+        for card, reversed_id in reversed_links:
+            card._reversed_card = cards.get(reversed_id)
+        for _, card in sorted(new_cards, key=lambda item: item[0]):
+            deck.get_new_cards_deck().queue_card(card)
+        for day, card in scheduled:
+            deck.get_study_deck().add_card(day, card)
+
+        deck.set_storage(self)
+        return deck
+
+    def iter_card_texts(self, deck_id, chunk_size=10_000):
+        """Streams (type, front, back, has_reversed) for a deck's cards in id order.
+
+        Reversed cards are skipped; has_reversed marks the cards they belong to.
+        Rows are fetched chunk_size at a time without building Card objects.
+        """
+        cursor = self._conn.execute(
+            "SELECT type, front, back, reversed_id IS NOT NULL FROM cards "
+            "WHERE deck_id = ? AND type IS NOT 'reversed' ORDER BY id",
+            (deck_id,)
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+
+    def load_schedule(self, deck_id, up_to):
+        """(id, next_due, interval, ease, review_count) rows due on or before up_to.
+
+        Only the columns the scheduler needs are read, all of them from the
+        cards_deck_schedule index.
+        """
+        return self._conn.execute(SELECT_SCHEDULE, (deck_id, to_day_ordinal(up_to))).fetchall()
+
+    # Daily queues
+
+    def shard_decks(self, shards, shard):
+        """(deck_id, user_id, max_new) of every deck whose user_id % shards == shard.
+
+        Decks without a user go to shard 0.
+        """
+        return self._conn.execute(
+            "SELECT id, user_id, max_new FROM decks WHERE COALESCE(user_id, 0) % ? = ? ORDER BY user_id, id",
+            (shards, shard)
+        ).fetchall()
+
+    def due_ids(self, deck_id, day):
+        """Ids of the deck's scheduled cards due on or before day, oldest due first."""
+        return [card_id for (card_id,) in self._conn.execute(SELECT_DUE_IDS, (deck_id, to_day_ordinal(day)))]
+
+    def new_ids(self, deck_id, limit):
+        """Ids of the first limit cards in the deck's new cards queue."""
+        return [card_id for (card_id,) in self._conn.execute(SELECT_NEW_IDS, (deck_id, limit))]
+
+    def save_daily_queues(self, day, queues, shard=None):
+        """Stores (deck_id, user_id, due_ids, new_ids) queues for day as int64 blobs.
+
+        shard, a (shards, shard, users) triple, is marked complete in the
+        same transaction, so a shard is either fully written or not at all.
+        """
+        day = to_day_ordinal(day)
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO daily_queues (deck_id, day, user_id, due, new) VALUES (?, ?, ?, ?, ?)",
+                [(deck_id, day, user_id, np.asarray(due, dtype=QUEUE_DTYPE).tobytes(),
+                  np.asarray(new, dtype=QUEUE_DTYPE).tobytes())
+                 for deck_id, user_id, due, new in queues]
+            )
+            if shard is not None:
+                conn.execute("INSERT OR REPLACE INTO rollover_shards VALUES (?, ?, ?, ?, ?)",
+                             (day,) + tuple(shard) + (time.time(),))
+
+    def load_daily_queue(self, deck_id, day):
+        """(due_ids, new_ids) int64 arrays stored for deck_id and day, or None."""
+        row = self._conn.execute("SELECT due, new FROM daily_queues WHERE deck_id = ? AND day = ?",
+                                 (deck_id, to_day_ordinal(day))).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=QUEUE_DTYPE), np.frombuffer(row[1], dtype=QUEUE_DTYPE)
+
+    def completed_shards(self, day, shards):
+        return {shard for (shard,) in self._conn.execute(
+            "SELECT shard FROM rollover_shards WHERE day = ? AND shards = ?", (to_day_ordinal(day), shards))}
+
+    def prune_daily_queues(self, before):
+        """Drops queues and shard records for days before before."""
+        before = to_day_ordinal(before)
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM daily_queues WHERE day < ?", (before,))
+            conn.execute("DELETE FROM rollover_shards WHERE day < ?", (before,))
+
+
+def deck_rows(deck, user_id=None):
+    """Snapshot of everything save_deck writes for deck, as plain tuples.
+
+    Returns (rows, cards): rows go to Storage.write_deck_rows, possibly on
+    another thread, and cards, the Card objects in row order, stay with the
+    caller for apply_deck_ids. Each card row is (card id, columns, index of
+    its reversed card in the rows or None, the reversed card's id if it isn't
+    in the deck).
+    """
+    cards = [(card, i) for i, card in enumerate(deck.get_new_cards_deck().get_deck())]
+    cards.extend((card, None) for card, _ in deck.get_study_deck().items())
+    index = {card: i for i, (card, _) in enumerate(cards)}
+
+    card_rows = []
+    for card, position in cards:
+        reversed_card = card.get_reversed_card()
+        reversed_index = index.get(reversed_card) if reversed_card is not None else None
+        reversed_id = reversed_card.get_id() if reversed_card is not None and reversed_index is None else None
+        card_rows.append((card.get_id(), _card_row(card, position), reversed_index, reversed_id))
+
+    deck_row = (user_id, deck.get_name()) + _deck_stats_row(deck.get_deck_stats())
+    return (deck.get_id(), deck_row, card_rows), [card for card, _ in cards]
+
+
+def apply_deck_ids(deck, cards, ids):
+    """Gives deck and cards the ids write_deck_rows returned for them."""
+    deck_id, card_ids = ids
+    deck.set_id(deck_id)
+    for card, card_id in zip(cards, card_ids):
+        card.set_id(card_id)
+
+
+def can_save_session(deck, cards):
+    """False if the deck or one of the cards was never saved, so save_deck is needed instead."""
+    return deck.get_id() is not None and all(card.get_id() is not None for card in cards)
+
+
+def session_rows(deck, cards):
+    """Snapshot of what save_session writes, as plain tuples for Storage.write_session_rows."""
+    return (deck.get_id(), [_review_row(card) for card in cards],
+            _deck_stats_row(deck.get_deck_stats())[1:6])
+
+
+def _table_columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _deck_stats_row(stats):
+    return (
+        stats._date_added, stats._card_count, stats._total_reviews, stats._time_studied,
+        stats._difficulty_sum, stats._avg_difficulty, stats._max_new, stats._deck_ease
+    )
+
+
+def _set_deck_stats(stats, row):
+    (stats._date_added, stats._card_count, stats._total_reviews, stats._time_studied,
+     stats._difficulty_sum, stats._avg_difficulty, stats._max_new, stats._deck_ease) = row
+
+
+def _next_due_ordinal(stats):
+    return to_day_ordinal(stats._next_due) if stats._next_due is not None else None
+
+
+def _card_row(card, position):
+    """CARD_COLUMNS after deck_id; the writer puts the deck's id in front."""
+    stats = card._stats
+    return (
+        card.get_type(), card.get_front(), card.get_back(), position,
+        stats._date_added, stats._last_review_time, stats._interval, _next_due_ordinal(stats),
+        stats._review_count, stats._difficulty_sum, stats._ease, stats._response_time_sum,
+        stats._last_response_time, stats._very_easy_count, stats._success_count, stats._char_count
+    )
+
+
+def _review_row(card):
+    stats = card._stats
+    return (
+        stats._last_review_time, stats._interval, _next_due_ordinal(stats), stats._review_count,
+        stats._difficulty_sum, stats._ease, stats._response_time_sum, stats._last_response_time,
+        stats._very_easy_count, stats._success_count, card.get_id()
+    )
+
+
+def _card_from_row(row):
+    (card_id, _, card_type, front, back, _, date_added, last_review_time, interval,
+     next_due, review_count, difficulty_sum, ease, response_time_sum, last_response_time,
+     very_easy_count, success_count, char_count) = row
+
+    card = Card(card_type)
+    card.set_id(card_id)
+    card._front = front
+    card._back = back
+
+    stats = card._stats
+    stats._date_added = date_added
+    stats._last_review_time = last_review_time
+    stats._interval = interval
+    stats._next_due = date.fromordinal(next_due).strftime("%Y-%m-%d") if next_due is not None else None
+    stats._review_count = review_count
+    stats._difficulty_sum = difficulty_sum
+    stats._ease = ease
+    stats._response_time_sum = response_time_sum
+    stats._last_response_time = last_response_time
+    stats._very_easy_count = very_easy_count
+    stats._success_count = success_count
+    stats._char_count = char_count
+    return card
@@ -0,0 +1,292 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import random
+import time
+
+import numpy as np
+
+from models import Card, Deck, User
+from session_planner import SessionPlanner
+from storage import apply_deck_ids, can_save_session, deck_rows, session_rows
+
+
+class StudySession:
+    __slots__ = ("_id", "_user", "_planner", "_current", "_shown_at", "_last_active",
+                 "_deck_totals")
+
+    def __init__(self, session_id, user, planner):
+        self._id = session_id
+        self._user = user
+        self._planner = planner
+        self._current = None
+        self._shown_at = None
+        self._last_active = time.monotonic()
+        # deck -> [elapsed_time, difficulty_sum, review_count]
+        self._deck_totals = {}
+
+    def touch(self):
+        self._last_active = time.monotonic()
+
+    def get_id(self):
+        return self._id
+
+
+class StudyEngine:
+    """Serves many concurrent study sessions from one asyncio event loop.
+
+    start_session / next_card / grade / end_session are coroutines that only
+    touch in-memory state, so grading costs one SM-2 update. Rescheduled cards
+    are handed to a background writer task that groups them per deck, copies
+    their rows into plain tuples on the event loop and commits those on a
+    single worker thread, so SQLite never blocks the loop and the thread
+    never reads cards or decks the loop is changing. Sessions idle for
+    longer than idle_timeout seconds are ended by a reaper task.
+
+    A failed write is raised from the next grade(), end_session() or
+    stop(); the cards stay rescheduled in memory and are written by the next
+    save of their deck. A Storage passed in must be created with
+    check_same_thread=False; the writer thread is the only one that uses it.
+    """
+
+    def __init__(self, storage=None, idle_timeout=900, reap_interval=30, max_cards=None):
+        self._storage = storage
+        self._idle_timeout = idle_timeout
+        self._reap_interval = reap_interval
+        self._max_cards = max_cards
+        self._sessions = {}
+        self._user_sessions = {}
+        self._ids = itertools.count(1)
+        self._writes = None
+        self._tasks = []
+        self._error = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="study-writer")
+
+    async def start(self):
+        self._writes = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._writer()), asyncio.create_task(self._reaper())]
+        return self
+
+    async def stop(self):
+        for session_id in list(self._sessions):
+            self._end_session(session_id)
+        await self._writes.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def get_session_count(self):
+        return len(self._sessions)
+
+    async def start_session(self, user, max_cards=None):
+        """Starts (or resumes) the user's session and returns its id."""
+        if user in self._user_sessions:
+            return self._user_sessions[user]
+
+        session_id = next(self._ids)
+        # The storage belongs to the writer thread, so stored daily queues aren't read here
+        planner = SessionPlanner(user, max_cards=max_cards if max_cards is not None else self._max_cards,
+                                 daily_queues=False)
+        self._sessions[session_id] = StudySession(session_id, user, planner)
+        self._user_sessions[user] = session_id
+        return session_id
+
+    def _get(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise KeyError(f"No active session {session_id}")
+        session.touch()
+        return session
+
+    async def next_card(self, session_id):
+        """Front, back and deck name of the next card, or None when the session is done."""
+        session = self._get(session_id)
+        if session._current is None:
+            session._current = session._planner.next_card()
+            if session._current is None:
+                return None
+            session._shown_at = time.time()
+
+        deck, card = session._current
+        return {"deck": deck.get_name(), "front": card.get_front(), "back": card.get_back()}
+
+    async def grade(self, session_id, difficulty):
+        """Grades the card last returned by next_card. Returns its next due date."""
+        self._raise_error()
+        session = self._get(session_id)
+        if session._current is None:
+            raise ValueError("No card to grade; call next_card first")
+
+        deck, card = session._current
+        start_time, end_time = session._shown_at, time.time()
+        session._current = None
+
+        totals = session._deck_totals.setdefault(deck, [0.0, 0, 0])
+        totals[0] += end_time - start_time
+        totals[1] += difficulty
+        totals[2] += 1
+
+        if deck.grade_card(card, difficulty, start_time, end_time):
+            session._planner.requeue(deck, card)
+            return None
+
+        session._planner.mark_done(card)
+        self._writes.put_nowait((session._user.get_id(), deck, card))
+        return card.get_next_due()
+
+    async def end_session(self, session_id):
+        """Closes the session, folds its totals into deck stats and returns them."""
+        self._raise_error()
+        return self._end_session(session_id)
+
+    def _end_session(self, session_id):
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return None
+        del self._user_sessions[session._user]
+        session._planner.close()
+
+        summary = {}
+        for deck, (elapsed_time, difficulty_sum, review_count) in session._deck_totals.items():
+            deck.update_stats(elapsed_time, difficulty_sum, review_count)
+            # An empty batch still writes the updated deck stats
+            self._writes.put_nowait((session._user.get_id(), deck, None))
+            summary[deck.get_name()] = review_count
+        return summary
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._writes.get()]
+            while not self._writes.empty():
+                batch.append(self._writes.get_nowait())
+
+            by_deck = {}
+            for user_id, deck, card in batch:
+                cards = by_deck.setdefault((user_id, deck), [])
+                if card is not None:
+                    cards.append(card)
+
+            try:
+                if self._storage is not None:
+                    await self._save(loop, by_deck)
+            except Exception as e:
+                # Keep serving; the error reaches the next caller
+                self._error = e
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+
+    async def _save(self, loop, by_deck):
+        # Rows are built here, on the loop, the only thread that changes cards and decks
+        sessions = []
+        full_saves = []
+        for (user_id, deck), cards in by_deck.items():
+            if can_save_session(deck, cards):
+                sessions.append(session_rows(deck, cards))
+            else:
+                rows, saved_cards = deck_rows(deck, user_id)
+                full_saves.append((deck, saved_cards, rows))
+
+        ids = await loop.run_in_executor(self._executor, self._write, sessions,
+                                         [rows for _, _, rows in full_saves])
+        for (deck, saved_cards, _), deck_ids in zip(full_saves, ids):
+            apply_deck_ids(deck, saved_cards, deck_ids)
+
+    def _write(self, sessions, full_saves):
+        for rows in sessions:
+            self._storage.write_session_rows(rows)
+        return [self._storage.write_deck_rows(rows) for rows in full_saves]
+
+    async def _reaper(self):
+        while True:
+            await asyncio.sleep(self._reap_interval)
+            cutoff = time.monotonic() - self._idle_timeout
+            for session_id, session in list(self._sessions.items()):
+                if session._last_active < cutoff:
+                    self._end_session(session_id)
+
+
+def _make_user(decks, cards_per_deck):
+    user = User()
+    for k in range(decks):
+        deck = Deck(f"deck {k}")
+        for i in range(cards_per_deck):
+            card = Card()
+            card.set_front(f"front {i}")
+            card.set_back(f"back {i}")
+            deck.add_card(card)
+        user.add_deck(deck)
+    return user
+
+
+async def load_test(sessions=2000, concurrency=500, decks=3, cards_per_deck=20, storage=None):
+    """Runs simulated learners through the engine and reports throughput.
+
+    Each learner starts a session, grades every card it is shown with a
+    random difficulty and ends the session. Returns sessions/s and grade
+    latency percentiles.
+    """
+    users = [_make_user(decks, cards_per_deck) for _ in range(sessions)]
+    if storage is not None:
+        for user in users:
+            storage.save_user(user)
+    latencies = []
+    gate = asyncio.Semaphore(concurrency)
+    rng = random.Random(57)
+
+    async def learner(engine, user):
+        async with gate:
+            session_id = await engine.start_session(user)
+            while await engine.next_card(session_id) is not None:
+                # Yield so sessions interleave like real clients would
+                await asyncio.sleep(0)
+                start = time.perf_counter()
+                await engine.grade(session_id, rng.choice((1, 2, 3, 3, 4)))
+                latencies.append(time.perf_counter() - start)
+            await engine.end_session(session_id)
+
+    start = time.perf_counter()
+    async with StudyEngine(storage) as engine:
+        await asyncio.gather(*(learner(engine, user) for user in users))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "sessions": sessions,
+        "grades": len(latencies),
+        "seconds": elapsed,
+        "sessions_per_s": sessions / elapsed,
+        "grades_per_s": len(latencies) / elapsed,
+        "grade_p50_ms": float(np.percentile(latencies, 50)),
+        "grade_p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    from pathlib import Path
+
+    from storage import Storage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(Path(tmp) / "load_test.db", check_same_thread=False)
+        users_per_run = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+        result = asyncio.run(load_test(sessions=users_per_run, storage=storage))
+        storage.close()
+    for key, value in result.items():
+        print(f"{key:<16} {value:,.3f}" if isinstance(value, float) else f"{key:<16} {value:,}")
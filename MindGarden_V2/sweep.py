@@ -0,0 +1,256 @@
+"""Grid or random search over FlashcardModel architectures and training settings.
+
+    python sweep.py data/ --epochs 20 --workers 4
+    python sweep.py data/ --search random --trials 30 --width 16 32 64 128 --depth 1 2 3
+
+data/ holds features.npy and labels.npy (see train_setup.write_synthetic_dataset,
+or pass --generate N to write N synthetic cards there first). Every config is
+trained in its own worker process with torch limited to a few threads, so the
+pool never asks for more cores than the machine has. Finished results are
+appended to a JSON lines cache keyed by a hash of the config, the training
+settings and the dataset, and configs already in it are not run again.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import contextlib
+import hashlib
+import io
+from itertools import product
+import json
+import os
+from pathlib import Path
+import sys
+import time
+
+import numpy as np
+
+SEARCH_SPACE = {
+    "width": [16, 32, 64],
+    "depth": [1, 2, 3],
+    "activation": ["sigmoid", "tanh", "relu"],
+    "lr": [0.01, 0.003],
+    "batch_size": [256, 1024],
+}
+LATENCY_BATCH = 256
+# Bumped when run_config's result fields change, so older cached results are rerun
+RESULTS_VERSION = 3
+
+
+def grid(space=SEARCH_SPACE):
+    """Every combination of the values in space, as config dicts."""
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in product(*(space[key] for key in keys))]
+
+
+def random_configs(space=SEARCH_SPACE, trials=20, seed=57):
+    """trials distinct configs drawn uniformly from the grid of space."""
+    configs = grid(space)
+    rng = np.random.default_rng(seed)
+    return [configs[i] for i in rng.choice(len(configs), size=min(trials, len(configs)), replace=False)]
+
+
+def _dataset_key(features_path, labels_path):
+    parts = []
+    for path in (features_path, labels_path):
+        stat = os.stat(path)
+        parts.append(f"{Path(path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}")
+    return "|".join(parts)
+
+
+def config_hash(config, settings):
+    """Stable key for one run: the config plus everything else that affects its result."""
+    payload = json.dumps({"config": config, "settings": settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class ResultCache:
+    """Append-only JSON lines file of finished runs, keyed by config_hash."""
+
+    def __init__(self, path):
+        self._path = Path(path)
+        self._results = {}
+        if self._path.exists():
+            with open(self._path) as f:
+                for line in f:
+                    if line.strip():
+                        result = json.loads(line)
+                        self._results[result["key"]] = result
+
+    def get(self, key):
+        return self._results.get(key)
+
+    def put(self, result):
+        self._results[result["key"]] = result
+        with open(self._path, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+    def __len__(self):
+        return len(self._results)
+
+
+def _latency_us(model, batch_size, repeats=200):
+    """Median wall time per forward pass of a batch_size batch, in microseconds."""
+    import torch
+
+    x = torch.rand(batch_size, model.layers[0].in_features)
+    times = []
+    with torch.inference_mode():
+        for _ in range(10):
+            model(x)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(x)
+            times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1e6
+
+
+def run_config(config, features_path, labels_path, epochs=20, patience=None, seed=57):
+    """Trains one config and returns its test metrics, training time and inference cost.
+
+    rmse and mape are the final test evaluation, of the same weights the
+    latency is measured on; the test set never picks an epoch. train_seconds
+    leaves out the test passes.
+    """
+    import torch
+    from torch_model import FlashcardModel, split_dataset, train_loop
+
+    torch.manual_seed(seed)
+    model = FlashcardModel(config["width"], config["depth"], config["activation"])
+    train_data, test_data = split_dataset(features_path, labels_path, seed=seed)
+
+    # train_loop reports every epoch; a sweep only wants the outcome
+    with contextlib.redirect_stdout(io.StringIO()):
+        history = train_loop(model, train_data, test_data, epochs=epochs, batch_size=config["batch_size"],
+                             lr=config["lr"], patience=patience, report_every=0, seed=seed)
+
+    model.cpu().eval()
+    return {
+        "config": config,
+        "rmse": history["test_rmse"][-1],
+        "mape": history["test_mape"][-1],
+        "epochs": history["epochs"],
+        "train_seconds": history["train_seconds"],
+        "latency_us": _latency_us(model, 1),
+        "batch_latency_us": _latency_us(model, LATENCY_BATCH) / LATENCY_BATCH,
+        "params": sum(p.numel() for p in model.parameters()),
+    }
+
+
+def _init_worker(threads):
+    import torch
+    torch.set_num_threads(threads)
+
+
+def sweep(configs, features_path, labels_path, epochs=20, patience=None, workers=None, threads=None,
+          cache_path="sweep_cache.jsonl", seed=57, progress=None):
+    """Runs every config not already cached and returns the results of all of them.
+
+    workers defaults to the CPU count and threads, torch's per-worker thread
+    count, to an even share of the CPUs, at least 1. progress, if given, is
+    called with each result as it finishes.
+    """
+    cpus = os.cpu_count() or 1
+    workers = workers or cpus
+    threads = threads or max(cpus // workers, 1)
+    settings = {"epochs": epochs, "patience": patience, "seed": seed,
+                "data": _dataset_key(features_path, labels_path), "results": RESULTS_VERSION}
+    cache = ResultCache(cache_path)
+
+    results = []
+    pending = {}
+    for config in configs:
+        key = config_hash(config, settings)
+        cached = cache.get(key)
+        if cached is not None:
+            results.append(dict(cached, cached=True))
+        else:
+            pending[key] = config
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)), initializer=_init_worker,
+                                 initargs=(threads,)) as pool:
+            jobs = {pool.submit(run_config, config, str(features_path), str(labels_path), epochs, patience,
+                                seed): key for key, config in pending.items()}
+            for job in as_completed(jobs):
+                result = dict(job.result(), key=jobs[job])
+                cache.put(result)
+                results.append(dict(result, cached=False))
+                if progress is not None:
+                    progress(result)
+    return results
+
+
+def rank(results):
+    """Results sorted by RMSE, each marked pareto=True if no other run is both more accurate and cheaper.
+
+    Cost is single-sample inference latency, the path a review takes.
+    """
+    ranked = sorted(results, key=lambda r: (r["rmse"], r["latency_us"]))
+    best_latency = float("inf")
+    for result in ranked:
+        result["pareto"] = result["latency_us"] < best_latency
+        best_latency = min(best_latency, result["latency_us"])
+    return ranked
+
+
+def format_table(ranked):
+    lines = [f"{'#':>3} {'width':>5} {'depth':>5} {'activation':<10} {'lr':>7} {'batch':>6} "
+             f"{'rmse':>9} {'mape %':>8} {'train s':>8} {'1-row us':>9} {'row us':>7} {'params':>7}  pareto"]
+    for i, r in enumerate(ranked, 1):
+        c = r["config"]
+        lines.append(f"{i:>3} {c['width']:>5} {c['depth']:>5} {c['activation']:<10} {c['lr']:>7g} {c['batch_size']:>6} "
+                     f"{r['rmse']:>9.4f} {r['mape']:>8.2f} {r['train_seconds']:>8.1f} {r['latency_us']:>9.1f} "
+                     f"{r['batch_latency_us']:>7.3f} {r['params']:>7,}  {'*' if r['pareto'] else ''}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep FlashcardModel architectures and training settings")
+    parser.add_argument("data", help="directory with features.npy and labels.npy")
+    parser.add_argument("--generate", type=int, default=None, metavar="CARDS",
+                        help="write a synthetic dataset of this many cards to data first")
+    parser.add_argument("--search", choices=("grid", "random"), default="grid")
+    parser.add_argument("--trials", type=int, default=20, help="configs to draw with --search random")
+    parser.add_argument("--width", type=int, nargs="+", default=SEARCH_SPACE["width"])
+    parser.add_argument("--depth", type=int, nargs="+", default=SEARCH_SPACE["depth"])
+    parser.add_argument("--activation", nargs="+", default=SEARCH_SPACE["activation"])
+    parser.add_argument("--lr", type=float, nargs="+", default=SEARCH_SPACE["lr"])
+    parser.add_argument("--batch-size", type=int, nargs="+", default=SEARCH_SPACE["batch_size"])
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--patience", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=None, help="torch threads per worker")
+    parser.add_argument("--cache", default="sweep_cache.jsonl")
+    parser.add_argument("--seed", type=int, default=57)
+    parser.add_argument("--json", default=None, help="also write the ranked results here")
+    args = parser.parse_args(argv)
+
+    data = Path(args.data)
+    if args.generate:
+        from train_setup import write_synthetic_dataset
+        write_synthetic_dataset(data, args.generate, seed=args.seed)
+
+    space = {"width": args.width, "depth": args.depth, "activation": args.activation, "lr": args.lr,
+             "batch_size": args.batch_size}
+    configs = grid(space) if args.search == "grid" else random_configs(space, args.trials, args.seed)
+
+    done = 0
+
+    def report(result):
+        nonlocal done
+        done += 1
+        print(f"\r{done}/{len(configs)} configs run", end="", file=sys.stderr)
+
+    results = sweep(configs, data / "features.npy", data / "labels.npy", args.epochs, args.patience,
+                    args.workers, args.threads, args.cache, args.seed, report)
+    print(file=sys.stderr)
+    ranked = rank(results)
+    print(format_table(ranked))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(ranked, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The app's modules are flat files imported by name, e.g. "from models import Deck"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,40 @@
+import json
+
+import benchmarks
+
+
+def _result(name, size, ns_per_op, peak_bytes):
+    return {"name": name, "size": size, "ns_per_op": ns_per_op, "peak_bytes": peak_bytes}
+
+
+def test_every_benchmark_runs_at_a_small_size():
+    results = benchmarks.run_benchmarks(sizes=[200], repeats=1, log=lambda line: None)
+    assert [r["name"] for r in results] == list(benchmarks.BENCHMARKS)
+    for result in results:
+        assert result["size"] == 200 and result["seconds"] > 0
+        assert result["peak_bytes"] >= 0
+
+
+def test_sizes_over_a_benchmark_limit_are_skipped_unless_full():
+    logged = []
+    results = benchmarks.run_benchmarks(sizes=[200_000], only=["generate_synthetic_data"],
+                                        repeats=1, log=logged.append)
+    assert results == [] and "skipped" in logged[0]
+
+
+def test_compare_flags_time_or_memory_growth_over_the_threshold():
+    baseline = {"results": [_result("queue", 10, 100.0, 1000), _result("sm2_store", 10, 100.0, 1000),
+                            _result("inference", 10, 100.0, 0)]}
+    current = {"results": [_result("queue", 10, 105.0, 1000), _result("sm2_store", 10, 100.0, 1500),
+                           _result("inference", 10, 150.0, 0), _result("ring_queue", 10, 1.0, 0)]}
+    rows = {row["name"]: row for row in benchmarks.compare(baseline, current, threshold=0.1)}
+    assert set(rows) == {"queue", "sm2_store", "inference"}
+    assert not rows["queue"]["regression"]
+    assert rows["sm2_store"]["regression"] and rows["inference"]["regression"]
+
+
+def test_main_writes_results_that_compare_cleanly_with_themselves(tmp_path, capsys):
+    out = tmp_path / "results.json"
+    assert benchmarks.main(["run", "--sizes", "100", "--only", "queue", "--repeats", "1", "--out", str(out)]) == 0
+    assert json.loads(out.read_text())["results"][0]["name"] == "queue"
+    assert benchmarks.main(["compare", str(out), str(out)]) == 0
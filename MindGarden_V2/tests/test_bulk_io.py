@@ -0,0 +1,27 @@
+import io
+
+import pytest
+
+from bulk_io import make_cards, read_rows
+
+
+def test_numeric_jsonl_text_becomes_cards():
+    f = io.StringIO('{"front": 42, "back": 1.5}\n{"front": "a", "back": "b", "reversed": true}\n')
+    cards = make_cards(read_rows(f, "jsonl"))
+    assert [(c.get_front(), c.get_back()) for c in cards] == [("42", "1.5"), ("a", "b")]
+    assert cards[1].get_reversed_card() is not None
+
+
+@pytest.mark.parametrize("line", ['{"front": null, "back": "b"}', '{"front": ["a"], "back": "b"}', '["a", "b"]'])
+def test_bad_jsonl_rows_name_their_line(line):
+    f = io.StringIO('{"front": "ok", "back": "ok"}\n' + line + "\n")
+    with pytest.raises(ValueError, match="Line 2"):
+        list(read_rows(f, "jsonl"))
+
+
+def test_short_csv_rows_name_their_line():
+    f = io.StringIO("front,back,type\na,b,basic\n\nc\n")
+    rows = read_rows(f, "csv")
+    assert next(rows) == ("a", "b", False)
+    with pytest.raises(ValueError, match="Line 4"):
+        next(rows)
@@ -0,0 +1,68 @@
+import pytest
+import torch
+
+from checkpoint import Checkpointer
+from torch_model import FlashcardModel, split_dataset, train_loop
+from train_setup import write_synthetic_dataset
+
+
+@pytest.fixture
+def datasets(tmp_path):
+    return split_dataset(*write_synthetic_dataset(tmp_path / "data", 80, workers=1))
+
+
+def _train(datasets, epochs, checkpointer=None, resume=False):
+    torch.manual_seed(57)
+    model = FlashcardModel()
+    history = train_loop(model, *datasets, epochs=epochs, batch_size=64, report_every=0,
+                         eval_every=1, checkpointer=checkpointer, resume=resume)
+    return model, history
+
+
+def test_resuming_matches_an_uninterrupted_run(tmp_path, datasets):
+    expected, expected_history = _train(datasets, 4)
+
+    with Checkpointer(tmp_path / "run", every_steps=3) as checkpointer:
+        _train(datasets, 2, checkpointer)
+    # Drop the end-of-epoch checkpoint so the run resumes mid-epoch, at step 9 of 10
+    checkpointer.get_checkpoints()[-1].unlink()
+    assert checkpointer.get_checkpoints()[-1].name == "checkpoint-0000000009.pt"
+    with Checkpointer(tmp_path / "run", every_steps=3) as checkpointer:
+        resumed, history = _train(datasets, 4, checkpointer, resume=True)
+
+    for a, b in zip(expected.state_dict().values(), resumed.state_dict().values()):
+        assert torch.equal(a, b)
+    assert history["test_rmse"] == expected_history["test_rmse"]
+    assert history["steps"] == expected_history["steps"]
+
+
+def test_best_checkpoint_follows_the_lowest_validation_rmse(tmp_path):
+    model = FlashcardModel()
+    with Checkpointer(tmp_path, keep=2) as checkpointer:
+        for step, rmse in enumerate([3.0, 1.0, 2.0, 4.0], 1):
+            checkpointer.save({"step": step, "epoch": step, "model": model.state_dict()}, val_rmse=rmse)
+
+    assert [p.name for p in checkpointer.get_checkpoints()] == ["checkpoint-0000000003.pt", "checkpoint-0000000004.pt"]
+    assert checkpointer.get_best() == {"step": 2, "epoch": 2, "val_rmse": 1.0}
+    assert checkpointer.load_best()["step"] == 2
+    # A new Checkpointer on the same directory remembers the best one
+    assert Checkpointer(tmp_path).get_best()["step"] == 2
+
+
+def test_export_best_writes_a_loadable_state_dict(tmp_path):
+    checkpointer = Checkpointer(tmp_path / "run")
+    with pytest.raises(KeyError):
+        checkpointer.export_best(tmp_path / "model.pth")
+
+    model = FlashcardModel()
+    with checkpointer:
+        checkpointer.save({"step": 1, "epoch": 1, "model": model.state_dict()}, val_rmse=1.0)
+    checkpointer.export_best(tmp_path / "model.pth")
+    FlashcardModel().load_state_dict(torch.load(tmp_path / "model.pth"))
+
+
+def test_writer_errors_surface_on_close(tmp_path):
+    checkpointer = Checkpointer(tmp_path).start()
+    checkpointer.save({"epoch": 1})  # no "step" to name the file by
+    with pytest.raises(KeyError):
+        checkpointer.close()
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import torch
+
+from features import NUM_FEATURES, FeatureStore, card_features, feature_matrix
+from models import Card, Deck
+
+START = 1_760_000_000.0
+
+
+def reviewed_deck(store, cards=3):
+    deck = Deck("spanish")
+    for i in range(cards):
+        deck.add_card(Card(front=f"word {i}", back="back"))
+    deck.set_feature_store(store)
+    queue = deck.create_review_queue()
+    for i, grade in enumerate((1, 2, 3)[:cards]):
+        deck.grade_card(queue.dequeue(), grade, START + i, START + i + 2.0)
+    return deck
+
+
+def test_rows_follow_reviews_and_match_card_features():
+    store = FeatureStore(capacity=1)
+    deck = reviewed_deck(store)
+    cards = list(deck.iter_cards())
+    now = START + 2 * 86400
+
+    assert len(store) == 3
+    assert np.allclose(store.matrix(now)[store.rows(cards)], feature_matrix(cards, now))
+    assert store.matrix(now)[store.get_row(cards[0]), 2] == 1
+
+
+def test_full_tensor_is_a_view_of_the_store():
+    store = FeatureStore()
+    reviewed_deck(store)
+    tensor = store.tensor(now=START)
+    assert tensor.shape == (3, NUM_FEATURES) and tensor.dtype == torch.float32
+    assert tensor.data_ptr() == store.matrix(START).__array_interface__["data"][0]
+
+
+def test_indexed_rows_are_refreshed_to_now():
+    store = FeatureStore()
+    card = Card(front="a", back="b")
+    card.update_stats(START, START + 1.0, 2)
+    row = store.add(card)
+    tensor = store.tensor([row], now=START + 86400)
+    assert tensor[0].tolist() == pytest.approx(card_features(card, START + 86400))
+    assert tensor[0, 0].item() == pytest.approx(1.0)
+
+
+def test_never_reviewed_cards_have_zero_elapsed_time():
+    store = FeatureStore()
+    row = store.add(Card(front="a", back="b"))
+    assert store.add(store.get_card(row)) == row
+    assert store.tensor([row], now=START)[0, 0].item() == 0.0
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from forecast import forecast, schedule_arrays
+
+START = 739000
+
+
+def test_fixed_lapse_grade_terminates():
+    schedule = schedule_arrays([START] * 3, [1, 5, 10], [1.5] * 3, [0, 3, 5], grade=[4, 4, 5])
+    # A card that always lapses comes back every day
+    assert forecast(schedule, days=10, start=START).tolist() == [3] * 10
+
+
+def test_lapse_only_grade_probs_terminate():
+    schedule = schedule_arrays([START, START + 2], [1, 3], [1.69, 1.69], [0, 1])
+    counts = forecast(schedule, days=7, start=START, grade_probs=(0, 0, 0, 0.5, 0.5))
+    assert counts.tolist() == [1, 1, 2, 2, 2, 2, 2]
+
+
+def test_passing_grade_follows_sm2():
+    # Grade 3 from a new card: reviewed on day 0, then after 1 and 3 days
+    schedule = schedule_arrays([START], [1], [1.69], [0], grade=[3])
+    counts = forecast(schedule, days=5, start=START)
+    assert np.flatnonzero(counts).tolist() == [0, 1, 4]
+
+
+def test_grades_outside_the_scheduler_range_are_rejected():
+    with pytest.raises(ValueError):
+        schedule_arrays([START], [1], [1.69], [0], grade=[6])
+    with pytest.raises(ValueError):
+        forecast(schedule_arrays([START], [1], [1.69], [0]), start=START, grade_probs=(1, 0, 0))
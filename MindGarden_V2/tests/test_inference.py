@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from features import NUM_FEATURES
+from inference import InferenceEngine
+from torch_model import FlashcardModel
+
+
+def features(n=1):
+    return np.random.default_rng(57).random((n, NUM_FEATURES), dtype=np.float32)
+
+
+def test_batched_predictions_match_a_direct_pass():
+    x = features(5)
+    with InferenceEngine(FlashcardModel()) as engine:
+        futures = [engine.submit(row) for row in x]
+        served = [future.result(timeout=10) for future in futures]
+        assert served == pytest.approx(engine.predict_batch(x).tolist(), rel=1e-5)
+
+
+def test_submit_after_stop_raises():
+    engine = InferenceEngine(FlashcardModel()).start()
+    engine.stop()
+    with pytest.raises(RuntimeError):
+        engine.submit(features()[0])
+
+
+def test_queued_requests_fail_when_the_engine_stops():
+    engine = InferenceEngine(FlashcardModel())
+    future = engine.submit(features()[0])
+    engine.stop()
+    with pytest.raises(RuntimeError):
+        future.result(timeout=10)
+
+
+def test_a_restarted_engine_serves_again():
+    engine = InferenceEngine(FlashcardModel()).start()
+    engine.stop()
+    with engine:
+        assert isinstance(engine.predict(features()[0]), float)
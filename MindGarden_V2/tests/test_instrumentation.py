@@ -0,0 +1,90 @@
+import json
+import time
+
+import pytest
+
+from instrumentation import Metrics, SamplingProfiler, metrics, profile
+from models import Card, Deck
+
+
+@pytest.fixture
+def global_metrics(monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", True)
+    metrics.reset()
+    yield metrics
+    metrics.reset()
+
+
+def test_disabled_metrics_record_nothing():
+    registry = Metrics()
+    registry.inc("calls")
+    registry.observe("seconds", 0.1)
+    with registry.timer("block"):
+        pass
+    assert registry.snapshot()["counters"] == {} and registry.snapshot()["histograms"] == {}
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    registry = Metrics(enabled=True)
+    histogram = registry.histogram("latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    data = histogram.get()
+    assert data["buckets"] == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert data["count"] == 4 and data["sum"] == pytest.approx(2.65)
+    with pytest.raises(TypeError):
+        registry.counter("latency")
+
+
+def test_exports_agree(tmp_path):
+    registry = Metrics(enabled=True)
+    registry.counter("reviews_total", "Reviews graded").inc(3)
+    registry.histogram("save_seconds", buckets=(1.0,)).observe(0.5)
+    registry.write_json(tmp_path / "metrics.json")
+    registry.write_prometheus(tmp_path / "metrics.prom")
+
+    snapshot = json.loads((tmp_path / "metrics.json").read_text())
+    assert snapshot["counters"] == {"reviews_total": 3}
+    assert snapshot["histograms"]["save_seconds"]["buckets"] == [[1.0, 1], ["+Inf", 1]]
+    text = (tmp_path / "metrics.prom").read_text().splitlines()
+    assert "# HELP reviews_total Reviews graded" in text and "reviews_total 3" in text
+    assert 'save_seconds_bucket{le="+Inf"} 1' in text and "save_seconds_count 1" in text
+
+
+def test_grading_updates_the_review_metrics(global_metrics):
+    deck = Deck("spanish")
+    for i in range(2):
+        deck.add_card(Card(front=f"word {i}", back="back"))
+    queue = deck.create_review_queue()
+    now = time.time()
+    deck.grade_card(queue.dequeue(), 2, now, now + 1.5)
+    deck.grade_card(queue.dequeue(), 5, now, now + 3.0)
+
+    snapshot = global_metrics.snapshot()
+    assert snapshot["counters"]["card_reviews_total"] == 1
+    assert snapshot["counters"]["card_requeues_total"] == 1
+    assert snapshot["counters"]["review_queue_cards_total"] == 2
+    assert snapshot["histograms"]["review_response_seconds"]["sum"] == pytest.approx(1.5)
+    assert snapshot["histograms"]["create_review_queue_seconds"]["count"] == 1
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_profiler_writes_folded_stacks(tmp_path):
+    path = tmp_path / "run.folded"
+    with SamplingProfiler(path, interval=0.001) as profiler:
+        _busy(0.1)
+    assert profiler.get_sample_count() > 0
+
+    lines = path.read_text().splitlines()
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == profiler.get_sample_count()
+    assert any("_busy (test_instrumentation.py:" in line for line in lines)
+
+
+def test_profile_without_a_path_does_nothing():
+    with profile() as profiler:
+        assert profiler is None
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+import torch
+
+import inference
+from features import NUM_FEATURES
+from model_registry import ModelRegistry
+from torch_model import FlashcardModel
+
+
+@pytest.fixture
+def registry(tmp_path):
+    for version, seed in (("01", 1), ("02", 2)):
+        torch.manual_seed(seed)
+        torch.save(FlashcardModel().state_dict(), tmp_path / f"SmartCards_model_{version}.pth")
+    return ModelRegistry(tmp_path)
+
+
+def test_each_version_is_loaded_once_and_shared(registry):
+    assert registry.get_versions() == ["01", "02"]
+    model = registry.get("01")
+    assert registry.get("01") is model
+    assert not model.training and not any(p.requires_grad for p in model.parameters())
+    stats = registry.get_stats()
+    assert (stats["loads"], stats["misses"], stats["hits"]) == (1, 1, 1)
+
+
+def test_new_model_is_a_trainable_copy(registry):
+    copy = registry.new_model("01")
+    shared = registry.get("01")
+    assert copy is not shared and all(p.requires_grad for p in copy.parameters())
+    with torch.no_grad():
+        next(copy.parameters()).add_(1.0)
+    assert not torch.equal(next(copy.parameters()), next(shared.parameters()))
+
+
+def test_activate_swaps_the_default_version(registry):
+    with pytest.raises(LookupError):
+        registry.get()
+    assert registry.activate("01") is None
+    assert registry.activate("02") == "01"
+    assert registry.get() is registry.get("02")
+    assert registry.get_stats()["swaps"] == 1
+    with pytest.raises(ValueError):
+        registry.unload("02")
+    registry.unload("01")
+    assert registry.get_stats()["resident"] == ["02"]
+
+
+def test_unknown_versions_raise_key_error(registry):
+    with pytest.raises(KeyError):
+        registry.get("99")
+
+
+def test_an_engine_without_a_model_follows_activate(registry, monkeypatch):
+    monkeypatch.setattr(inference, "get_registry", lambda: registry)
+    registry.activate("01")
+    engine = inference.InferenceEngine()
+    x = np.random.default_rng(57).random((3, NUM_FEATURES), dtype=np.float32)
+
+    first = engine.predict_batch(x)
+    assert engine.get_version() == "01"
+    registry.activate("02")
+    second = engine.predict_batch(x)
+    assert engine.get_version() == "02"
+    with torch.inference_mode():
+        expected = registry.get("02")(torch.from_numpy(x)).reshape(-1).numpy()
+    assert np.allclose(second, expected) and not np.allclose(first, second)
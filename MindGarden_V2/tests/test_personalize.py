@@ -0,0 +1,32 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from features import NUM_FEATURES
+from personalize import PersonalizationEngine
+from torch_model import FlashcardModel
+
+
+def user_data(users=3, rows=20):
+    torch.manual_seed(57)
+    return {user_id: (torch.rand(rows + user_id, NUM_FEATURES), torch.rand(rows + user_id) * 10)
+            for user_id in range(users)}
+
+
+def test_reported_loss_is_that_of_the_stored_heads(tmp_path):
+    torch.manual_seed(57)
+    engine = PersonalizationEngine(FlashcardModel(16, 1, "relu"), spill_dir=tmp_path)
+    data = user_data()
+    losses = engine.fine_tune(data, epochs=3)
+    for user_id, (features, labels) in data.items():
+        mse = float(((engine.predict(user_id, features) - labels) ** 2).mean())
+        assert losses[user_id] == pytest.approx(mse, rel=1e-5)
+
+
+def test_users_train_the_same_alone_or_in_a_group(tmp_path):
+    torch.manual_seed(57)
+    model = FlashcardModel(16, 1, "relu")
+    data = user_data()
+    grouped = PersonalizationEngine(model, spill_dir=tmp_path / "grouped").fine_tune(data, epochs=3)
+    alone = PersonalizationEngine(model, spill_dir=tmp_path / "alone").fine_tune(data, epochs=3, group_size=1)
+    assert grouped == pytest.approx(alone, rel=1e-5)
@@ -0,0 +1,47 @@
+from collections import deque
+import pickle
+import random
+
+from models import LinkedListQueue, RingQueue
+
+
+def test_matches_a_deque_through_growth_and_wraparound():
+    rng = random.Random(57)
+    q, expected = RingQueue(capacity=2), deque()
+    for i in range(2000):
+        op = rng.random()
+        if op < 0.4:
+            q.queue(i)
+            expected.append(i)
+        elif op < 0.55:
+            items = list(range(i, i + rng.randint(0, 7)))
+            q.extend(items)
+            expected.extend(items)
+        elif op < 0.85:
+            assert q.dequeue() == (expected.popleft() if expected else None)
+        else:
+            n = rng.randint(0, 5)
+            assert q.drain(n) == [expected.popleft() for _ in range(min(n, len(expected)))]
+        assert len(q) == len(expected) and list(q) == list(expected)
+        assert q.peek() == (expected[0] if expected else None)
+    assert q.drain() == list(expected) and q.is_empty()
+
+
+def test_iterating_does_not_consume():
+    q = RingQueue(["a", "b", "c"])
+    assert list(q) == ["a", "b", "c"] and list(q) == ["a", "b", "c"]
+    assert q.dequeue() == "a" and len(q) == 2
+
+
+def test_empty_queue_behaves_like_linked_list_queue():
+    ring, linked = RingQueue(), LinkedListQueue()
+    assert ring.dequeue() == linked.dequeue() is None
+    assert ring.is_empty() and linked.is_empty()
+    assert str(ring) == str(linked)
+
+
+def test_long_queues_pickle_without_recursion():
+    q = RingQueue(range(100_000))
+    q.drain(10)
+    restored = pickle.loads(pickle.dumps(q))
+    assert len(restored) == 99_990 and restored.peek() == 10
@@ -0,0 +1,91 @@
+from datetime import date
+
+import pytest
+
+from models import Card, Deck, User
+from rollover import run_rollover
+from session_planner import SessionPlanner
+from storage import Storage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    with Storage(tmp_path / "test.db") as storage:
+        yield storage
+
+
+def due_deck(storage, cards=4):
+    deck = Deck("due")
+    yesterday = date.today().toordinal() - 1
+    for i in range(cards):
+        deck.get_study_deck().add_card(yesterday, Card(front=f"due {i}", back="b"))
+    storage.save_deck(deck)
+    deck.set_storage(storage)
+    return deck
+
+
+def by_id(deck):
+    return {card.get_id(): card for card in deck.iter_cards()}
+
+
+def test_review_queue_follows_the_stored_queue(storage):
+    deck = due_deck(storage)
+    cards = by_id(deck)
+    ids = sorted(cards)
+    # The last card isn't listed, and a listed id that is no longer due is skipped
+    stored = [ids[2], ids[0], 999, ids[1]]
+    storage.save_daily_queues(date.today(), [(deck.get_id(), None, stored, [])])
+
+    queue = deck.create_review_queue()
+    served = [queue.dequeue() for _ in range(len(queue))]
+    assert served == [cards[ids[2]], cards[ids[0]], cards[ids[1]], cards[ids[3]]]
+
+
+def test_review_queue_without_a_stored_queue_is_built_live(storage):
+    deck = due_deck(storage)
+    queue = deck.create_review_queue()
+    assert len(queue) == 4
+
+
+def test_planner_serves_due_cards_in_stored_order(storage):
+    deck = due_deck(storage)
+    ids = sorted(by_id(deck), reverse=True)
+    storage.save_daily_queues(date.today(), [(deck.get_id(), None, ids, [])])
+    user = User()
+    user.add_deck(deck)
+
+    with SessionPlanner(user) as planner:
+        assert [card.get_id() for _, card in planner] == ids
+
+
+def test_closing_the_planner_returns_every_unserved_card(storage):
+    deck = Deck("two days")
+    today = date.today().toordinal()
+    for i in range(6):
+        deck.get_study_deck().add_card(today - 1 - i % 2, Card(front=f"due {i}", back="b"))
+    storage.save_deck(deck)
+    deck.set_storage(storage)
+    storage.save_daily_queues(date.today(), [(deck.get_id(), None, sorted(by_id(deck)), [])])
+    user = User()
+    user.add_deck(deck)
+
+    with SessionPlanner(user) as planner:
+        _, served = next(planner)
+        planner.mark_done(served)
+    assert len(deck.get_study_deck()) == 5
+
+
+def test_decks_without_a_user_get_a_queue(tmp_path):
+    path = tmp_path / "rollover.db"
+    with Storage(path) as storage:
+        user = User()
+        user.add_deck(Deck("owned"))
+        storage.save_user(user)
+        unowned = Deck("unowned")
+        storage.save_deck(unowned)
+
+    totals = run_rollover(path, shards=4, workers=1)
+    assert totals["decks"] == 2
+    assert totals["users"] == 1
+    with Storage(path) as storage:
+        assert storage.load_daily_queue(unowned.get_id(), date.today()) is not None
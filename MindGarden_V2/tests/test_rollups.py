@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+
+from models import Card, Deck, User
+from rollups import DAY, HOUR, StatsRollup, TimeBuckets
+
+
+def local(day, hour=12):
+    return time.mktime((2026, 3, day, hour, 0, 0, 0, 0, -1))
+
+
+def test_deck_reviews_roll_up_into_the_user():
+    user = User()
+    spanish, french = Deck("spanish"), Deck("french")
+    for deck in (spanish, french):
+        deck.add_card(Card(front="a", back="b"))
+        user.add_deck(deck)
+
+    now = local(10)
+    for deck, difficulty in ((spanish, 2), (french, 4), (spanish, 1)):
+        deck.get_deck_stats().record_review(now, now + 36, difficulty)
+
+    assert spanish.get_deck_stats().get_review_totals()["Reviews"] == 2
+    totals = user.get_user_stats().get_stats()
+    assert totals["Reviews"] == 3 and totals["Time Studied (h)"] == 0.03
+    assert totals["Difficulty Histogram"] == [1, 1, 0, 1, 0]
+    assert totals["Success Rate (%)"] == 2 / 3 * 100
+
+
+def test_daily_and_hourly_buckets_split_reviews_by_local_time():
+    rollup = StatsRollup()
+    rollup.record_review(local(10, 9), local(10, 9) + 60, 2)
+    rollup.record_review(local(10, 11), local(10, 11) + 30, 5)
+    rollup.record_review(local(12, 9), local(12, 9) + 10, 3)
+
+    daily = rollup.get_daily(days=3, now=local(12))
+    assert daily["reviews"].tolist() == [2, 0, 1]
+    assert daily["successes"].tolist() == [1, 0, 1]
+    assert daily["time_studied"].tolist() == [90, 0, 10]
+    assert daily["difficulty_hist"][0].tolist() == [0, 1, 0, 0, 1]
+
+    hourly = rollup.get_hourly(hours=3, now=local(10, 11))
+    assert hourly["reviews"].tolist() == [1, 0, 1]
+
+
+def test_buckets_grow_in_both_directions():
+    buckets = TimeBuckets(HOUR, capacity=2)
+    start = local(10)
+    for hours in (0, 40, -30, -100):
+        buckets.record(start + hours * HOUR, 1.0, 2)
+    result = buckets.query(start - 100 * HOUR, start + 40 * HOUR)
+    assert result["reviews"].sum() == 4
+    assert np.flatnonzero(result["reviews"]).tolist() == [0, 70, 100, 140]
+
+
+def test_state_round_trip_keeps_every_bucket():
+    rollup = StatsRollup()
+    for day in (3, 5, 5):
+        rollup.record_review(local(day), local(day) + 5, 1)
+    restored = StatsRollup()
+    restored.set_state(rollup.get_state())
+    restored.record_review(local(6), local(6) + 5, 4)
+
+    assert restored.get_totals()["Reviews"] == 4
+    assert restored.get_daily(days=4, now=local(6))["reviews"].tolist() == [1, 0, 2, 1]
+    assert rollup.get_daily(days=4, now=local(6))["reviews"].tolist() == [1, 0, 2, 0]
+    assert restored.get_daily(days=1, now=local(6) + DAY)["reviews"].tolist() == [0]
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from card_store import CardStore
+from features import FeatureStore
+from models import Card, Deck
+from review_log import ReviewLog, replay_into
+
+GRADES = [3, 4, 2, 5, 1, 3, 4, 3, 2, 1]
+# Lapses only requeue the card, so only these reach its stats
+PASSED = [grade for grade in GRADES if grade <= 3]
+START = 1_700_000_000.0
+
+
+def graded_deck(grades=GRADES, review_log=None):
+    deck = Deck("parity")
+    deck.set_review_log(review_log)
+    card = Card(front="front", back="back")
+    card.set_id(0)
+    deck.add_card(card)
+    for i, grade in enumerate(grades):
+        start = START + i * 86400
+        deck.grade_card(card, grade, start, start + 2.5)
+    return deck, card
+
+
+def test_card_stats_match_card_store():
+    _, card = graded_deck()
+
+    store = CardStore()
+    ids = store.add_cards(1)
+    starts = START + np.flatnonzero(np.array(GRADES) <= 3) * 86400
+    store.update_stats(np.repeat(ids, len(PASSED)), starts, starts + 2.5, PASSED)
+
+    stats = card._stats
+    assert stats._review_count == store.column("review_count")[0] == len(PASSED)
+    assert stats._success_count == store.column("success_count")[0]
+    assert stats._difficulty_sum == store.column("difficulty_sum")[0]
+    assert stats._interval == store.column("interval")[0]
+    assert stats._ease == pytest.approx(store.column("ease")[0])
+    assert stats._next_due == store.card(0).get_next_due()
+
+
+def test_replayed_log_matches_live_stats(tmp_path):
+    with ReviewLog(tmp_path) as log:
+        _, card = graded_deck(review_log=log)
+
+    fresh = Card(front="front", back="back")
+    replay_into(tmp_path, {0: fresh})
+    for field in ("_review_count", "_success_count", "_difficulty_sum", "_interval", "_next_due"):
+        assert getattr(fresh._stats, field) == getattr(card._stats, field)
+    assert fresh._stats._ease == pytest.approx(card._stats._ease)
+
+
+def test_a_lapse_does_not_push_the_card_further_out():
+    _, lapsed = graded_deck([4, 3])
+    _, passed = graded_deck([3])
+    assert lapsed._stats._review_count == passed._stats._review_count == 1
+    assert lapsed._stats._interval == passed._stats._interval == 1
+    assert lapsed._stats._ease == passed._stats._ease
+
+
+def test_lapses_requeue_without_rescheduling():
+    deck, card = graded_deck([3])
+    due = card.get_next_due()
+    assert deck.grade_card(card, 5, START + 86400, START + 86401)
+    assert card.get_next_due() == due
+    assert card._stats._review_count == 1
+
+
+def test_captured_samples_do_not_change_on_later_reviews():
+    torch_model = pytest.importorskip("torch_model")
+    deck, card = graded_deck([3])
+    store = FeatureStore()
+    deck.set_feature_store(store)
+
+    sample = torch_model.capture_review_data(card, store)
+    before = sample["features"].clone()
+    deck.grade_card(card, 1, START + 10 * 86400, START + 10 * 86400 + 1)
+    assert sample["features"].equal(before)
@@ -0,0 +1,50 @@
+import random
+
+import numpy as np
+
+from models import Card, Deck
+from search import SearchIndex
+
+
+def test_near_duplicates_at_the_threshold_are_found():
+    # Two words changed out of 30 gives a Jaccard similarity of about 0.83
+    rng = random.Random(57)
+    index = SearchIndex(threshold=0.8)
+    eligible = found = 0
+    for _ in range(200):
+        words = [f"w{rng.randrange(10 ** 6)}" for _ in range(30)]
+        original = Card(front=" ".join(words), back="back")
+        words[3], words[20] = "changed", "words"
+        copy = Card(front=" ".join(words), back="back")
+        index.add(original)
+        duplicates = index.add(copy)
+        if np.mean(index._signatures[original] == index._signatures[copy]) >= 0.8:
+            eligible += 1
+            found += any(card is original for card, _ in duplicates)
+    assert eligible > 100
+    assert found / eligible >= 0.99
+
+
+def test_cards_well_below_the_threshold_are_rarely_reported():
+    # Five words changed out of 30 gives a Jaccard similarity of about 0.63;
+    # only the noise of a 64-permutation estimate can push one over 0.8
+    rng = random.Random(57)
+    index = SearchIndex(threshold=0.8)
+    reported = 0
+    for _ in range(200):
+        words = [f"w{rng.randrange(10 ** 6)}" for _ in range(30)]
+        original = Card(front=" ".join(words), back="back")
+        for position in (2, 8, 14, 20, 26):
+            words[position] = f"changed{position}"
+        index.add(original)
+        reported += any(card is original for card, _ in index.add(Card(front=" ".join(words), back="back")))
+    assert reported <= 4
+
+
+def test_add_cards_links_cards_to_the_deck():
+    deck = Deck("linked")
+    card = Card(front="front", back="back")
+    card._reversed_card = Card("reversed", "back", "front")
+    deck.add_cards([card])
+    assert card.get_deck() is deck
+    assert card.get_reversed_card().get_deck() is deck
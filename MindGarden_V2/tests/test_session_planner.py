@@ -0,0 +1,72 @@
+from datetime import date
+
+from models import Card, Deck, User
+from session_planner import SessionPlanner
+
+
+def make_user(new_cards=3, due_cards=10):
+    deck = Deck("planner")
+    for i in range(new_cards):
+        deck.add_card(Card(front=f"new {i}", back="b"))
+    yesterday = date.today().toordinal() - 1
+    for i in range(due_cards):
+        deck.get_study_deck().add_card(yesterday, Card(front=f"due {i}", back="b"))
+    user = User()
+    user.add_deck(deck)
+    return user
+
+
+def test_requeued_card_is_not_served_next():
+    planner = SessionPlanner(make_user(), retry_gap=4)
+    deck, first = next(planner)
+    planner.requeue(deck, first)
+
+    following = [card for _, card in (next(planner) for _ in range(4))]
+    assert first not in following
+    assert next(planner)[1] is first
+
+
+def test_requeued_cards_come_back_once_the_plan_runs_out():
+    planner = SessionPlanner(make_user(new_cards=1, due_cards=1), retry_gap=100)
+    deck, first = next(planner)
+    planner.requeue(deck, first)
+    served = [card for _, card in planner]
+    assert served[-1] is first
+    assert served.count(first) == 1
+
+
+def test_close_puts_unfinished_cards_back():
+    user = make_user()
+    deck = user.get_deck("planner")
+    with SessionPlanner(user) as planner:
+        _, done = next(planner)
+        planner.mark_done(done)
+        next(planner)
+    assert len(deck.get_new_cards_deck().get_deck()) + len(deck.get_study_deck()) == 12
+
+
+def two_deck_user():
+    today = date.today().toordinal()
+    user = User()
+    for name in ("first", "second"):
+        deck = Deck(name)
+        deck.add_card(Card(front=f"{name} new", back="b"))
+        for overdue in (1, 3):
+            deck.get_study_deck().add_card(today - overdue, Card(front=f"{name} {overdue}", back="b"))
+        user.add_deck(deck)
+    return user
+
+
+def test_due_cards_merge_across_decks_most_overdue_first():
+    served = [card.get_front() for _, card in SessionPlanner(two_deck_user())]
+    # Four due cards against two new ones: each new card is followed by two due cards
+    assert served == ["first new", "first 3", "second 3", "second new", "first 1", "second 1"]
+
+
+def test_starting_a_session_takes_no_cards_from_the_decks():
+    user = two_deck_user()
+    planner = SessionPlanner(user, max_cards=1)
+    deck = user.get_deck("second")
+    assert len(deck.get_study_deck()) == 2 and len(deck.get_new_cards_deck().get_deck()) == 1
+    assert len(list(planner)) == 1
+    assert len(deck.get_study_deck()) == 2
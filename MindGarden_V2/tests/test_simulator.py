@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from models import Card
+from simulator import ModelsSM2, SchedulingPolicy, simulate
+
+
+class FixedInterval(SchedulingPolicy):
+    name = "fixed"
+
+    def __init__(self, days):
+        self._days = days
+
+    def new_state(self, num_cards):
+        return {}
+
+    def next_intervals(self, state, idx, grades, elapsed):
+        return np.full(len(idx), self._days)
+
+
+def _run(policy, **kwargs):
+    return simulate(policy, learners=20, cards_per_learner=30, days=60, new_per_day=5, **kwargs)
+
+
+def test_results_do_not_depend_on_the_worker_count():
+    inline = _run("models_sm2", workers=0, shards=4)
+    pooled = _run("models_sm2", workers=2, shards=4)
+    for key in ("reviews", "recall_rate", "retention"):
+        assert inline[key] == pooled[key]
+
+
+def test_models_sm2_follows_card_stats_for_passing_grades():
+    grades = [1, 3, 2, 2, 3]
+    card = Card(front="a", back="b")
+    policy = ModelsSM2()
+    state = policy.new_state(1)
+    for grade in grades:
+        card.update_stats(0.0, 1.0, grade)
+        interval = policy.next_intervals(state, np.array([0]), np.array([grade]), 0)
+        assert interval[0] == card._stats._interval
+
+
+def test_shorter_intervals_cost_more_reviews_and_keep_more():
+    daily = _run(FixedInterval(1), workers=0)
+    monthly = _run(FixedInterval(30), workers=0)
+    assert daily["reviews"] > monthly["reviews"]
+    assert daily["recall_rate"] > monthly["recall_rate"]
+    assert daily["retention"] > monthly["retention"]
+
+
+def test_policies_must_implement_the_interface():
+    class Incomplete(SchedulingPolicy):
+        def new_state(self, num_cards):
+            return {}
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,38 @@
+import pytest
+
+from models import Card, Deck, User
+from snapshot import Snapshot, write_snapshot
+
+
+def make_user(front="front"):
+    deck = Deck("snap")
+    deck.add_card(Card(front=front, back="back"))
+    user = User()
+    user.add_deck(deck)
+    return user
+
+
+def test_round_trip_keeps_card_text(tmp_path):
+    path = tmp_path / "user.mgs"
+    write_snapshot(make_user("héllo"), path)
+    deck = Snapshot(path).load_deck("snap")
+    card, = deck.get_new_cards_deck().get_deck()
+    assert (card.get_front(), card.get_back()) == ("héllo", "back")
+
+
+def test_numeric_card_text_is_written_as_text(tmp_path):
+    path = tmp_path / "user.mgs"
+    user = make_user()
+    # As models.test() builds them, and as Storage returns such cards
+    user.get_deck("snap").get_new_cards_deck().get_deck().peek().set_front(42)
+    write_snapshot(user, path)
+    card, = Snapshot(path).load_deck("snap").get_new_cards_deck().get_deck()
+    assert card.get_front() == "42"
+
+
+def test_other_card_fields_are_rejected(tmp_path):
+    user = make_user()
+    card, = user.get_deck("snap").get_new_cards_deck().get_deck()
+    card._front = ["not", "text"]
+    with pytest.raises(TypeError, match="front"):
+        write_snapshot(user, tmp_path / "user.mgs")
@@ -0,0 +1,127 @@
+import sqlite3
+import time
+
+import pytest
+
+from models import Card, Deck, DeckHandle, User
+from storage import SCHEMA, SCHEMA_VERSION, Storage
+
+
+def make_deck(name, cards=3):
+    deck = Deck(name)
+    for i in range(cards):
+        deck.add_card(Card(front=f"{name} {i}", back="back"))
+    return deck
+
+
+def card_texts(deck):
+    return sorted(card.get_front() for card in deck.iter_cards())
+
+
+@pytest.fixture
+def storage(tmp_path):
+    with Storage(tmp_path / "test.db") as storage:
+        yield storage
+
+
+def test_round_trip_keeps_cards_and_schedule(storage):
+    user = User()
+    user.set_name("learner")
+    deck = make_deck("spanish")
+    user.add_deck(deck)
+    card = deck.get_new_cards_deck().get_deck().dequeue()
+    now = time.time()
+    deck.grade_card(card, 2, now, now + 1)
+    storage.save_user(user)
+
+    loaded = storage.load_user(user.get_id()).get_deck("spanish")
+    assert card_texts(loaded) == card_texts(deck)
+    assert len(loaded.get_new_cards_deck().get_deck()) == 2
+    (reviewed, _), = loaded.get_study_deck().items()
+    assert reviewed.get_id() == card.get_id()
+    assert reviewed.get_next_due() == card.get_next_due()
+
+
+def test_eviction_keeps_cards_added_after_a_session_save(storage):
+    user = User()
+    user.add_deck(make_deck("a"))
+    storage.save_user(user)
+    user = storage.load_user(user.get_id(), lazy=True, max_decks=1)
+
+    deck = user.get_deck("a")
+    card = deck.get_new_cards_deck().get_deck().dequeue()
+    now = time.time()
+    deck.grade_card(card, 2, now, now + 1)
+    deck.add_card(Card(front="a late", back="back"))
+    storage.save_session(deck, [card])
+
+    # Loading a second deck evicts the first
+    user.add_deck_handle(DeckHandle("b", deck=make_deck("b"), storage=storage))
+    assert not user.get_deck_handle("a").is_loaded()
+    assert "a late" in card_texts(user.get_deck("a"))
+
+
+def test_deck_added_after_loading_reloads_once_evicted(storage):
+    user = User()
+    user.set_storage(storage)
+    user.add_deck(make_deck("a"))
+    user.add_deck(make_deck("b"))
+    storage.save_user(user)
+
+    user.set_deck_budget(max_decks=1)
+    assert card_texts(user.get_deck("a")) == ["a 0", "a 1", "a 2"]
+    assert card_texts(user.get_deck("b")) == ["b 0", "b 1", "b 2"]
+
+
+def test_decks_evicted_before_the_user_has_an_id_stay_with_the_user(storage):
+    user = User()
+    user.set_storage(storage)
+    user.set_deck_budget(max_decks=1)
+    user.add_deck(make_deck("a"))
+    user.add_deck(make_deck("b"))
+    assert not user.get_deck_handle("a").is_loaded()
+    storage.save_user(user)
+
+    loaded = storage.load_user(user.get_id())
+    assert loaded.get_deck_names() == ["a", "b"]
+    assert card_texts(loaded.get_deck("a")) == ["a 0", "a 1", "a 2"]
+
+
+def test_decks_in_use_are_not_evicted(storage):
+    user = User()
+    user.set_storage(storage)
+    for name in "abc":
+        user.add_deck(make_deck(name))
+    user.set_deck_budget(max_decks=1)
+
+    deck = user.pin_deck("a")
+    user.get_deck("b")
+    user.get_deck("c")
+    assert user.get_deck_handle("a").is_loaded()
+    user.unpin_deck("a")
+    assert not user.get_deck_handle("a").is_loaded()
+    assert card_texts(user.get_deck("a")) == card_texts(deck)
+
+
+def old_database(path, schema):
+    conn = sqlite3.connect(path)
+    conn.executescript(schema)
+    conn.execute("INSERT INTO decks (id, name) VALUES (1, 'old')")
+    conn.commit()
+    conn.close()
+
+
+@pytest.mark.parametrize("schema", [
+    # Version 1: before last_response_time and success_count
+    SCHEMA.replace("    last_response_time REAL,\n", "").replace("    success_count INTEGER,\n", ""),
+    # Unversioned but written after those columns were added
+    SCHEMA,
+], ids=["version 1", "unversioned"])
+def test_older_databases_open_at_the_current_version(tmp_path, schema):
+    path = tmp_path / "old.db"
+    old_database(path, schema)
+    with Storage(path) as storage:
+        assert storage.load_deck(1).get_name() == "old"
+        assert storage._conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        columns = {row[1] for row in storage._conn.execute("PRAGMA table_info(cards)")}
+    assert {"last_response_time", "success_count"} <= columns
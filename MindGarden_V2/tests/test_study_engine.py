@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from storage import Storage
+from study_engine import StudyEngine, _make_user
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    with Storage(tmp_path / "test.db", check_same_thread=False) as storage:
+        yield storage
+
+
+async def _study(engine, user, difficulty):
+    session_id = await engine.start_session(user)
+    shown = []
+    while (card := await engine.next_card(session_id)) is not None:
+        shown.append(card["front"])
+        await engine.grade(session_id, difficulty(card))
+    return shown, await engine.end_session(session_id)
+
+
+def test_graded_cards_are_saved_and_summarized(storage):
+    # Four cards per deck, of which the default max_new of 3 are shown today
+    user = _make_user(2, 4)
+    storage.save_user(user)
+
+    async def study():
+        async with StudyEngine(storage) as engine:
+            return await _study(engine, user, lambda card: 2)
+
+    shown, summary = run(study())
+    assert len(shown) == 6 and summary == {"deck 0": 3, "deck 1": 3}
+    loaded = storage.load_user(user.get_id())
+    for deck in loaded.iter_decks():
+        assert len(deck.get_study_deck().items()) == 3
+        assert len(deck.get_new_cards_deck().get_deck()) == 1
+        assert deck.get_deck_stats().get_stats()["Total Reviews"] == 3
+
+
+def test_lapsed_cards_come_back_in_the_same_session():
+    user = _make_user(1, 3)
+    lapsed = set()
+
+    def difficulty(card):
+        if card["front"] == "front 0" and card["front"] not in lapsed:
+            lapsed.add(card["front"])
+            return 5
+        return 1
+
+    async def study():
+        async with StudyEngine() as engine:
+            return await _study(engine, user, difficulty)
+
+    shown, summary = run(study())
+    assert shown.count("front 0") == 2 and shown[-1] == "front 0"
+    assert summary == {"deck 0": 4}
+
+
+def test_grading_without_a_card_or_session_raises():
+    async def study():
+        async with StudyEngine() as engine:
+            user = _make_user(1, 1)
+            session_id = await engine.start_session(user)
+            assert await engine.start_session(user) == session_id
+            with pytest.raises(ValueError):
+                await engine.grade(session_id, 2)
+            with pytest.raises(KeyError):
+                await engine.next_card(session_id + 1)
+
+    run(study())
+
+
+def test_a_failed_write_is_raised_from_the_next_call(storage, monkeypatch):
+    user = _make_user(1, 3)
+    storage.save_user(user)
+
+    def fail(rows):
+        raise OSError("disk full")
+    monkeypatch.setattr(storage, "write_session_rows", fail)
+    monkeypatch.setattr(storage, "write_deck_rows", fail)
+
+    async def study():
+        engine = await StudyEngine(storage).start()
+        session_id = await engine.start_session(user)
+        await engine.next_card(session_id)
+        await engine.grade(session_id, 2)
+        await engine._writes.join()
+        await engine.next_card(session_id)
+        with pytest.raises(OSError):
+            await engine.grade(session_id, 2)
+        monkeypatch.undo()
+        await engine.stop()
+
+    run(study())
+
+
+def test_idle_sessions_are_reaped():
+    async def study():
+        async with StudyEngine(idle_timeout=0, reap_interval=0.01) as engine:
+            await engine.start_session(_make_user(1, 1))
+            await asyncio.sleep(0.05)
+            return engine.get_session_count()
+
+    assert run(study()) == 0
@@ -0,0 +1,30 @@
+import pytest
+
+torch_model = pytest.importorskip("torch_model")
+
+from sweep import rank, run_config
+from train_setup import write_synthetic_dataset
+
+
+def test_run_config_reports_the_final_evaluation(tmp_path, monkeypatch):
+    features_path, labels_path = write_synthetic_dataset(tmp_path, 400, workers=1)
+    histories = []
+    train_loop = torch_model.train_loop
+
+    def recording_train_loop(*args, **kwargs):
+        histories.append(train_loop(*args, **kwargs))
+        return histories[-1]
+
+    monkeypatch.setattr(torch_model, "train_loop", recording_train_loop)
+    config = {"width": 8, "depth": 1, "activation": "relu", "lr": 0.01, "batch_size": 64}
+    result = run_config(config, features_path, labels_path, epochs=3)
+
+    history, = histories
+    assert result["rmse"] == history["test_rmse"][-1]
+    assert result["mape"] == history["test_mape"][-1]
+    assert result["train_seconds"] == history["train_seconds"]
+
+
+def test_rank_marks_the_pareto_front():
+    results = [{"rmse": 0.1, "latency_us": 9.0}, {"rmse": 0.2, "latency_us": 5.0}, {"rmse": 0.3, "latency_us": 7.0}]
+    assert [(r["rmse"], r["pareto"]) for r in rank(results)] == [(0.1, True), (0.2, True), (0.3, False)]
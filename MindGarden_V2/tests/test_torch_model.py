@@ -0,0 +1,45 @@
+import torch
+
+from torch_model import EpochSampler, FlashcardModel, split_dataset, train_loop
+from train_setup import write_synthetic_dataset
+
+
+def _datasets(tmp_path):
+    return split_dataset(*write_synthetic_dataset(tmp_path, 80, workers=1))
+
+
+def test_split_dataset_covers_every_row_once(tmp_path):
+    train, test = _datasets(tmp_path)
+    rows = sorted(train._indices.tolist() + test._indices.tolist())
+    assert rows == list(range(400)) and len(test) == 80
+
+
+def test_epoch_order_is_replayable_and_skip_resumes_it():
+    sampler = EpochSampler(50, seed=3)
+    sampler.set_epoch(2)
+    order = list(sampler)
+    sampler.set_epoch(1)
+    assert list(sampler) != order
+    sampler.set_epoch(2, skip=20)
+    assert list(sampler) == order[20:] and len(sampler) == 30
+    assert sorted(order) == list(range(50))
+
+
+def test_test_set_is_evaluated_every_eval_every_epochs_and_after_the_last(tmp_path):
+    train, test = _datasets(tmp_path)
+    torch.manual_seed(57)
+    history = train_loop(FlashcardModel(), train, test, epochs=5, batch_size=64,
+                         report_every=0, eval_every=2)
+    assert history["eval_epochs"] == [1, 3, 4]
+    assert len(history["test_rmse"]) == len(history["test_mape"]) == 3
+    assert history["epochs"] == 5 and history["steps"] == 5 * 5
+    assert history["best_test_rmse"] == min(history["test_rmse"])
+    assert history["train_seconds"] > 0 and history["samples_per_s"] > 0
+
+
+def test_patience_counts_evaluations_not_epochs(tmp_path):
+    train, test = _datasets(tmp_path)
+    # lr=0 never improves on the first evaluation, so the second one stops training
+    history = train_loop(FlashcardModel(), train, test, epochs=20, batch_size=64, lr=0.0,
+                         report_every=0, eval_every=3, patience=1)
+    assert history["eval_epochs"] == [2, 5] and history["epochs"] == 6
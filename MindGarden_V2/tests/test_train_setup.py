@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from features import NUM_FEATURES
+from train_setup import generate_synthetic_arrays, sm2, sm2_arrays, write_synthetic_dataset
+
+
+def test_vectorized_sm2_matches_the_scalar_version():
+    cases = [(ease, repetitions, interval, score)
+             for ease in (1.1, 1.3, 2.5) for repetitions in (0, 1, 4)
+             for interval in (1, 6, 15) for score in range(1, 6)]
+    ease, repetitions, interval, score = (np.array(column) for column in zip(*cases))
+    intervals, eases = sm2_arrays(ease, repetitions, interval, score)
+    for i, case in enumerate(cases):
+        expected_interval, expected_ease = sm2(*case)
+        assert intervals[i] == expected_interval
+        assert eases[i] == pytest.approx(expected_ease)
+
+
+def test_arrays_hold_one_row_per_card_session():
+    features, labels = generate_synthetic_arrays(10, sessions=3, rng=np.random.default_rng(57))
+    assert features.shape == (30, NUM_FEATURES) and features.dtype == np.float32
+    assert np.array_equal(labels, features[:, 1])
+
+
+def test_dataset_does_not_depend_on_the_worker_count(tmp_path):
+    one = write_synthetic_dataset(tmp_path / "one", 250, chunk_cards=100, workers=1)
+    two = write_synthetic_dataset(tmp_path / "two", 250, chunk_cards=100, workers=2)
+    for a, b in zip(one, two):
+        assert np.array_equal(np.load(a), np.load(b))
+    assert np.load(one[0]).shape == (250 * 5, NUM_FEATURES)
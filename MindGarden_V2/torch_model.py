@@ -1,20 +1,40 @@
 from models import *
+from features import NUM_FEATURES, card_features
+from instrumentation import metrics, profile
+import numpy as np
 import torch 
-from torch.utils.data import Dataset
+from torch.utils.data import (BatchSampler, DataLoader, Dataset, Sampler,
+                              SequentialSampler, TensorDataset)
 import torch.nn as nn
 import torch.optim as optim
 from pathlib import Path
+import time
+
+MODEL_DIR = Path(__file__).resolve().parent / "Flashcard_models"
+
+ACTIVATIONS = {
+    "sigmoid": nn.Sigmoid,
+    "tanh": nn.Tanh,
+    "relu": nn.ReLU,
+    "gelu": nn.GELU,
+}
 
 class FlashcardModel(nn.Module):
-    def __init__(self):
+    """MLP from the card features to the next interval.
+
+    depth hidden layers of width units each. The defaults are the shipped
+    architecture, whose checkpoints use the layers.0/2/4 keys this keeps.
+    """
+    def __init__(self, width=32, depth=2, activation="sigmoid"):
         super().__init__()
-        self.layers = nn.Sequential(
-            nn.Linear(in_features=8, out_features=32),
-            nn.Sigmoid(),
-            nn.Linear(in_features=32, out_features=32),
-            nn.Sigmoid(),
-            nn.Linear(in_features=32, out_features=1)
-        )
+        layers = []
+        in_features = NUM_FEATURES
+        for _ in range(depth):
+            layers.append(nn.Linear(in_features=in_features, out_features=width))
+            layers.append(ACTIVATIONS[activation]())
+            in_features = width
+        layers.append(nn.Linear(in_features=in_features, out_features=1))
+        self.layers = nn.Sequential(*layers)
 
     def forward(self, x):
         return self.layers(x)
@@ -29,76 +49,317 @@ def rmse_fn(y_true, y_pred):
     rmse = torch.sqrt(mse).item()
     return rmse
 
-def train_loop(model_01, X_train, y_train, X_test, y_test):
+class MemmapDataset(Dataset):
+    """Features and labels read from .npy files without loading them into memory.
+
+    Indexed with a list of row indices (as produced by a BatchSampler) it
+    returns a whole (features, labels) batch, so one DataLoader step costs one
+    fancy-index read per file instead of one __getitem__ per sample.
+    """
+    def __init__(self, features_path, labels_path, indices=None):
+        self._features_path = str(features_path)
+        self._labels_path = str(labels_path)
+        self._features = None
+        self._labels = None
+        self._indices = indices
+        if indices is None:
+            self._length = len(np.load(self._labels_path, mmap_mode="r"))
+        else:
+            self._length = len(indices)
+
+    def _open(self):
+        # Opened lazily so every DataLoader worker maps the files itself
+        self._features = np.load(self._features_path, mmap_mode="r")
+        self._labels = np.load(self._labels_path, mmap_mode="r")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_features"] = None
+        state["_labels"] = None
+        return state
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, idx):
+        if self._features is None:
+            self._open()
+        rows = np.asarray(idx)
+        if self._indices is not None:
+            rows = self._indices[rows]
+        if rows.ndim:
+            # Sorted reads keep page access sequential; the order inside a batch doesn't matter
+            rows = np.sort(rows)
+        return (torch.from_numpy(np.array(self._features[rows], dtype=np.float32)),
+                torch.from_numpy(np.array(self._labels[rows], dtype=np.float32)))
+
+def split_dataset(features_path, labels_path, test_fraction=0.2, seed=57):
+    """Random train/test MemmapDatasets over the same pair of files."""
+    length = len(np.load(labels_path, mmap_mode="r"))
+    order = np.random.default_rng(seed).permutation(length)
+    n_test = int(length * test_fraction)
+    return (MemmapDataset(features_path, labels_path, np.sort(order[n_test:])),
+            MemmapDataset(features_path, labels_path, np.sort(order[:n_test])))
+
+class EpochSampler(Sampler):
+    """Shuffled indices whose order depends only on (seed, epoch).
+
+    Any epoch's order can be replayed, and set_epoch(epoch, skip) drops the
+    first skip indices, so a resumed run sees exactly the batches it had left.
+    """
+    def __init__(self, length, seed=57):
+        self._length = length
+        self._seed = seed
+        self._epoch = 0
+        self._skip = 0
+
+    def set_epoch(self, epoch, skip=0):
+        self._epoch = epoch
+        self._skip = skip
+
+    def __len__(self):
+        return max(self._length - self._skip, 0)
+
+    def __iter__(self):
+        seed = np.random.SeedSequence(self._seed, spawn_key=(self._epoch,)).generate_state(1)[0]
+        order = torch.randperm(self._length, generator=torch.Generator().manual_seed(int(seed)))
+        return iter(order[self._skip:].tolist())
+
+def make_loader(data, batch_size, shuffle=False, num_workers=0, seed=57):
+    """DataLoader yielding whole (features, labels) batches from data.
+
+    With shuffle, each epoch's order comes from an EpochSampler, reachable as
+    loader.sampler.sampler.
+    """
+    if isinstance(data, (tuple, list)):
+        data = TensorDataset(*data)
+
+    if shuffle:
+        sampler = EpochSampler(len(data), seed)
+    else:
+        sampler = SequentialSampler(data)
+
+    return DataLoader(
+        data,
+        sampler=BatchSampler(sampler, batch_size=batch_size, drop_last=False),
+        batch_size=None,
+        num_workers=num_workers,
+        prefetch_factor=4 if num_workers else None,
+        persistent_workers=num_workers > 0,
+    )
+
+def error_sums(y_true, y_pred):
+    """Squared error, absolute percentage error and count, kept on-device."""
+    diff = y_true - y_pred
+    return torch.stack([
+        (diff ** 2).sum(),
+        (torch.abs(diff / y_true) * 100).sum(),
+        torch.tensor(float(y_true.numel()), device=y_true.device)
+    ])
+
+def summarize(sums):
+    """(RMSE, MAPE) from accumulated error_sums. Forces one host sync."""
+    sq_sum, ape_sum, count = sums.tolist()
+    count = max(count, 1)
+    return (sq_sum / count) ** 0.5, ape_sum / count
+
+def evaluate(model, loader, device):
+    model.eval()
+    sums = torch.zeros(3, device=device)
+    with torch.inference_mode():
+        for X, y in loader:
+            X, y = X.to(device), y.to(device)
+            sums += error_sums(y, model(X).squeeze(-1))
+    return summarize(sums)
+
+def train_loop(model_01, train_data, test_data, epochs=1000, batch_size=1024, lr=0.01,
+               patience=None, min_delta=0.0, report_every=100, num_workers=0, seed=57,
+               profile_path=None, checkpointer=None, resume=False, eval_every=5):
+    """Mini-batch training with on-device metrics and early stopping.
+
+    train_data and test_data are Datasets (e.g. MemmapDataset) or (X, y)
+    tensor pairs. Metrics are accumulated on the device and only read back
+    every report_every steps and once per test pass. The test set is
+    evaluated every eval_every epochs and after the last one. Training stops
+    early once the test RMSE has not improved by min_delta for patience
+    evaluations. Returns a history dict; samples_per_s and train_seconds
+    count training time only, eval_seconds the test passes. profile_path, if
+    given, gets sampled stacks of the whole run.
+
+    With a checkpoint.Checkpointer the state is saved at the end of every
+    epoch and every checkpointer.every_steps steps; resume=True first
+    restores the newest checkpoint and continues from its exact step.
+    """
+    with profile(profile_path):
+        return _train_loop(model_01, train_data, test_data, epochs, batch_size, lr, patience,
+                           min_delta, report_every, num_workers, seed, checkpointer, resume, eval_every)
+
+def _train_state(model, optimizer, history, epoch, batch, samples, train_sums, epochs_without_improvement):
+    from checkpoint import rng_state
+
+    return {
+        "step": history["steps"],
+        "epoch": epoch,
+        "batch": batch,
+        "samples": samples,
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "rng": rng_state(),
+        "history": dict(history, test_rmse=list(history["test_rmse"]), test_mape=list(history["test_mape"]),
+                        eval_epochs=list(history["eval_epochs"])),
+        "train_sums": train_sums,
+        "epochs_without_improvement": epochs_without_improvement,
+    }
+
+def _train_loop(model_01, train_data, test_data, epochs, batch_size, lr, patience, min_delta,
+                report_every, num_workers, seed, checkpointer=None, resume=False, eval_every=5):
     device = "cuda" if torch.cuda.is_available() else "cpu"
 
     loss_fn = nn.MSELoss()
-    torch.manual_seed(57)
+    torch.manual_seed(seed)
 
-    epochs = 1000
-
-    X_train, y_train = X_train.to(device), y_train.to(device)
-    X_test, y_test = X_test.to(device), y_test.to(device)
+    model_01.to(device)
+    train_loader = make_loader(train_data, batch_size, shuffle=True, num_workers=num_workers, seed=seed)
+    test_loader = make_loader(test_data, batch_size, num_workers=num_workers)
+    sampler = train_loader.sampler.sampler
 
     optimizer = torch.optim.Adam(params=model_01.parameters(),
-                                lr=0.01)
-
+                                lr=lr)
+
+    history = {"epochs": 0, "steps": 0, "test_rmse": [], "test_mape": [], "eval_epochs": [],
+               "samples_per_s": 0.0, "train_seconds": 0.0, "eval_seconds": 0.0, "best_test_rmse": float("inf")}
+    epochs_without_improvement = 0
+    samples = 0
+    start_epoch = 0
+    start_batch = 0
+    train_sums = torch.zeros(3, device=device)
+
+    state = checkpointer.load_latest() if checkpointer is not None and resume else None
+    if state is not None:
+        from checkpoint import set_rng_state
+
+        model_01.load_state_dict(state["model"])
+        optimizer.load_state_dict(state["optimizer"])
+        set_rng_state(state["rng"])
+        history = state["history"]
+        history.setdefault("eval_epochs", [])
+        epochs_without_improvement = state["epochs_without_improvement"]
+        samples = state["samples"]
+        start_epoch, start_batch = state["epoch"], state["batch"]
+        train_sums = state["train_sums"].to(device)
+        print(f"Resuming at epoch {start_epoch}, step {history['steps']}")
+        if patience is not None and epochs_without_improvement >= patience:
+            start_epoch = epochs
+    resumed_samples = samples
+    # Only this run's time, so samples_per_s isn't skewed by a resume
+    train_seconds = 0.0
+    eval_seconds = 0.0
 
     # Build training and evaluation loop
-    for epoch in range(epochs):
+    for epoch in range(start_epoch, epochs):
         ### Training
         model_01.train()
+        if epoch != start_epoch or start_batch == 0:
+            train_sums.zero_()
+        batch = start_batch if epoch == start_epoch else 0
+        sampler.set_epoch(epoch, batch * batch_size)
+        epoch_start = time.perf_counter()
+        epoch_samples = samples
 
-        y_pred = model_01(X_train).squeeze()
-
-        # 2. Calculate loss/accuracy
-        loss = loss_fn(y_pred, y_train)
+        for X, y in train_loader:
+            X, y = X.to(device, non_blocking=True), y.to(device, non_blocking=True)
 
-        train_mape = mape_fn(y_train, y_pred)
-        train_rmse = rmse_fn(y_train, y_pred)
+            # 1. Forward pass
+            y_pred = model_01(X).squeeze(-1)
 
-        # 3. Optimizer zero grad
-        optimizer.zero_grad()
+            # 2. Calculate loss
+            loss = loss_fn(y_pred, y)
 
-        # 4. Loss backwards
-        loss.backward()
+            # 3. Optimizer zero grad
+            optimizer.zero_grad(set_to_none=True)
 
-        # 5. Optimizer step
-        optimizer.step()
+            # 4. Loss backwards
+            loss.backward()
 
-        ### Testing
-        model_01.eval()
-        with torch.inference_mode():
-            # 1. Forward pass
-            test_pred = model_01(X_test).squeeze()
-            # 2. Caculate loss/accuracy
-            test_loss = loss_fn(test_pred, y_test)
+            # 5. Optimizer step
+            optimizer.step()
 
-            test_mape = mape_fn(y_test, test_pred)
-            test_rmse = rmse_fn(y_test, test_pred)
+            with torch.no_grad():
+                train_sums += error_sums(y, y_pred)
+            samples += len(y)
+            batch += 1
+            history["steps"] += 1
+
+            if report_every and history["steps"] % report_every == 0:
+                train_rmse, train_mape = summarize(train_sums)
+                elapsed = train_seconds + time.perf_counter() - epoch_start
+                print(f"Step: {history['steps']:06d} | Train MAPE: {train_mape:.2f}% | Train RMSE: {train_rmse:.5f} | {(samples - resumed_samples) / elapsed:,.0f} samples/s")
+                train_sums.zero_()
+
+            if checkpointer is not None and checkpointer.is_due(history["steps"]):
+                checkpointer.save(_train_state(model_01, optimizer, history, epoch, batch, samples, train_sums,
+                                               epochs_without_improvement))
+
+        epoch_seconds = time.perf_counter() - epoch_start
+        train_seconds += epoch_seconds
+        history["epochs"] = epoch + 1
+        if metrics.enabled:
+            metrics.observe("train_epoch_seconds", epoch_seconds)
+            metrics.inc("train_samples_total", samples - epoch_samples)
 
-        # Print out what's happening every 10 epochs
-        if epoch % 100 == 0:
-            print(f"Epoch: {epoch:03d} | Loss: {loss:.5f} | Train MAPE: {train_mape:.2f}% | Train RMSE: {train_rmse:.5f} | Test MAPE: {test_mape:.2f}% | Test RMSE: {test_rmse:.5f}")
+        ### Testing
+        test_rmse = None
+        if (epoch + 1) % eval_every == 0 or epoch + 1 == epochs:
+            eval_start = time.perf_counter()
+            with metrics.timer("train_eval_seconds"):
+                test_rmse, test_mape = evaluate(model_01, test_loader, device)
+            eval_seconds += time.perf_counter() - eval_start
+            history["eval_epochs"].append(epoch)
+            history["test_rmse"].append(test_rmse)
+            history["test_mape"].append(test_mape)
+            print(f"Epoch: {epoch:03d} | Test MAPE: {test_mape:.2f}% | Test RMSE: {test_rmse:.5f}")
+
+            if test_rmse < history["best_test_rmse"] - min_delta:
+                history["best_test_rmse"] = test_rmse
+                epochs_without_improvement = 0
+            else:
+                epochs_without_improvement += 1
+
+        if checkpointer is not None:
+            checkpointer.save(_train_state(model_01, optimizer, history, epoch + 1, 0, samples, train_sums,
+                                           epochs_without_improvement), val_rmse=test_rmse)
+
+        if patience is not None and epochs_without_improvement >= patience:
+            print(f"No improvement in {patience} evaluations, stopping early")
+            break
+
+    history["train_seconds"] = train_seconds
+    history["eval_seconds"] = eval_seconds
+    history["samples_per_s"] = (samples - resumed_samples) / train_seconds if train_seconds else 0.0
+    print(f"Trained on {samples:,} samples at {history['samples_per_s']:,.0f} samples/s "
+          f"({train_seconds:.1f}s training, {eval_seconds:.1f}s testing)")
+    return history
 
 def load_model_01():
+    """Fresh, trainable copy of model version 01.
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+    The checkpoint is read from disk once per process by the model registry;
+    later calls only copy the cached weights.
+    """
+    # Imported here because the registry itself builds FlashcardModels
+    from model_registry import get_registry
 
-    # To load in a saved state_dict we have to instantiate a new instance of our model class
-    base_model = FlashcardModel()
-    MODEL_PATH = Path("Flashcard_models")
+    return get_registry().new_model("01")
 
-    # 2. Create model save path
-    MODEL_NAME = "SmartCards_model_01.pth"
-    MODEL_SAVE_PATH = MODEL_PATH / MODEL_NAME
+def fine_tune_model(model, user_data, optimizer, epochs=5):
+    """Fine-tunes a full model copy on one user's data.
 
-    base_model.load_state_dict(torch.load(f=MODEL_SAVE_PATH, 
-                                        weights_only=True))
-    
-    return base_model
+    For many users at once see personalize.PersonalizationEngine, which only
+    trains a small per-user head.
+    """
+    device = next(model.parameters()).device
+    loss_fn = nn.MSELoss()
 
-def fine_tune_model(model, user_data, optimizer, epochs=5):
     model.train()
     for epoch in range(epochs):
         for batch in user_data:  # Assuming `user_data` is a DataLoader with user-specific data
@@ -120,28 +381,19 @@ def fine_tune_model(model, user_data, optimizer, epochs=5):
 
 
 
-def capture_review_data(card, difficulty_score, response_time, success):
-    # Update card attributes based on user review
-    card._review_count += 1
-    card._average_quality = ((card._average_quality * (card._review_count - 1)) + (5 - difficulty_score)) / card._review_count
-    card._last_response_time = response_time
-    card._success_rate = ((card._success_rate * (card._review_count - 1)) + success) / card._review_count
-    card._time_since_last_review = torch.tensor([0.0])  # Reset; update as needed in real scenarios
+def capture_review_data(card, feature_store=None, now=None):
+    """Training sample for a card whose stats were just updated by a review.
 
-    # Convert relevant features and label to tensors
-    features = torch.tensor([
-        card._time_since_last_review.item(),
-        card._interval,
-        card._review_count,
-        card._average_quality,
-        card._ease,
-        card._last_response_time,
-        card._success_rate,
-        card._char_count
-    ], dtype=torch.float32)
+    Features come from the shared definition in features.py. With a
+    FeatureStore the card's row is refreshed in place and copied out, so
+    later reviews of the card don't change samples already captured.
+    """
+    if feature_store is not None:
+        row = feature_store.update(card)
+        features = feature_store.tensor(slice(row, row + 1), now)[0].clone()
+    else:
+        features = torch.tensor(card_features(card, now), dtype=torch.float32)
 
-    label = torch.tensor(card._interval, dtype=torch.float32)
+    label = torch.tensor(float(card._stats._interval), dtype=torch.float32)
 
     return {'features': features, 'label': label}
-
-
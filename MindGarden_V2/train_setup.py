@@ -1,4 +1,11 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 import random
+
+import numpy as np
+
+from features import NUM_FEATURES, feature_values
+
 random.seed(57)
 
 def sm2(ease_factor, repetitions, interval, difficulty_score):
@@ -79,4 +86,92 @@ def generate_synthetic_data(num_cards=1000):
     
     return data
 
-print(generate_synthetic_data())
\ No newline at end of file
+def sm2_arrays(ease_factor, repetitions, interval, difficulty_score):
+    """sm2() applied element-wise to NumPy arrays."""
+    # Easy scores raise the ease factor and hard ones lower it, by 0.1 per step from 3
+    ease_factor = np.maximum(1.3, ease_factor + 0.1 * (3 - difficulty_score))
+
+    interval = np.where(repetitions == 0, 1,
+                        np.where(repetitions == 1, 6, np.rint(interval * ease_factor)))
+    return interval, ease_factor
+
+def generate_synthetic_arrays(num_cards, sessions=5, rng=None):
+    """Vectorized generate_synthetic_data() for a block of cards.
+
+    Simulates every session of all num_cards cards at once with the same
+    distributions as generate_synthetic_data(). Returns float32 features of
+    shape (num_cards * sessions, NUM_FEATURES) and labels of shape
+    (num_cards * sessions,), card by card in session order like the list
+    version.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+
+    ease_factor = np.full(num_cards, 1.1)
+    interval = np.zeros(num_cards)
+    time_since_last_review = np.zeros(num_cards)
+    difficulty_sum = np.zeros(num_cards)
+    success_count = np.zeros(num_cards)
+    char_count = rng.integers(1, 101, size=num_cards)
+
+    features = np.empty((num_cards, sessions, NUM_FEATURES), dtype=np.float32)
+    for review_session in range(sessions):
+        difficulty_score = rng.integers(1, 6, size=num_cards)
+        interval, ease_factor = sm2_arrays(ease_factor, review_session, interval, difficulty_score)
+
+        review_count = review_session + 1
+        time_since_last_review += interval
+        last_response_time = rng.uniform(0.5, 5.0, size=num_cards)
+        difficulty_sum += difficulty_score
+        success_count += difficulty_score <= 3
+
+        columns = feature_values(time_since_last_review, interval, review_count, difficulty_sum,
+                                 ease_factor, last_response_time, success_count, char_count)
+        for i, column in enumerate(columns):
+            features[:, review_session, i] = np.round(column, 3)
+
+    features = features.reshape(-1, NUM_FEATURES)
+    return features, features[:, 1].copy()
+
+def _write_chunk(features_path, labels_path, start_card, num_cards, sessions, seed, chunk_index):
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk_index,)))
+    features, labels = generate_synthetic_arrays(num_cards, sessions, rng)
+
+    rows = slice(start_card * sessions, (start_card + num_cards) * sessions)
+    features_out = np.load(features_path, mmap_mode="r+")
+    labels_out = np.load(labels_path, mmap_mode="r+")
+    features_out[rows] = features
+    labels_out[rows] = labels
+    features_out.flush()
+    labels_out.flush()
+    return num_cards
+
+def write_synthetic_dataset(directory, num_cards, sessions=5, chunk_cards=100_000, workers=None, seed=57):
+    """Streams a synthetic dataset to features.npy and labels.npy in directory.
+
+    Cards are generated in chunks of chunk_cards across a process pool. Each
+    chunk draws from its own seed derived from (seed, chunk index), so the
+    files are identical whatever the number of workers. Only one chunk per
+    worker is ever held in memory. Returns the two file paths.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    features_path = directory / "features.npy"
+    labels_path = directory / "labels.npy"
+
+    rows = num_cards * sessions
+    np.lib.format.open_memmap(features_path, mode="w+", dtype=np.float32, shape=(rows, NUM_FEATURES)).flush()
+    np.lib.format.open_memmap(labels_path, mode="w+", dtype=np.float32, shape=(rows,)).flush()
+
+    chunks = [(start, min(chunk_cards, num_cards - start), i)
+              for i, start in enumerate(range(0, num_cards, chunk_cards))]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = [pool.submit(_write_chunk, features_path, labels_path, start, size, sessions, seed, i)
+                for start, size, i in chunks]
+        for job in jobs:
+            job.result()
+
+    return features_path, labels_path
+
+
+if __name__ == "__main__":
+    print(generate_synthetic_data())
\ No newline at end of file